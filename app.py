@@ -1,23 +1,119 @@
+import io
+import json
 import os
+import cProfile
+import pstats
+import random
+import threading
+import time
 import uuid
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify
+import zipfile
+import zlib
+
+# Début du chargement de l'application (mesure du démarrage à froid, voir app_startup_seconds)
+_import_start = time.perf_counter()
+
+from flask import (Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, abort,
+                   g, has_request_context, Request, Response, stream_with_context)
 from werkzeug.utils import secure_filename
-from ocr_engine import OCREngine
+from document_pages import is_multipage
 from data_extractor import DataExtractor
-from output_manager import OutputManager
-import pandas as pd
+from output_manager import OutputManager, WRITERS
+from batch_processor import BatchProcessor
+from job_queue import JobQueue
+from engine_pool import EnginePool, PoolBusy
+from ocr_cache import OCRCache
+from result_store import ResultStore
+from duplicate_index import BKTree, DuplicateIndex, content_digest, image_hash
+from metrics import metrics
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
+DATA_FOLDER = 'data'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tif', 'tiff', 'pdf'}
+# Cœurs partagés entre le traitement par lot (pool de processus) et les routes synchrones (pool de
+# moteurs) : par défaut, la moitié chacun, pour ne pas dépasser les cœurs quand les deux sont chargés
+OCR_CPU_BUDGET = int(os.environ.get('OCR_CPU_BUDGET', os.cpu_count() or 1))
+# Nombre de processus pour le traitement par lot (par défaut : la moitié du budget de cœurs)
+BATCH_WORKERS = int(os.environ.get('OCR_BATCH_WORKERS', max(1, OCR_CPU_BUDGET // 2)))
+# Travaux asynchrones : base SQLite et nombre de travaux traités simultanément
+JOBS_DB = os.path.join(DATA_FOLDER, 'jobs.db')
+JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', BATCH_WORKERS))
+# Backend Tesseract : auto (tesserocr si installé), tesserocr ou pytesseract
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+# Profil de prétraitement : fast, balanced ou quality
+OCR_PROFILE = os.environ.get('OCR_PREPROCESS_PROFILE', 'balanced')
+# Résultats d'extraction indexés (page de résultat, API de recherche, exports)
+RESULTS_DB = os.path.join(DATA_FOLDER, 'results.db')
+# Cache des résultats OCR (taille maximale en Mo, 0 pour désactiver)
+OCR_CACHE_DB = os.path.join(DATA_FOLDER, 'ocr_cache.db')
+OCR_CACHE_MAX_MB = int(os.environ.get('OCR_CACHE_MAX_MB', 512))
+# Profilage cProfile échantillonné : proportion des requêtes profilées (0 pour désactiver)
+# et durée (ms) à partir de laquelle le profil est conservé dans data/profiles
+CPROFILE_SAMPLE_RATE = float(os.environ.get('OCR_CPROFILE_SAMPLE_RATE', 0))
+CPROFILE_SLOW_MS = float(os.environ.get('OCR_CPROFILE_SLOW_MS', 2000))
+PROFILES_FOLDER = os.path.join(DATA_FOLDER, 'profiles')
+# Réception des fichiers : 'memory' (décodés depuis la requête, sans écriture sur disque) ou 'disk'
+INGEST_MODE = os.environ.get('OCR_INGEST_MODE', 'memory')
+# En mode memory : proportion des originaux conservés dans uploads/ (0 = aucun, 1 = tous)
+KEEP_UPLOADS_RATE = float(os.environ.get('OCR_KEEP_UPLOADS', 0))
+# Images prétraitées de débogage : proportion des documents enregistrés dans data/debug
+DEBUG_SAMPLE_RATE = float(os.environ.get('OCR_DEBUG_SAMPLE_RATE', 0))
+DEBUG_FOLDER = os.path.join(DATA_FOLDER, 'debug')
+# Mémoire de travail par document et par processus (Mo) : au-delà, décodage réduit ou traitement par bandes
+OCR_MEMORY_BUDGET_MB = int(os.environ.get('OCR_MEMORY_BUDGET_MB', 256))
+# OCR limité aux blocs de texte détectés (1 pour activer) et nombre de blocs reconnus en parallèle
+OCR_TEXT_REGIONS = os.environ.get('OCR_TEXT_REGIONS', '0') == '1'
+OCR_REGION_WORKERS = int(os.environ.get('OCR_REGION_WORKERS', min(4, os.cpu_count() or 1)))
+# Cascade de prétraitement : profils essayés dans l'ordre (ex. fast,balanced,quality), vide pour désactiver
+OCR_CASCADE = tuple(name for name in os.environ.get('OCR_CASCADE', '').split(',') if name) or None
+# Pool de moteurs OCR des routes synchrones : moteurs préinitialisés (traités en parallèle),
+# requêtes en attente au-delà desquelles la réponse est 429, attente maximale (s) avant une 503
+# (par défaut : les cœurs du budget laissés par le traitement par lot)
+ENGINE_POOL_CPUS = max(1, OCR_CPU_BUDGET - BATCH_WORKERS)
+OCR_ENGINE_POOL_SIZE = int(os.environ.get('OCR_ENGINE_POOL_SIZE', ENGINE_POOL_CPUS))
+OCR_ENGINE_QUEUE = int(os.environ.get('OCR_ENGINE_QUEUE', 2 * OCR_ENGINE_POOL_SIZE))
+OCR_ENGINE_WAIT_TIMEOUT = float(os.environ.get('OCR_ENGINE_WAIT_TIMEOUT', 30))
+# Traitement par lot : documents en cours ou en file au-delà desquels un nouveau lot est refusé (429)
+BATCH_MAX_PENDING = int(os.environ.get('OCR_BATCH_MAX_PENDING', 64 * BATCH_WORKERS))
+# API de traitement en flux (/api/process_batch) : taille maximale de la requête (Mo),
+# nombre de fichiers d'une archive ZIP et taille décompressée maximale d'un fichier de l'archive (Mo)
+BATCH_MAX_UPLOAD_MB = int(os.environ.get('OCR_BATCH_MAX_UPLOAD_MB', 256))
+ZIP_MAX_FILES = int(os.environ.get('OCR_ZIP_MAX_FILES', 5000))
+ZIP_MAX_MEMBER_MB = int(os.environ.get('OCR_ZIP_MAX_MEMBER_MB', 64))
+# Quasi-doublons (même document photographié ou rescanné) : 'flag' (OCR effectué, document marqué
+# comme doublon), 'reuse' (extraction du document d'origine réutilisée sans OCR, seulement si le
+# fichier est identique octet pour octet ; sinon simplement marqué) ou 'off'
+DUPLICATES_DB = os.path.join(DATA_FOLDER, 'duplicates.db')
+DUPLICATE_MODE = os.environ.get('OCR_DUPLICATE_MODE', 'flag')
+DUPLICATE_MAX_DISTANCE = int(os.environ.get('OCR_DUPLICATE_MAX_DISTANCE', 6))
+# Processus de travail du traitement par lot forkés depuis un serveur où OpenCV et Tesseract sont
+# déjà chargés (module preload), et démarrés dès le lancement plutôt qu'au premier lot, comme les
+# moteurs du pool des routes synchrones
+OCR_PRELOAD = os.environ.get('OCR_PRELOAD', '0') == '1'
 
 # Créer les dossiers nécessaires
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(DATA_FOLDER, exist_ok=True)
+
+class UploadRequest(Request):
+    """Requête dont la taille maximale est plus grande pour l'API de traitement en flux (lots, archives ZIP)"""
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'api_process_batch':
+            return BATCH_MAX_UPLOAD_MB * 1024 * 1024
+        return super().max_content_length
+
+class MemoryUploadRequest(UploadRequest):
+    """Requête dont les fichiers uploadés restent en mémoire (bornés par MAX_CONTENT_LENGTH)"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 # Initialiser l'application Flask
 app = Flask(__name__)
+app.request_class = MemoryUploadRequest if INGEST_MODE == 'memory' else UploadRequest
 app.secret_key = "ocr_extraction_super_secret_key"
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max
@@ -25,10 +121,258 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max
 # Gestionnaire de sortie
 output_manager = OutputManager(OUTPUT_FOLDER)
 
+# Stockage des résultats d'extraction
+result_store = ResultStore(RESULTS_DB)
+
+# Index des empreintes perceptuelles des documents traités (quasi-doublons)
+duplicate_index = DuplicateIndex(DUPLICATES_DB, DUPLICATE_MAX_DISTANCE) if DUPLICATE_MODE != 'off' else None
+
+# Cache OCR partagé par toutes les routes et les processus de travail
+ocr_cache = OCRCache(OCR_CACHE_DB, OCR_CACHE_MAX_MB * 1024 * 1024) if OCR_CACHE_MAX_MB > 0 else None
+
+# Pool de processus pour le traitement par lot
+batch_processor = BatchProcessor(BATCH_WORKERS, cache=ocr_cache, backend=OCR_BACKEND,
+                                 profile=OCR_PROFILE, memory_budget_mb=OCR_MEMORY_BUDGET_MB,
+                                 text_regions=OCR_TEXT_REGIONS, cascade=OCR_CASCADE,
+                                 max_pending=BATCH_MAX_PENDING, preload=OCR_PRELOAD)
+
+def process_job(filepath, doc_type):
+    """Traite un travail asynchrone sur le pool de processus (sauf quasi-doublon réutilisé)"""
+    fingerprint, match = find_duplicate(filepath, None, filepath)
+    data = reuse_duplicate(match, doc_type, fingerprint)
+    if data is not None:
+        data['image_src'] = filepath
+        outcome = {'status': 'success', 'data': data}
+    else:
+        outcome = batch_processor.process_one(filepath, doc_type)
+    if outcome['status'] == 'success':
+        if match is not None:
+            mark_duplicate(outcome['data'], match, data is not None)
+        save_result(outcome['data'], fingerprint, match)
+    return outcome
+
+# File de travaux asynchrones (API submit/poll)
+job_queue = JobQueue(JOBS_DB, process_job, JOB_WORKERS)
+
+# Un seul profileur actif à la fois (cProfile n'est pas réentrant)
+_profiler_lock = threading.Lock()
+
+@app.before_request
+def start_request_timer():
+    """Démarre la mesure de la requête et, par échantillonnage, le profilage cProfile"""
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    # Profils des threads des moteurs OCR utilisés par la requête (voir run_on_engine)
+    g.engine_profiles = None
+    if CPROFILE_SAMPLE_RATE > 0 and random.random() < CPROFILE_SAMPLE_RATE and _profiler_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.engine_profiles = []
+        g.profiler.enable()
+
+def finish_profile(profiler, engine_profiles, endpoint, elapsed):
+    """Arrête le profileur d'une requête et conserve son profil, avec ceux des moteurs, si elle est lente"""
+    profiler.disable()
+    try:
+        if elapsed * 1000 >= CPROFILE_SLOW_MS:
+            stats = pstats.Stats(profiler)
+            for engine_profile in engine_profiles:
+                stats.add(engine_profile)
+            os.makedirs(PROFILES_FOLDER, exist_ok=True)
+            filename = f'{time.strftime("%Y%m%d_%H%M%S")}_{endpoint}_{int(elapsed * 1000)}ms.prof'
+            stats.dump_stats(os.path.join(PROFILES_FOLDER, filename))
+    finally:
+        _profiler_lock.release()
+
+@app.after_request
+def record_request_metrics(response):
+    """Enregistre la durée et le statut de la requête ; conserve le profil des requêtes lentes
+
+    Pour une réponse en flux (/api/process_batch), la durée et le profil sont pris à la fin de
+    l'envoi du corps, pas à celle des en-têtes.
+    """
+    start = g.get('request_start')
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    metrics.inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+
+    profiler = g.get('profiler')
+    engine_profiles = g.get('engine_profiles')
+    g.profiler = None
+
+    def finish():
+        elapsed = time.perf_counter() - start
+        metrics.observe('http_request_seconds', elapsed, endpoint=endpoint)
+        if profiler is not None:
+            finish_profile(profiler, engine_profiles, endpoint, elapsed)
+
+    if response.is_streamed:
+        response.call_on_close(finish)
+    else:
+        finish()
+    return response
+
+@app.teardown_request
+def release_profiler(exc):
+    """Libère le profileur si la requête a échoué avant after_request"""
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.disable()
+        g.profiler = None
+        _profiler_lock.release()
+
+def run_on_engine(func, *args):
+    """engine_pool.run, en profilant aussi le thread du moteur pour les requêtes échantillonnées"""
+    profiles = g.get('engine_profiles') if has_request_context() else None
+    return engine_pool.run(func, *args, profiles=profiles)
+
 def allowed_file(filename):
     """Vérifie si l'extension du fichier est autorisée"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def receive_upload(file):
+    """Reçoit un fichier uploadé et renvoie (nom unique, octets, chemin)
+
+    En mode memory, les octets sont passés directement au moteur OCR et l'original n'est écrit
+    dans uploads/ que par échantillonnage (chemin None sinon). En mode disk, le fichier est
+    enregistré et relu par le moteur (octets None).
+    """
+    filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if INGEST_MODE != 'memory':
+        file.save(filepath)
+        return filename, None, filepath
+
+    content = file.read()
+    if KEEP_UPLOADS_RATE > 0 and random.random() < KEEP_UPLOADS_RATE:
+        with open(filepath, 'wb') as f:
+            f.write(content)
+    else:
+        filepath = None
+    return filename, content, filepath
+
+def upload_fingerprint(filename, content, filepath):
+    """Empreintes d'un upload : (perceptuelle, exacte des octets), ou None
+
+    Les documents multi-pages et les fichiers illisibles ne sont pas indexés. Le décodage se fait
+    dans le thread appelant : à appeler depuis un moteur du pool (voir find_duplicate).
+    """
+    if duplicate_index is None or is_multipage(filename):
+        return None
+    if content is None:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+    value = image_hash(content)
+    if value is None:
+        return None
+    return value, content_digest(content)
+
+def fingerprint_on_engine(ocr, filename, content, filepath):
+    """upload_fingerprint exécuté sur un moteur du pool (le moteur lui-même ne sert pas)"""
+    return upload_fingerprint(filename, content, filepath)
+
+def lookup_duplicate(fingerprint):
+    """Document déjà traité le plus proche d'une empreinte : (doc_id, distance) ou None"""
+    if fingerprint is None:
+        return None
+    return duplicate_index.find(fingerprint[0])
+
+def find_duplicate(filename, content, filepath):
+    """Empreintes d'un upload et document déjà traité le plus proche : (empreintes, (doc_id, distance) ou None)
+
+    L'image est décodée sur un moteur du pool, dans la limite de concurrence des routes OCR ;
+    pool saturé ou moteur impossible à créer : le document est traité sans détection des doublons.
+    """
+    if duplicate_index is None or is_multipage(filename):
+        return None, None
+    try:
+        fingerprint = run_on_engine(fingerprint_on_engine, filename, content, filepath)
+    except Exception:
+        return None, None
+    return fingerprint, lookup_duplicate(fingerprint)
+
+def reuse_duplicate(match, doc_type, fingerprint):
+    """Données d'extraction du document d'origine d'un doublon, si elles peuvent être réutilisées
+
+    Des empreintes perceptuelles proches ne garantissent pas le même contenu (deux tickets d'un
+    même magasin aux montants différents) : seul un fichier identique octet pour octet est réutilisé.
+    """
+    if match is None or DUPLICATE_MODE != 'reuse' or fingerprint is None:
+        return None
+    if not duplicate_index.same_content(match[0], fingerprint[1]):
+        return None
+    original = result_store.get(match[0])
+    # Type demandé différent de celui du document d'origine : nouvelle extraction
+    if original is None or (doc_type != 'auto' and original.get('type_document') != doc_type):
+        return None
+    data = dict(original)
+    data.pop('doublon_de', None)
+    data.pop('distance_doublon', None)
+    return data
+
+def mark_duplicate(data, match, reused):
+    """Indique dans les données le document d'origine d'un doublon"""
+    data['doublon_de'] = match[0]
+    data['distance_doublon'] = match[1]
+    metrics.inc('ocr_duplicates_total', outcome='reused' if reused else 'flagged')
+
+def save_result(data, fingerprint, match):
+    """Enregistre un résultat ; un document qui n'est pas un doublon rejoint l'index des empreintes"""
+    doc_id = result_store.save(data)
+    if fingerprint is not None and match is None:
+        duplicate_index.add(fingerprint[0], doc_id, fingerprint[1])
+    return doc_id
+
+def create_engine():
+    """Moteur OCR des routes synchrones"""
+    # Import différé : OpenCV et Tesseract sont chargés par les threads du pool, pas à l'import de l'application
+    from ocr_engine import OCREngine
+    return OCREngine(cache=ocr_cache, backend=OCR_BACKEND, profile=OCR_PROFILE,
+                     debug_dir=DEBUG_FOLDER, debug_sample_rate=DEBUG_SAMPLE_RATE,
+                     memory_budget_mb=OCR_MEMORY_BUDGET_MB, text_regions=OCR_TEXT_REGIONS,
+                     region_workers=OCR_REGION_WORKERS, cascade=OCR_CASCADE)
+
+# Moteurs OCR des routes synchrones ; concurrence et file d'attente bornées. Chargés au démarrage
+# seulement avec OCR_PRELOAD, sinon à la première requête OCR : l'import de l'application ne charge
+# ni OpenCV, ni NumPy, ni pytesseract (qui importe pandas s'il est installé)
+engine_pool = EnginePool(create_engine, OCR_ENGINE_POOL_SIZE, OCR_ENGINE_QUEUE, OCR_ENGINE_WAIT_TIMEOUT,
+                         warm=OCR_PRELOAD, cpus=ENGINE_POOL_CPUS)
+
+def recognize_upload(ocr, filename, content, filepath, extractor):
+    """OCR d'un upload sur un moteur du pool : texte, détail des pages (PDF, TIFF) et rapports du moteur"""
+    document = None
+    if is_multipage(filename):
+        document = ocr.extract_document(filepath or filename, content)
+        text = document['text']
+    else:
+        text = ocr.extract_text(filepath or filename, content, extractor)
+    return {'text': text, 'document': document,
+            'cascade': ocr.last_cascade_report, 'memory': ocr.last_memory_report}
+
+def process_upload(ocr, filename, content, filepath, doc_type, extractor):
+    """Sur un moteur du pool : détection des quasi-doublons puis OCR, sauf extraction réutilisée
+
+    Renvoie les empreintes, le doublon trouvé, les données réutilisées (ou None) et le résultat
+    de recognize_upload (ou None).
+    """
+    fingerprint = upload_fingerprint(filename, content, filepath)
+    match = lookup_duplicate(fingerprint)
+    data = reuse_duplicate(match, doc_type, fingerprint)
+    recognized = None
+    if data is None:
+        recognized = recognize_upload(ocr, filename, content, filepath, extractor)
+    return {'fingerprint': fingerprint, 'match': match, 'reused': data, 'recognized': recognized}
+
+@app.errorhandler(PoolBusy)
+def pool_busy(e):
+    """Capacité saturée : réponse immédiate (429 ou 503) avec le délai suggéré avant un nouvel essai"""
+    headers = {'Retry-After': str(e.retry_after)}
+    if request.path.startswith('/api/'):
+        return jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after}), e.status, headers
+    flash(str(e))
+    template = 'batch.html' if request.endpoint == 'batch_process' else 'index.html'
+    return render_template(template), e.status, headers
+
 @app.route('/')
 def index():
     """Page d'accueil"""
@@ -48,43 +392,45 @@ def upload_file():
         return redirect(request.url)
     
     if file and allowed_file(file.filename):
-        # Générer un nom de fichier unique
-        filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Nom de fichier unique ; le contenu reste en mémoire sauf configuration contraire
+        filename, content, filepath = receive_upload(file)
         
         # Récupérer le type de document
         doc_type = request.form.get('document_type', 'ticket')
         
         # Traiter l'image
         try:
-            # Initialiser l'OCR et l'extracteur
-            ocr = OCREngine()
             extractor = DataExtractor(doc_type)
             
-            # Extraire le texte
-            text = ocr.extract_text(filepath)
+            # Sur un moteur du pool : quasi-doublon d'un document déjà traité (extraction réutilisée
+            # sans OCR pour un fichier identique), sinon extraction du texte (avec une cascade, les
+            # champs clés du type de document sont vérifiés) ; pool saturé : PoolBusy, réponse 429 ou 503
+            processed = run_on_engine(process_upload, filename, content, filepath, doc_type, extractor)
+            fingerprint, match, data = processed['fingerprint'], processed['match'], processed['reused']
+            reused = data is not None
+            
+            if not reused:
+                # Extraire les données structurées
+                data = extractor.extract_data(processed['recognized']['text'])
+                metrics.inc('ocr_documents_total', status='success')
             
-            # Extraire les données structurées
-            data = extractor.extract_data(text)
+            if match is not None:
+                mark_duplicate(data, match, reused)
             
             # Ajouter le chemin de l'image comme référence
             data['image_src'] = filepath
             
-            # Sauvegarder les résultats
+            # Enregistrer les résultats (les exports sont générés à la demande)
+            doc_id = save_result(data, fingerprint, match)
             output_format = request.form.get('output_format', 'json')
             
-            if output_format == 'csv':
-                output_path = output_manager.save_to_csv([data])
-            elif output_format == 'excel':
-                output_path = output_manager.save_to_excel([data])
-            else:
-                output_path = output_manager.save_to_json([data])
-            
             # Rediriger vers la page de résultats
-            return redirect(url_for('result', filepath=filepath, output=output_path))
+            return redirect(url_for('result', doc_id=doc_id, format=output_format))
             
+        except PoolBusy:
+            raise
         except Exception as e:
+            metrics.inc('ocr_documents_total', status='error')
             flash(f'Erreur lors du traitement du fichier: {str(e)}')
             return redirect(url_for('index'))
     
@@ -94,28 +440,57 @@ def upload_file():
 @app.route('/result')
 def result():
     """Affiche les résultats de l'extraction"""
-    image_path = request.args.get('filepath', '')
-    output_path = request.args.get('output', '')
-    
-    # Lire les données extraites
-    data = {}
-    if output_path.endswith('.json'):
-        import json
-        with open(output_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)[0]  # On prend le premier élément car c'est une liste
-    elif output_path.endswith('.csv'):
-        df = pd.read_csv(output_path)
-        data = df.iloc[0].to_dict()
-    elif output_path.endswith('.xlsx'):
-        df = pd.read_excel(output_path)
-        data = df.iloc[0].to_dict()
+    doc_id = request.args.get('doc_id')
+    
+    if doc_id:
+        data = result_store.get(doc_id)
+        if data is None:
+            flash('Résultat introuvable')
+            return redirect(url_for('index'))
+        image_path = data.get('image_src') or ''
+    else:
+        # Anciens liens : données relues depuis le fichier de sortie
+        image_path = request.args.get('filepath', '')
+        output_path = request.args.get('output', '')
+        
+        data = {}
+        if output_path.endswith('.json'):
+            with open(output_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)[0]  # On prend le premier élément car c'est une liste
+        elif output_path.endswith('.csv'):
+            import pandas as pd
+            df = pd.read_csv(output_path)
+            data = df.iloc[0].to_dict()
+        elif output_path.endswith('.xlsx'):
+            import pandas as pd
+            df = pd.read_excel(output_path)
+            data = df.iloc[0].to_dict()
     
     # Nom du fichier pour l'affichage
     image_filename = os.path.basename(image_path)
     
     return render_template('results.html', 
                            image_path=image_filename,
-                           data=data)
+                           data=data,
+                           doc_id=doc_id,
+                           output_format=request.args.get('format', 'json'))
+
+@app.route('/result/<doc_id>/export/<output_format>')
+def export_result(doc_id, output_format):
+    """Génère à la demande l'export d'un résultat (csv, excel, json, jsonl, parquet, columnar)"""
+    if output_format not in WRITERS:
+        abort(400)
+    
+    data = result_store.get(doc_id)
+    if data is None:
+        abort(404)
+    
+    filename = f'result_{doc_id}{WRITERS[output_format].extension}'
+    if not os.path.exists(os.path.join(OUTPUT_FOLDER, filename)):
+        with output_manager.open_writer(output_format, filename) as writer:
+            writer.write(data)
+    
+    return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
@@ -129,9 +504,13 @@ def output_file(filename):
 
 @app.route('/files')
 def list_files():
-    """Liste tous les fichiers de sortie disponibles"""
-    files = output_manager.get_all_outputs()
-    return render_template('files.html', files=files)
+    """Liste paginée des fichiers de sortie (paramètres page, per_page, type)"""
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 50, type=int), 500))
+    file_type = request.args.get('type') or None
+    
+    listing = output_manager.list_outputs(page=page, per_page=per_page, file_type=file_type)
+    return render_template('files.html', files=listing['files'], listing=listing, file_type=file_type)
 
 @app.route('/batch', methods=['GET', 'POST'])
 def batch_process():
@@ -151,51 +530,110 @@ def batch_process():
         doc_type = request.form.get('document_type', 'ticket')
         output_format = request.form.get('output_format', 'csv')
         
-        # Traiter tous les fichiers
-        all_data = []
-        processed_files = []
+        # Pool de traitement déjà chargé : refus immédiat (429) plutôt qu'une file sans limite
+        batch_processor.check_capacity(len(files))
         
+        # Recevoir tous les fichiers avant de les répartir sur le pool
+        uploaded = []
         for file in files:
             if file and allowed_file(file.filename):
-                filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filename, content, filepath = receive_upload(file)
+                uploaded.append((file.filename, filepath or filename, content, filepath))
+        
+        # Fichier de sortie ouvert une seule fois : chaque document y est ajouté dès qu'il est terminé
+        if output_format not in WRITERS:
+            output_format = 'json'
+        writer = output_manager.open_writer(
+            output_format, f'batch_{uuid.uuid4()}{WRITERS[output_format].extension}'
+        )
+        
+        processed_files = []
+        
+        # Quasi-doublons repérés avant l'OCR : documents déjà traités (index) ou fichiers précédents du lot
+        entries = []
+        batch_hashes = BKTree()
+        for position, (_, name, content, filepath) in enumerate(uploaded):
+            fingerprint, match = find_duplicate(name, content, filepath)
+            entry = {'fingerprint': fingerprint, 'match': match, 'earlier': None,
+                     'data': reuse_duplicate(match, doc_type, fingerprint)}
+            identical = False
+            if fingerprint is not None and match is None:
+                earlier = batch_hashes.search(fingerprint[0], DUPLICATE_MAX_DISTANCE)
+                if earlier:
+                    entry['earlier'] = earlier[0]
+                    identical = entries[earlier[0][1]]['fingerprint'][1] == fingerprint[1]
+                else:
+                    batch_hashes.add(fingerprint[0], position)
+            # En mode reuse, les fichiers identiques ne passent pas par le pool : l'extraction d'origine est recopiée
+            entry['skip'] = DUPLICATE_MODE == 'reuse' and (entry['data'] is not None or identical)
+            entries.append(entry)
+        
+        # OCR et extraction en parallèle (résultats dans l'ordre d'upload)
+        dispatched = [item for item, entry in zip(uploaded, entries) if not entry['skip']]
+        results = batch_processor.iter_process([name for _, name, _, _ in dispatched], doc_type,
+                                               [content for _, _, content, _ in dispatched])
+        
+        # Documents du lot enregistrés (hors doublons) : position -> (doc_id, données)
+        saved = {}
+        
+        with writer:
+            for position, ((original_name, _, _, filepath), entry) in enumerate(zip(uploaded, entries)):
+                match = entry['match']
+                origin = match[0] if match else None
+                if entry['earlier'] is not None:
+                    distance, earlier_position = entry['earlier']
+                    origin = uploaded[earlier_position][0]
+                    if earlier_position in saved:
+                        match = (saved[earlier_position][0], distance)
                 
-                try:
-                    # OCR et extraction
-                    ocr = OCREngine()
-                    extractor = DataExtractor(doc_type)
-                    
-                    text = ocr.extract_text(filepath)
-                    data = extractor.extract_data(text)
-                    data['image_src'] = filepath
-                    
-                    all_data.append(data)
+                if not entry['skip']:
+                    outcome = next(results)
+                elif entry['data'] is not None:
+                    outcome = {'status': 'success', 'data': entry['data']}
+                elif match is not None:
+                    outcome = {'status': 'success', 'data': dict(saved[earlier_position][1])}
+                else:
+                    outcome = {'status': 'error', 'message': f"Doublon de {origin}, dont le traitement a échoué"}
+                
+                if outcome['status'] != 'success':
+                    processed_files.append({
+                        'filename': original_name,
+                        'status': 'error',
+                        'message': outcome['message']
+                    })
+                    continue
+                
+                data = outcome['data']
+                data['image_src'] = filepath
+                if match is not None:
+                    mark_duplicate(data, match, entry['skip'])
+                doc_id = save_result(data, entry['fingerprint'], match)
+                
+                if match is None:
+                    saved[position] = (doc_id, data)
+                    writer.write(data)
                     processed_files.append({
-                        'filename': file.filename,
+                        'filename': original_name,
                         'status': 'success'
                     })
-                except Exception as e:
+                else:
+                    # Doublon : enregistré avec sa référence, mais pas de ligne en double dans le fichier de sortie
                     processed_files.append({
-                        'filename': file.filename,
-                        'status': 'error',
-                        'message': str(e)
+                        'filename': original_name,
+                        'status': 'duplicate',
+                        'message': f'Doublon de {origin}'
                     })
-        
-        # Sauvegarder les résultats si des fichiers ont été traités avec succès
-        if all_data:
-            timestamp = uuid.uuid4()
             
-            if output_format == 'csv':
-                output_path = output_manager.save_to_csv(all_data, f'batch_{timestamp}.csv')
-            elif output_format == 'excel':
-                output_path = output_manager.save_to_excel(all_data, f'batch_{timestamp}.xlsx')
-            else:
-                output_path = output_manager.save_to_json(all_data, f'batch_{timestamp}.json')
-            
-            flash(f'{len(all_data)} fichiers traités avec succès. Résultats enregistrés dans {os.path.basename(output_path)}')
+            # Aucun fichier traité avec succès : pas de fichier de sortie
+            if writer.count == 0:
+                writer.abort()
         
-        return render_template('batch_results.html', files=processed_files, output_path=output_path if all_data else None)
+        output_path = None
+        if writer.count:
+            output_path = writer.filepath
+            flash(f'{writer.count} fichiers traités avec succès. Résultats enregistrés dans {os.path.basename(output_path)}')
+        
+        return render_template('batch_results.html', files=processed_files, output_path=output_path)
     
     return render_template('batch.html')
 
@@ -211,26 +649,57 @@ def api_process():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        filename, content, filepath = receive_upload(file)
         
         doc_type = request.form.get('document_type', 'ticket')
         
         try:
-            ocr = OCREngine()
             extractor = DataExtractor(doc_type)
             
-            text = ocr.extract_text(filepath)
-            data = extractor.extract_data(text)
+            # Sur un moteur du pool : quasi-doublon d'un document déjà traité (extraction réutilisée
+            # sans OCR pour un fichier identique), sinon OCR ; documents multi-pages (PDF, TIFF) :
+            # texte fusionné et détail par page
+            processed = run_on_engine(process_upload, filename, content, filepath, doc_type, extractor)
+            fingerprint, match, data = processed['fingerprint'], processed['match'], processed['reused']
+            recognized = processed['recognized']
+            
+            if data is not None:
+                text = data.get('texte_brut', '')
+            else:
+                text = recognized['text']
+                data = extractor.extract_data(text)
+                metrics.inc('ocr_documents_total', status='success')
+            
+            if match is not None:
+                mark_duplicate(data, match, recognized is None)
             data['image_src'] = filepath
+            doc_id = save_result(data, fingerprint, match)
             
-            return jsonify({
+            response = {
                 'success': True,
+                'doc_id': doc_id,
                 'data': data,
                 'text': text
-            })
+            }
+            if match is not None:
+                # Document d'origine, distance de Hamming des empreintes et réutilisation de son extraction
+                response['duplicate'] = {'doc_id': match[0], 'distance': match[1], 'reused': recognized is None}
+            if recognized is not None and recognized['document'] is not None:
+                # Source de chaque page : couche texte PDF ou OCR
+                response['pages'] = recognized['document']['pages']
+                response['sources'] = recognized['document']['sources']
+            if recognized is not None and recognized['cascade'] is not None:
+                # Profils essayés : confiance, champs clés manquants et temps de chaque niveau
+                response['cascade'] = recognized['cascade']
+            if recognized is not None and recognized['memory'] is not None:
+                # Réduction au décodage, traitement par bandes et pic de mémoire (du processus web)
+                response['memory'] = recognized['memory']
+            
+            return jsonify(response)
+        except PoolBusy:
+            raise
         except Exception as e:
+            metrics.inc('ocr_documents_total', status='error')
             return jsonify({
                 'success': False,
                 'error': str(e)
@@ -238,5 +707,222 @@ def api_process():
     
     return jsonify({'error': 'File type not allowed'}), 400
 
+def zip_members(archive):
+    """Documents d'une archive ZIP : formats acceptés, hors dossiers et fichiers cachés"""
+    return [info for info in archive.infolist()
+            if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+            and allowed_file(os.path.basename(info.filename))]
+
+def iter_zip_documents(archive, members):
+    """Génère (nom, octets, erreur) des documents d'une archive ZIP, lus un par un au fil du traitement"""
+    for info in members:
+        if info.file_size > ZIP_MAX_MEMBER_MB * 1024 * 1024:
+            # Fichier trop gros une fois décompressé : signalé en erreur sans être lu
+            yield info.filename, None, f'File larger than {ZIP_MAX_MEMBER_MB} MB once uncompressed'
+            continue
+        try:
+            content = archive.read(info)
+        except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError) as e:
+            # CRC invalide, fichier chiffré ou compression non prise en charge : les autres fichiers sont traités
+            yield info.filename, None, f'Unreadable archive member: {e}'
+            continue
+        yield info.filename, content, None
+
+def ndjson(record):
+    """Une ligne NDJSON"""
+    return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+@app.route('/api/process_batch', methods=['POST'])
+def api_process_batch():
+    """API : traite plusieurs fichiers (files[]) ou une archive ZIP (archive) en parallèle
+
+    La réponse est un flux NDJSON : une ligne d'en-tête (nombre de documents), puis une ligne
+    par document dès qu'il est terminé (données, temps par étape ou erreur), dans l'ordre de fin
+    de traitement, et une ligne de synthèse.
+    """
+    doc_type = request.form.get('document_type', 'ticket')
+    archive_file = request.files.get('archive')
+    files = [file for file in request.files.getlist('files[]') if file and file.filename]
+    if archive_file is None and len(files) == 1 and files[0].filename.lower().endswith('.zip'):
+        archive_file, files = files[0], []
+    
+    if archive_file is not None and archive_file.filename:
+        _, content, filepath = receive_upload(archive_file)
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(content) if content is not None else filepath)
+        except zipfile.BadZipFile:
+            return jsonify({'error': 'Invalid ZIP archive'}), 400
+        members = zip_members(archive)
+        count = len(members)
+        if count > ZIP_MAX_FILES:
+            return jsonify({'error': f'Too many files in archive (max {ZIP_MAX_FILES})'}), 400
+        # Pool de traitement déjà chargé : refus immédiat (429) plutôt qu'une file sans limite
+        batch_processor.check_capacity(count)
+        documents = iter_zip_documents(archive, members)
+        # Fichiers de l'archive : pas de chemin sur disque
+        sources = None
+    else:
+        files = [file for file in files if allowed_file(file.filename)]
+        if not files:
+            return jsonify({'error': 'No file part'}), 400
+        count = len(files)
+        batch_processor.check_capacity(count)
+        uploads = [receive_upload(file) for file in files]
+        documents = ((file.filename, content, None) for file, (_, content, _) in zip(files, uploads))
+        sources = [(filename, filepath) for filename, _, filepath in uploads]
+    
+    def generate():
+        start = time.perf_counter()
+        summary = {'documents': count, 'success': 0, 'duplicates': 0, 'errors': 0}
+        # Clé de chaque document soumis au pool -> (position, nom, empreintes, doublon, chemin)
+        submitted = {}
+        
+        def dispatch():
+            """Génère (clé, octets) des documents à traiter, lus au rythme du pool
+
+            Les lignes déjà connues (doublons réutilisés, fichiers refusés) sont générées sous la
+            forme (None, None, ligne) : renvoyées aussitôt, sans attendre les documents en cours.
+            """
+            for position, (name, content, error) in enumerate(documents):
+                filename, filepath = sources[position] if sources else (name, None)
+                if error is not None:
+                    yield None, None, {'index': position, 'filename': name, 'status': 'error', 'error': error}
+                    continue
+                fingerprint, match = find_duplicate(filename, content, filepath)
+                data = reuse_duplicate(match, doc_type, fingerprint)
+                if data is not None:
+                    data['image_src'] = filepath
+                    mark_duplicate(data, match, True)
+                    yield None, None, {'index': position, 'filename': name, 'status': 'duplicate',
+                                       'doc_id': save_result(data, fingerprint, match), 'duplicate_of': match[0],
+                                       'data': data}
+                    continue
+                # Fichier sur disque : relu par le processus de travail ; sinon nom unique portant l'extension
+                key = filepath if content is None else f'{position}_{os.path.basename(filename)}'
+                submitted[key] = (position, name, fingerprint, match, filepath)
+                yield key, content
+        
+        def emit(line):
+            summary[{'success': 'success', 'duplicate': 'duplicates'}.get(line['status'], 'errors')] += 1
+            return ndjson(line)
+        
+        yield ndjson({'documents': count})
+        for key, outcome in batch_processor.iter_unordered(dispatch(), doc_type):
+            if key is None:
+                yield emit(outcome)
+                continue
+            position, name, fingerprint, match, filepath = submitted.pop(key)
+            line = {'index': position, 'filename': name, 'status': outcome['status'],
+                    'seconds': outcome.get('seconds'), 'timings': outcome.get('timings')}
+            if outcome['status'] == 'success':
+                data = outcome['data']
+                data['image_src'] = filepath
+                if match is not None:
+                    mark_duplicate(data, match, False)
+                    line['status'] = 'duplicate'
+                    line['duplicate_of'] = match[0]
+                line['doc_id'] = save_result(data, fingerprint, match)
+                line['data'] = data
+            else:
+                line['error'] = outcome['message']
+            yield emit(line)
+        
+        summary['seconds'] = time.perf_counter() - start
+        yield ndjson({'summary': summary})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+@app.route('/api/results', methods=['GET'])
+def api_results():
+    """API : recherche des résultats (type, date_from, date_to au format AAAA-MM-JJ, limit, offset)"""
+    # Bornes explicites : SQLite traite une limite négative comme une absence de limite
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    return jsonify(result_store.query(
+        doc_type=request.args.get('type'),
+        date_from=request.args.get('date_from'),
+        date_to=request.args.get('date_to'),
+        limit=limit,
+        offset=offset
+    ))
+
+@app.route('/api/results/<doc_id>', methods=['GET'])
+def api_result(doc_id):
+    """API : données d'un résultat"""
+    data = result_store.get(doc_id)
+    
+    if data is None:
+        return jsonify({'error': 'Result not found'}), 404
+    
+    return jsonify({'doc_id': doc_id, 'data': data})
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """API asynchrone : enregistre le fichier et renvoie immédiatement un identifiant de travail"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    if file and allowed_file(file.filename):
+        filename = str(uuid.uuid4()) + '_' + secure_filename(file.filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(filepath)
+        
+        doc_type = request.form.get('document_type', 'ticket')
+        job_id = job_queue.submit(filepath, doc_type)
+        
+        return jsonify({
+            'job_id': job_id,
+            'status': 'pending',
+            'status_url': url_for('api_job_status', job_id=job_id)
+        }), 202
+    
+    return jsonify({'error': 'File type not allowed'}), 400
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """API asynchrone : état et résultat d'un travail"""
+    job = job_queue.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job)
+
+@app.route('/api/cache', methods=['GET'])
+def api_cache_stats():
+    """API : compteurs du cache OCR"""
+    if ocr_cache is None:
+        return jsonify({'enabled': False})
+    
+    return jsonify(dict(ocr_cache.stats(), enabled=True))
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def api_cache_invalidate():
+    """API : invalide une entrée du cache OCR (paramètre key) ou tout le cache"""
+    if ocr_cache is None:
+        return jsonify({'error': 'OCR cache disabled'}), 400
+    
+    removed = ocr_cache.invalidate(request.values.get('key'))
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques au format texte Prometheus (durées par étape, quantiles, débit)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+if OCR_PRELOAD:
+    # Démarrage des processus de travail en arrière-plan : l'application répond déjà pendant ce temps
+    threading.Thread(target=batch_processor.warm_up, name='batch-warm-up', daemon=True).start()
+
+# Durée du chargement de l'application (imports et initialisation, sans le préchargement des moteurs)
+metrics.observe('app_startup_seconds', time.perf_counter() - _import_start)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,268 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from image_decode import DEFAULT_MEMORY_BUDGET_MB
+from data_extractor import DataExtractor
+from metrics import metrics
+from engine_pool import PoolBusy
+
+# Délai (secondes) suggéré aux clients quand le pool de traitement par lot est saturé
+BATCH_RETRY_AFTER = 30
+
+# Moteur OCR propre à chaque processus de travail (initialisé une seule fois)
+_worker_engine = None
+
+def _init_worker(lang, cache, backend, profile, memory_budget_mb, text_regions, cascade):
+    """Initialise le moteur OCR d'un processus de travail"""
+    global _worker_engine
+    start = time.perf_counter()
+    # Un seul thread OpenMP par Tesseract : le parallélisme vient des processus
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    # Les mesures sont renvoyées avec chaque résultat et agrégées par le processus web
+    metrics.enable_forwarding()
+    # Import différé : OpenCV et Tesseract ne sont chargés que dans les processus de travail
+    # (déjà chargés si le processus est forké depuis le serveur préchargé)
+    from ocr_engine import OCREngine
+    # Les pages et les régions d'un même document sont traitées en série : un processus = un cœur,
+    # et un seul document à la fois, dont le pic de mémoire est donc mesurable
+    _worker_engine = OCREngine(lang, cache=cache, backend=backend, profile=profile, page_workers=1,
+                               memory_budget_mb=memory_budget_mb, text_regions=text_regions, region_workers=1,
+                               cascade=cascade, document_peak_rss=True)
+    metrics.observe('ocr_worker_start_seconds', time.perf_counter() - start)
+
+def _process_file(filepath, doc_type, content=None):
+    """Traite un fichier dans un processus de travail (OCR puis extraction)
+
+    Avec content (octets d'un upload gardé en mémoire), filepath n'est que le nom du fichier.
+    """
+    start = time.perf_counter()
+    try:
+        extractor = DataExtractor(doc_type)
+        text = _worker_engine.extract_text(filepath, content, extractor)
+        data = extractor.extract_data(text)
+        data['image_src'] = filepath if content is None else None
+        metrics.inc('ocr_documents_total', status='success')
+        outcome = {'status': 'success', 'data': data}
+    except Exception as e:
+        metrics.inc('ocr_documents_total', status='error')
+        outcome = {'status': 'error', 'message': str(e)}
+    outcome['seconds'] = time.perf_counter() - start
+    outcome['metrics'] = metrics.drain()
+    outcome['timings'] = _stage_timings(outcome['metrics'])
+    return outcome
+
+def _ping():
+    """Tâche vide : force le démarrage d'un processus de travail et renvoie ses mesures"""
+    return {'pid': os.getpid(), 'metrics': metrics.drain()}
+
+def _stage_timings(events):
+    """Temps de chaque étape d'un document, d'après les mesures renvoyées par le processus de travail"""
+    timings = {}
+    for kind, name, value, labels in events:
+        if kind == 'observe' and name == 'ocr_stage_seconds':
+            stage = dict(labels).get('stage')
+            timings[stage] = timings.get(stage, 0.0) + value
+    return timings
+
+def _collect(outcome):
+    """Agrège dans le processus courant les mesures renvoyées par un processus de travail"""
+    metrics.replay(outcome.pop('metrics', []))
+    return outcome
+
+class BatchProcessor:
+    def __init__(self, max_workers=None, lang='fra+eng', cache=None, backend='auto', profile='balanced',
+                 memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, text_regions=False, cascade=None, max_pending=None,
+                 preload=False):
+        """Initialise le traitement par lot sur un pool de processus
+
+        preload : processus de travail forkés depuis un serveur (forkserver) où OpenCV et Tesseract
+        sont déjà chargés par le module preload, au lieu de tout charger dans chaque processus.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Documents en cours ou en file au-delà desquels un nouveau lot est refusé (None = sans limite)
+        self.max_pending = max_pending
+        self._pending = 0
+        self.lang = lang
+        self.cache = cache
+        self.backend = backend
+        self.profile = profile
+        # Budget mémoire de travail par document, dans chaque processus
+        self.memory_budget_mb = memory_budget_mb
+        # OCR limité aux blocs de texte détectés
+        self.text_regions = text_regions
+        # Cascade de profils de prétraitement (None = profil unique)
+        self.cascade = cascade
+        self.preload = preload
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _mp_context(self):
+        """Contexte multiprocessing des processus de travail : serveur préchargé ou défaut de la plateforme"""
+        if not self.preload or 'forkserver' not in multiprocessing.get_all_start_methods():
+            return None
+        # Le module preload est importé sans argument : le moteur à précharger lui est décrit par
+        # l'environnement, hérité par le serveur à son démarrage (une fois par processus)
+        os.environ['OCR_PRELOAD_LANG'] = self.lang
+        os.environ['OCR_PRELOAD_BACKEND'] = self.backend
+        os.environ['OCR_PRELOAD_PROFILE'] = self.profile
+        # Pas de fork direct du processus courant : ses threads (serveur web, pools) ne survivraient pas
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['preload'])
+        return context
+
+    def _get_executor(self):
+        """Crée le pool de processus à la première utilisation"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=self._mp_context(),
+                    initializer=_init_worker,
+                    initargs=(self.lang, self.cache, self.backend, self.profile, self.memory_budget_mb,
+                              self.text_regions, self.cascade)
+                )
+            return self._executor
+
+    def warm_up(self):
+        """Démarre tous les processus de travail avant le premier lot et renvoie leur nombre"""
+        executor = self._get_executor()
+        futures = [executor.submit(_ping) for _ in range(self.max_workers)]
+        return len({_collect(future.result())['pid'] for future in futures})
+
+    def check_capacity(self, count):
+        """Lève PoolBusy si count documents de plus dépasseraient la file du pool
+
+        Un lot est toujours accepté quand le pool est inactif, quelle que soit sa taille.
+        """
+        with self._lock:
+            pending = self._pending
+        if self.max_pending is not None and pending and pending + count > self.max_pending:
+            metrics.inc('ocr_pool_rejected_total', reason='batch_queue_full')
+            raise PoolBusy(f'{pending} documents déjà en attente de traitement, réessayez plus tard',
+                           BATCH_RETRY_AFTER, 429)
+
+    def _add_pending(self, count):
+        with self._lock:
+            self._pending += count
+
+    def process(self, filepaths, doc_type, contents=None):
+        """Traite les fichiers en parallèle et renvoie les résultats dans l'ordre d'upload"""
+        return list(self.iter_process(filepaths, doc_type, contents))
+
+    def iter_process(self, filepaths, doc_type, contents=None):
+        """Génère les résultats dans l'ordre d'upload, au fur et à mesure qu'ils sont prêts
+
+        contents : octets de chaque fichier (uploads en mémoire), transmis aux processus de travail
+        sans passer par le disque ; filepaths ne donne alors que les noms des fichiers.
+        """
+        if not filepaths:
+            return
+
+        executor = self._get_executor()
+        contents = contents or [None] * len(filepaths)
+        done = 0
+        self._add_pending(len(filepaths))
+        try:
+            for outcome in executor.map(_process_file, filepaths, [doc_type] * len(filepaths), contents):
+                done += 1
+                self._add_pending(-1)
+                yield _collect(outcome)
+        except BrokenProcessPool as e:
+            # Un processus est mort (mémoire, crash Tesseract) : on recrée le pool au prochain lot
+            self.shutdown()
+            for _ in filepaths[done:]:
+                yield {'status': 'error', 'message': f'Pool de traitement interrompu: {e}'}
+        finally:
+            self._add_pending(done - len(filepaths))
+
+    def iter_unordered(self, items, doc_type, max_in_flight=None):
+        """Génère (chemin, résultat) dans l'ordre de fin de traitement, pour un grand nombre de fichiers
+
+        items : couples (chemin, octets ou None si le fichier est lu sur disque), éventuellement
+        produits à la demande. Au plus max_in_flight fichiers (par défaut quatre par processus)
+        sont soumis à la fois : la mémoire reste constante quelle que soit la taille du parcours.
+        Si un processus meurt, les fichiers en cours sont renvoyés en erreur et le pool est recréé
+        pour la suite. Un élément (clé, None, résultat) dont le résultat est déjà connu est renvoyé
+        dès qu'il est lu, sans passer par le pool ni attendre les fichiers en cours.
+        """
+        max_in_flight = max_in_flight or 4 * self.max_workers
+        items = iter(items)
+        in_flight = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    filepath, content, *known = item
+                    if known:
+                        yield filepath, known[0]
+                        continue
+                    try:
+                        future, executor = self._submit(_process_file, filepath, doc_type, content)
+                    except (BrokenProcessPool, RuntimeError) as e:
+                        yield filepath, {'status': 'error', 'message': f'Pool de traitement interrompu: {e}'}
+                        continue
+                    in_flight[future] = (filepath, executor)
+                    self._add_pending(1)
+                if not in_flight:
+                    return
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    filepath, executor = in_flight.pop(future)
+                    self._add_pending(-1)
+                    try:
+                        outcome = _collect(future.result())
+                    except BrokenProcessPool as e:
+                        # Un processus est mort (mémoire, crash Tesseract) : nouveau pool pour la suite
+                        if self._executor is executor:
+                            self.shutdown()
+                        outcome = {'status': 'error', 'message': f'Pool de traitement interrompu: {e}'}
+                    yield filepath, outcome
+        finally:
+            for future in in_flight:
+                future.cancel()
+            self._add_pending(-len(in_flight))
+
+    def _submit(self, func, *args):
+        """Soumet une tâche au pool et renvoie (future, pool)
+
+        Un pool déjà cassé (processus mort pendant un autre traitement) ou arrêté entre-temps
+        est remplacé et la soumission refaite une fois.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(func, *args), executor
+        except (BrokenProcessPool, RuntimeError):
+            if self._executor is executor:
+                self.shutdown()
+            executor = self._get_executor()
+            return executor.submit(func, *args), executor
+
+    def process_one(self, filepath, doc_type):
+        """Traite un seul fichier sur le pool et attend son résultat"""
+        self._add_pending(1)
+        executor = self._get_executor()
+        try:
+            return _collect(executor.submit(_process_file, filepath, doc_type).result())
+        except BrokenProcessPool as e:
+            # Un processus est mort (mémoire, crash Tesseract) : nouveau pool pour les travaux suivants
+            if self._executor is executor:
+                self.shutdown()
+            return {'status': 'error', 'message': f'Pool de traitement interrompu: {e}'}
+        finally:
+            self._add_pending(-1)
+
+    def shutdown(self):
+        """Arrête le pool de processus"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,92 @@
+"""Micro-benchmark de DataExtractor : règles précompilées (texte replié une fois) vs re.search sur des motifs texte
+
+Usage :
+    python benchmarks/bench_extraction.py [--documents 2000] [--lines 60] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_extractor import DataExtractor
+from extraction_rules import DOCUMENT_TYPES, FieldRule
+
+# Lignes typiques de documents, mélangées à du texte sans intérêt
+SAMPLE_LINES = {
+    'ticket': ['CARREFOUR MARKET', '12/03/2024 14h32', 'PAIN DE MIE 1,85', 'TOTAL: 23,40',
+               'SIRET: 123 456 789 01234', 'TVA FR 12 345 678 901', 'CB 23,40', 'MERCI DE VOTRE VISITE'],
+    'facture': ['ACME SARL', '12 rue des Lilas 75011 Paris', 'Facture N° F2024-0042',
+                'Date de facture: 01/02/2024', 'Total HT: 100,00', 'TVA 20%: 20,00', 'Total TTC: 120,00'],
+    'releve': ['BNP Paribas', 'Relevé du 01/01/2024 au 31/01/2024', 'Compte n° 12345678901',
+               '05/01 PRLV EDF 45,20', '12/01 VIR SALAIRE 2100,00', 'Nouveau solde: 1523,45']
+}
+FILLER = ['ARTICLE DIVERS 3,99', 'REF 000123 QTE 2', 'Lorem ipsum dolor sit amet', '------------------',
+          'Conditions générales de vente', 'Paiement à 30 jours', 'Page 1/2']
+
+def build_corpus(documents, lines, seed=42):
+    """Construit un corpus synthétique de (type, texte)"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(documents):
+        doc_type = rng.choice(list(SAMPLE_LINES))
+        body = [rng.choice(FILLER) for _ in range(lines)]
+        for line in SAMPLE_LINES[doc_type]:
+            body.insert(rng.randrange(len(body) + 1), line)
+        corpus.append((doc_type, '\n'.join(body)))
+    return corpus
+
+def legacy_extract(doc_type, text):
+    """Ancienne stratégie : un re.search par motif, sur tout le texte, motif par motif"""
+    data = {'type_document': doc_type, 'texte_brut': text}
+    for rule in DOCUMENT_TYPES[doc_type]:
+        if not isinstance(rule, FieldRule):
+            rule.apply(text, data)
+            continue
+        for pattern in rule.patterns:
+            match = re.search(pattern.pattern, text, pattern.flags)
+            if match:
+                for field, group in zip(rule.fields, rule.groups):
+                    value = match.group(group)
+                    data[field] = rule.transform(value) if rule.transform else value
+                break
+    return data
+
+def run(corpus, extract, repeat):
+    """Renvoie le meilleur temps total sur le corpus"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc_type, text in corpus:
+            extract(doc_type, text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=60, help="Lignes de remplissage par document")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.documents, args.lines)
+    size_mb = sum(len(text) for _, text in corpus) / 1e6
+
+    # Les deux stratégies doivent donner exactement les mêmes données
+    for doc_type, text in corpus:
+        assert legacy_extract(doc_type, text) == DataExtractor(doc_type).extract_data(text)
+
+    legacy = run(corpus, legacy_extract, args.repeat)
+    compiled = run(corpus, lambda doc_type, text: DataExtractor(doc_type).extract_data(text), args.repeat)
+
+    print(f"Corpus : {len(corpus)} documents, {size_mb:.1f} Mo")
+    print(f"re.search successifs : {legacy:.3f} s ({len(corpus) / legacy:,.0f} docs/s)")
+    print(f"règles précompilées  : {compiled:.3f} s ({len(corpus) / compiled:,.0f} docs/s)")
+    print(f"Accélération : x{legacy / compiled:.2f}")
+
+if __name__ == '__main__':
+    main()
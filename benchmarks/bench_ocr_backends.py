@@ -0,0 +1,60 @@
+"""Compare les backends OCR (pytesseract vs tesserocr) sur l'extraction texte + mise en page
+
+Usage :
+    python benchmarks/bench_ocr_backends.py image1.png image2.jpg ... [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+from ocr_engine import OCREngine
+
+def bench_backend(backend, images, repeat, lang):
+    """Mesure le temps de reconnaissance (texte + mise en page) par image pour un backend"""
+    engine = OCREngine(lang=lang, backend=backend)
+    # Images prétraitées une fois : on ne mesure que Tesseract
+    preprocessed = [engine.preprocess_image(cv2.imread(path)) for path in images]
+
+    # Premier appel hors mesure (chargement des traineddata)
+    engine.backend.recognize(preprocessed[0], lang)
+
+    durations = []
+    for _ in range(repeat):
+        for img in preprocessed:
+            start = time.perf_counter()
+            engine.backend.recognize(img, lang)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('images', nargs='+', help="Images de documents à reconnaître")
+    parser.add_argument('--repeat', type=int, default=3, help="Nombre de passes sur le corpus")
+    parser.add_argument('--lang', default='fra+eng')
+    parser.add_argument('--backends', default='pytesseract,tesserocr')
+    args = parser.parse_args()
+
+    results = {}
+    for backend in args.backends.split(','):
+        try:
+            results[backend] = bench_backend(backend, args.images, args.repeat, args.lang)
+        except ImportError as e:
+            print(f"{backend}: indisponible ({e})")
+
+    for backend, durations in results.items():
+        print(f"{backend:12s} n={len(durations):4d}  "
+              f"moyenne={statistics.mean(durations) * 1000:8.1f} ms  "
+              f"médiane={statistics.median(durations) * 1000:8.1f} ms")
+
+    if len(results) == 2:
+        (name_a, a), (name_b, b) = results.items()
+        print(f"Accélération {name_b} / {name_a} : x{statistics.mean(a) / statistics.mean(b):.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Taille et temps de chargement des fichiers de sortie d'un lot selon le format (csv, jsonl, parquet, columnar)
+
+Les documents sont des textes synthétiques (tickets, factures, relevés) passés par DataExtractor,
+sans OCR : seuls l'écriture, la normalisation et la relecture sont mesurées. Pour le format
+columnar, le chargement est mesuré sans puis avec le fichier des textes OCR.
+
+Usage :
+    python benchmarks/bench_output.py [--documents 20000] [--repeat 3] [--output output_bench.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_extractor import DataExtractor
+from output_manager import OutputManager, WRITERS, text_store_path
+from synthetic_documents import DOCUMENT_TYPES, generate_document
+
+FORMATS = ('csv', 'jsonl', 'parquet', 'columnar')
+
+def build_records(documents, seed):
+    """Résultats d'extraction de documents synthétiques, comme ceux d'un lot"""
+    rng = random.Random(seed)
+    extractors = {doc_type: DataExtractor(doc_type) for doc_type in DOCUMENT_TYPES}
+    records = []
+    for _ in range(documents):
+        doc_type = rng.choice(DOCUMENT_TYPES)
+        lines, _ = generate_document(doc_type, rng)
+        data = extractors[doc_type].extract_data('\n'.join(lines))
+        data['image_src'] = None
+        records.append(data)
+    return records
+
+def load(output_manager, output_format, filepath, with_text=False):
+    """Relit un fichier de sortie en DataFrame"""
+    import pandas as pd
+
+    if output_format == 'columnar':
+        return output_manager.load_columnar(os.path.basename(filepath), with_text=with_text)
+    if output_format == 'parquet':
+        return pd.read_parquet(filepath)
+    if output_format == 'csv':
+        return pd.read_csv(filepath)
+    return pd.read_json(filepath, lines=True)
+
+def best_time(func, repeat):
+    """Meilleur temps de func() sur repeat essais"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_format(output_manager, output_format, records, repeat):
+    """Écriture du lot, taille sur disque et chargement"""
+    filename = f'bench{WRITERS[output_format].extension}'
+    start = time.perf_counter()
+    with output_manager.open_writer(output_format, filename) as writer:
+        for record in records:
+            writer.write(record)
+    result = {'write_seconds': time.perf_counter() - start, 'bytes': os.path.getsize(writer.filepath)}
+    result['load_seconds'] = best_time(lambda: load(output_manager, output_format, writer.filepath), repeat)
+    if output_format == 'columnar':
+        result['text_bytes'] = os.path.getsize(text_store_path(writer.filepath))
+        result['load_with_text_seconds'] = best_time(
+            lambda: load(output_manager, output_format, writer.filepath, with_text=True), repeat)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3, help="Essais de chargement par format")
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    records = build_records(args.documents, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_manager = OutputManager(tmp_dir)
+        for output_format in args.formats.split(','):
+            result = results[output_format] = bench_format(output_manager, output_format, records, args.repeat)
+            line = (f"{output_format:<9} {result['bytes'] / 1024:9.0f} Ko  écriture {result['write_seconds']:.2f} s  "
+                    f"chargement {result['load_seconds']:.3f} s")
+            if 'text_bytes' in result:
+                line += (f"  (+ textes {result['text_bytes'] / 1024:.0f} Ko, "
+                         f"chargement avec textes {result['load_with_text_seconds']:.3f} s)")
+            print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'documents': args.documents, 'seed': args.seed, 'formats': results}, f, indent=2)
+        print(f"Résultats enregistrés dans {args.output}")
+
+if __name__ == '__main__':
+    main()
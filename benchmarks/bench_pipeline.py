@@ -0,0 +1,197 @@
+"""Benchmark de bout en bout OCREngine + DataExtractor sur des documents synthétiques
+
+Mesure le débit (de bout en bout et extraction seule), la latence par document, le temps de
+chaque étape (métriques ocr_stage_seconds) et la précision champ par champ, puis enregistre
+le tout en JSON. Avec --baseline, compare à un résultat précédent et sort en erreur en cas
+de régression.
+
+Usage :
+    python benchmarks/bench_pipeline.py --documents 10 --noise 8 --blur 0.8 --skew 1.5 \\
+        --output bench_balanced.json [--baseline bench_reference.json] [--tolerance 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data_extractor import DataExtractor
+from metrics import metrics
+from ocr_engine import OCREngine
+from common import compare_paths, git_revision, percentile
+from synthetic_documents import write_fixtures
+
+# Indicateurs comparés à la référence : (chemin dans le résultat, True si plus grand = mieux)
+COMPARED = [
+    (('throughput', 'docs_per_second'), True),
+    (('extraction_only', 'docs_per_second'), True),
+    (('latency', 'p50'), False),
+    (('latency', 'p95'), False),
+    (('accuracy', 'overall'), True)
+]
+
+def load_fixtures(fixtures_dir):
+    """Relit un jeu de fixtures écrit par synthetic_documents.py"""
+    with open(os.path.join(fixtures_dir, 'ground_truth.json'), encoding='utf-8') as f:
+        return json.load(f)['documents']
+
+def score(data, fields, counts):
+    """Compte les champs correctement extraits (comparaison exacte après suppression des espaces)"""
+    correct = 0
+    for field, expected in fields.items():
+        ok = str(data.get(field, '')).strip() == expected
+        counts[field][0] += ok
+        counts[field][1] += 1
+        correct += ok
+    return correct
+
+def run_pipeline(entries, fixtures_dir, engine, doc_type_mode):
+    """OCR + extraction de chaque fixture ; renvoie latences, précision et temps total"""
+    latencies = []
+    field_counts = defaultdict(lambda: [0, 0])
+    type_counts = defaultdict(lambda: [0, 0])
+    type_correct = 0
+    errors = 0
+
+    start = time.perf_counter()
+    for entry in entries:
+        doc_start = time.perf_counter()
+        try:
+            extractor = DataExtractor(doc_type_mode or entry['type'])
+            text = engine.extract_text(os.path.join(fixtures_dir, entry['file']), extractor=extractor)
+            data = extractor.extract_data(text)
+        except Exception as e:
+            print(f"Erreur sur {entry['file']} : {e}", file=sys.stderr)
+            errors += 1
+            data = {}
+        latencies.append(time.perf_counter() - doc_start)
+
+        correct = score(data, entry['fields'], field_counts)
+        type_counts[entry['type']][0] += correct
+        type_counts[entry['type']][1] += len(entry['fields'])
+        type_correct += data.get('type_document') == entry['type']
+    elapsed = time.perf_counter() - start
+
+    total_correct = sum(correct for correct, _ in field_counts.values())
+    total_fields = sum(total for _, total in field_counts.values())
+    return {
+        'throughput': {
+            'documents': len(entries),
+            'errors': errors,
+            'seconds': elapsed,
+            'docs_per_second': len(entries) / elapsed if elapsed else None
+        },
+        'latency': {f'p{int(q * 100)}': percentile(latencies, q) for q in (0.5, 0.95, 0.99)},
+        'accuracy': {
+            'overall': total_correct / total_fields if total_fields else None,
+            'by_field': {field: correct / total for field, (correct, total) in sorted(field_counts.items())},
+            'by_type': {doc_type: correct / total for doc_type, (correct, total) in sorted(type_counts.items())},
+            'document_type': type_correct / len(entries) if entries else None
+        }
+    }
+
+def run_extraction_only(entries, doc_type_mode, repeat):
+    """Débit de DataExtractor seul, sur le texte exact des documents (sans OCR)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for entry in entries:
+            DataExtractor(doc_type_mode or entry['type']).extract_data(entry['text'])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'seconds': best, 'docs_per_second': len(entries) / best if best else None}
+
+def compare(result, baseline, tolerance):
+    """Compare à la référence ; renvoie (lignes du rapport, régressions)"""
+    # La précision ne doit pas baisser de plus d'un point, quelle que soit la tolérance de temps
+    return compare_paths(result, baseline, COMPARED, tolerance, max_drops={'accuracy': 0.01})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fixtures', help="Jeu de fixtures existant (sinon généré dans un dossier temporaire)")
+    parser.add_argument('--documents', type=int, default=10, help="Documents générés par type")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument('--blur', type=float, default=0.0)
+    parser.add_argument('--skew', type=float, default=0.0)
+    parser.add_argument('--profile', default='balanced', help="Profil de prétraitement")
+    parser.add_argument('--backend', default='auto', help="Backend Tesseract")
+    parser.add_argument('--cascade', help="Cascade de profils, par exemple fast,balanced,quality")
+    parser.add_argument('--lang', default='fra+eng')
+    parser.add_argument('--auto-type', action='store_true', help="Détection automatique du type (mode 'auto')")
+    parser.add_argument('--repeat', type=int, default=3, help="Répétitions de la mesure d'extraction seule")
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    parser.add_argument('--baseline', help="Résultat JSON de référence à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Dégradation relative tolérée des temps")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixtures_dir = args.fixtures or tmp_dir
+        if args.fixtures and os.path.exists(os.path.join(args.fixtures, 'ground_truth.json')):
+            entries = load_fixtures(args.fixtures)
+        else:
+            entries = write_fixtures(fixtures_dir, args.documents, args.seed,
+                                     noise=args.noise, blur=args.blur, skew=args.skew)
+
+        # Pas de cache : chaque document passe par toutes les étapes
+        cascade = tuple(args.cascade.split(',')) if args.cascade else None
+        engine = OCREngine(args.lang, cache=None, backend=args.backend, profile=args.profile, cascade=cascade)
+        doc_type_mode = 'auto' if args.auto_type else None
+
+        metrics.reset()
+        result = run_pipeline(entries, fixtures_dir, engine, doc_type_mode)
+        result['stages'] = metrics.snapshot('ocr_stage_seconds')
+        # Niveau de la cascade auquel chaque document s'est arrêté
+        result['cascade'] = metrics.counter_values('ocr_cascade_documents_total')
+        result['extraction_only'] = run_extraction_only(entries, doc_type_mode, args.repeat)
+
+    result['meta'] = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': engine.backend.name,
+        'profile': args.profile,
+        'cascade': args.cascade,
+        'lang': args.lang,
+        'auto_type': args.auto_type,
+        'seed': args.seed,
+        'degradations': {'noise': args.noise, 'blur': args.blur, 'skew': args.skew}
+    }
+
+    throughput = result['throughput']
+    print(f"{throughput['documents']} documents en {throughput['seconds']:.2f} s "
+          f"({throughput['docs_per_second']:.2f} docs/s, {throughput['errors']} erreurs)")
+    print(f"Latence p50 {result['latency']['p50']:.3f} s, p95 {result['latency']['p95']:.3f} s")
+    print(f"Extraction seule : {result['extraction_only']['docs_per_second']:,.0f} docs/s")
+    print(f"Précision des champs : {result['accuracy']['overall']:.1%}")
+    for field, accuracy in result['accuracy']['by_field'].items():
+        print(f"  {field:<16} {accuracy:.1%}")
+    print("Temps par étape (moyenne) :")
+    for stage, summary in sorted(result['stages'].items(), key=lambda item: -item[1]['sum']):
+        print(f"  {stage:<32} {summary['sum'] / summary['count'] * 1000:8.1f} ms x {summary['count']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Résultats enregistrés dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(result, baseline, args.tolerance)
+        print(f"Comparaison avec {args.baseline} :")
+        for line in lines:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Mesure du démarrage à froid : import de l'application et des outils, démarrage des processus de travail
+
+Chaque mesure est faite dans un processus Python neuf (dossier de travail temporaire) :
+- import de app, bulk_process, batch_processor et output_manager, avec la liste des
+  bibliothèques lourdes (pandas, OpenCV, PIL, Tesseract) chargées par l'import lui-même,
+  et pour app la durée de la première requête sur une route sans OCR (/files) ;
+- traitement par lot sans et avec préchargement (--preload, serveur forkserver où OpenCV et
+  Tesseract sont déjà chargés) : démarrage de tous les processus de travail, premier document,
+  puis documents suivants une fois les processus chauds.
+
+Usage :
+    python benchmarks/bench_startup.py [--repeat 5] [--workers 2] [--output startup.json]
+    python benchmarks/bench_startup.py --skip-batch
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import REPO_ROOT, git_revision
+
+# Bibliothèques dont le chargement domine le démarrage
+HEAVY_MODULES = ('pandas', 'cv2', 'numpy', 'PIL', 'pytesseract', 'tesserocr')
+
+# Modules importés à froid (l'application web et les outils en ligne de commande)
+MODULES = ('app', 'bulk_process', 'batch_processor', 'output_manager')
+
+IMPORT_CODE = """
+import json, os, sys, time
+start = time.perf_counter()
+import {module}
+result = {{'seconds': time.perf_counter() - start,
+           'heavy': [name for name in {heavy!r} if name in sys.modules]}}
+if {module!r} == 'app':
+    start = time.perf_counter()
+    response = app.app.test_client().get('/files')
+    result['first_request_seconds'] = time.perf_counter() - start
+    result['first_request_status'] = response.status_code
+print(json.dumps(result), flush=True)
+# Sortie immédiate : les threads des pools éventuellement démarrés ne sont pas attendus
+os._exit(0)
+"""
+
+BATCH_CODE = """
+import json, os, sys, time
+from batch_processor import BatchProcessor
+processor = BatchProcessor({workers}, backend={backend!r}, preload={preload})
+start = time.perf_counter()
+processor.warm_up()
+result = {{'workers_ready_seconds': time.perf_counter() - start, 'documents': []}}
+for path in {paths!r}:
+    start = time.perf_counter()
+    outcome = processor.process_one(path, 'auto')
+    result['documents'].append({{'seconds': time.perf_counter() - start, 'status': outcome['status']}})
+processor.shutdown()
+print(json.dumps(result), flush=True)
+"""
+
+def run_child(code, workdir, env_overrides=None, timeout=600):
+    """Exécute code dans un interpréteur neuf et renvoie le JSON affiché sur sa dernière ligne"""
+    env = dict(os.environ)
+    env.update(env_overrides or {})
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+    completed = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env, capture_output=True,
+                               timeout=timeout)
+    if completed.returncode != 0:
+        message = completed.stderr.decode(errors='replace').strip()
+        raise RuntimeError(message or f'Code de sortie {completed.returncode}')
+    return json.loads(completed.stdout.decode().strip().splitlines()[-1])
+
+def summarize(values):
+    """Médiane, minimum et maximum d'une série de durées"""
+    if not values:
+        return None
+    return {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+
+def bench_imports(workdir, repeat, env):
+    """Import à froid de chaque module, repeat fois dans des processus neufs"""
+    results = {}
+    for module in MODULES:
+        runs = [run_child(IMPORT_CODE.format(module=module, heavy=HEAVY_MODULES), workdir, env)
+                for _ in range(repeat)]
+        results[module] = {
+            'seconds': summarize([run['seconds'] for run in runs]),
+            'heavy_modules': sorted({name for run in runs for name in run['heavy']})
+        }
+        if module == 'app':
+            results[module]['first_request_seconds'] = summarize([run['first_request_seconds'] for run in runs])
+            results[module]['first_request_status'] = runs[-1]['first_request_status']
+    return results
+
+def bench_batch(workdir, paths, workers, backend, preload):
+    """Démarrage du pool de traitement par lot puis premier document et documents suivants"""
+    code = BATCH_CODE.format(workers=workers, backend=backend, preload=preload, paths=paths)
+    result = run_child(code, workdir)
+    seconds = [document['seconds'] for document in result['documents']]
+    return {
+        'workers_ready_seconds': result['workers_ready_seconds'],
+        'first_document_seconds': seconds[0] if seconds else None,
+        'warm_document_seconds': summarize(seconds[1:]),
+        'errors': sum(1 for document in result['documents'] if document['status'] != 'success')
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="Processus neufs par module importé")
+    parser.add_argument('--workers', type=int, default=2, help="Processus de travail du traitement par lot")
+    parser.add_argument('--documents', type=int, default=4, help="Documents traités par mesure du lot")
+    parser.add_argument('--backend', default='auto', help="Backend Tesseract")
+    parser.add_argument('--skip-batch', action='store_true', help="Mesurer uniquement les imports")
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    # Application mesurée sans cache OCR, index des doublons ni préchargement des moteurs : seuls les
+    # imports comptent (le préchargement chargerait OpenCV et pytesseract en arrière-plan)
+    env = {'OCR_CACHE_MAX_MB': '0', 'OCR_DUPLICATE_MODE': 'off', 'OCR_PRELOAD': '0'}
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report['imports'] = bench_imports(tmp_dir, args.repeat, env)
+        for module, result in report['imports'].items():
+            line = f"import {module:<16} {result['seconds']['median']:.3f} s (médiane)"
+            if 'first_request_seconds' in result:
+                line += f", première requête /files {result['first_request_seconds']['median']:.3f} s"
+            print(line)
+            print(f"{'':<23} bibliothèques lourdes chargées : {', '.join(result['heavy_modules']) or 'aucune'}")
+
+        if not args.skip_batch:
+            from synthetic_documents import write_fixtures
+            corpus_dir = os.path.join(tmp_dir, 'corpus')
+            entries = write_fixtures(corpus_dir, max(1, args.documents // 3 + 1))[:args.documents]
+            paths = [os.path.join(corpus_dir, entry['file']) for entry in entries]
+            report['batch'] = {}
+            for preload in (False, True):
+                name = 'preload' if preload else 'cold'
+                result = report['batch'][name] = bench_batch(tmp_dir, paths, args.workers, args.backend, preload)
+                warm = result['warm_document_seconds']
+                print(f"lot {name:<8} processus prêts {result['workers_ready_seconds']:.2f} s, "
+                      f"premier document {result['first_document_seconds'] or 0:.2f} s, "
+                      f"suivants {warm['median'] if warm else 0:.2f} s, erreurs {result['errors']}")
+
+    report['meta'] = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'workers': args.workers,
+        'backend': args.backend
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Rapport enregistré dans {args.output}")
+
+if __name__ == '__main__':
+    main()
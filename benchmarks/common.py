@@ -0,0 +1,54 @@
+"""Outils communs aux mesures de performance : révision du dépôt, percentiles, comparaison à une référence"""
+import os
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def git_revision():
+    """Révision courante du dépôt, si disponible"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=REPO_ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(values, q):
+    """Percentile simple (valeur la plus proche) d'une liste"""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def lookup(result, path):
+    """Valeur d'un résultat JSON à un chemin de clés, ou None"""
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+def compare_paths(result, baseline, compared, tolerance, prefix='', width=32, max_drops=None):
+    """Compare les indicateurs d'un résultat à la référence ; renvoie (lignes du rapport, régressions)
+
+    compared : [(chemin, True si plus grand = mieux)]. Un indicateur régresse s'il se dégrade de
+    plus de tolerance (relative), ou, pour un chemin commençant par une clé de max_drops, s'il
+    baisse de plus de la valeur absolue associée.
+    """
+    max_drops = max_drops or {}
+    lines = []
+    regressions = []
+    for path, higher_is_better in compared:
+        current, reference = lookup(result, path), lookup(baseline, path)
+        if current is None or reference is None or reference == 0:
+            continue
+        change = (current - reference) / reference
+        if path[0] in max_drops:
+            regressed = reference - current > max_drops[path[0]]
+        else:
+            regressed = (-change if higher_is_better else change) > tolerance
+        name = prefix + '.'.join(path)
+        lines.append(f"{name:<{width}} {reference:>10.4f} -> {current:>10.4f} ({change:+.1%})"
+                     f"{'  RÉGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return lines, regressions
@@ -0,0 +1,451 @@
+"""Test de charge local des routes web (/api/process, /upload, /batch, /api/process_batch)
+
+Rejoue un corpus de documents contre l'application démarrée localement (ou une instance déjà
+lancée avec --url), avec une concurrence et un débit d'arrivée configurables. Mesure pour
+chaque route la latence (p50/p95/p99), le débit, le taux d'erreur et le CPU / la mémoire
+résidente des processus du serveur (processus web et processus de travail, via /proc), puis
+enregistre un rapport JSON comparable d'un commit à l'autre (--baseline).
+
+Sans --rate, chaque client enchaîne ses requêtes (boucle fermée, --concurrency clients). Avec
+--rate, les requêtes arrivent selon un processus de Poisson au débit demandé, quelle que soit
+la vitesse du serveur ; la latence est alors mesurée depuis l'instant d'arrivée prévu, attente
+côté client comprise.
+
+Usage :
+    python benchmarks/load_test.py --documents 5 --concurrency 8 --requests 100 \\
+        --endpoints api_process,upload,batch --output load_report.json [--baseline load_reference.json]
+    python benchmarks/load_test.py --corpus scans/ --rate 4 --duration 60 --server-env OCR_ENGINE_POOL_SIZE=2
+    python benchmarks/load_test.py --corpus scans/ --url http://localhost:5000 --server-pid 1234
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import REPO_ROOT, compare_paths, git_revision, percentile
+
+EXTENSIONS = {'png', 'jpg', 'jpeg', 'tif', 'tiff', 'pdf'}
+
+# Routes testées : chemin, champ des fichiers, plusieurs documents par requête
+ENDPOINTS = {
+    'api_process': ('/api/process', 'file', False),
+    'upload': ('/upload', 'file', False),
+    'batch': ('/batch', 'files[]', True),
+    'process_batch': ('/api/process_batch', 'files[]', True)
+}
+
+# Réponses de refus du contrôle de charge (comptées à part des autres erreurs)
+REJECTED_STATUSES = {429, 503}
+
+# Intervalle d'échantillonnage du CPU et de la mémoire du serveur (secondes)
+SAMPLE_INTERVAL = 0.5
+
+# Indicateurs comparés à la référence, par route : (chemin, True si plus grand = mieux)
+COMPARED = [
+    (('throughput', 'requests_per_second'), True),
+    (('latency', 'p50'), False),
+    (('latency', 'p95'), False),
+    (('latency', 'p99'), False)
+]
+
+def load_corpus(corpus_dir, doc_type):
+    """Documents d'un dossier : [(nom, octets, type)]"""
+    documents = []
+    for dirpath, dirnames, filenames in os.walk(corpus_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if '.' in name and name.rsplit('.', 1)[1].lower() in EXTENSIONS:
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    documents.append((name, f.read(), doc_type))
+    return documents
+
+def synthetic_corpus(count, seed, tmp_dir):
+    """Corpus synthétique (tickets, factures, relevés) : [(nom, octets, type)]"""
+    from synthetic_documents import write_fixtures
+    documents = []
+    for entry in write_fixtures(tmp_dir, count, seed):
+        with open(os.path.join(tmp_dir, entry['file']), 'rb') as f:
+            documents.append((entry['file'], f.read(), entry['type']))
+    return documents
+
+def encode_multipart(fields, files):
+    """Corps multipart/form-data : renvoie (octets, en-tête Content-Type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def build_payloads(endpoint, documents, batch_size):
+    """Requêtes préparées (corps, Content-Type, documents) pour une route, rejouées en boucle"""
+    _, field, multiple = ENDPOINTS[endpoint]
+    payloads = []
+    if multiple:
+        for start in range(0, len(documents), batch_size):
+            group = [documents[(start + i) % len(documents)] for i in range(batch_size)]
+            doc_type = group[0][2] if len({doc[2] for doc in group}) == 1 else 'auto'
+            body, content_type = encode_multipart({'document_type': doc_type, 'output_format': 'jsonl'},
+                                                  [(field, name, content) for name, content, _ in group])
+            payloads.append((body, content_type, len(group)))
+    else:
+        for name, content, doc_type in documents:
+            body, content_type = encode_multipart({'document_type': doc_type, 'output_format': 'json'},
+                                                  [(field, name, content)])
+            payloads.append((body, content_type, 1))
+    return payloads
+
+def is_success(endpoint, status, headers, body):
+    """Réponse attendue pour la route (l'upload HTML redirige vers la page de résultat)"""
+    if endpoint == 'upload':
+        return status == 302 and '/result' in (headers.get('Location') or '')
+    if endpoint == 'process_batch':
+        return status == 200 and b'"summary"' in body
+    return status == 200
+
+def send(base_url, endpoint, payload, timeout):
+    """Envoie une requête et renvoie (statut, succès) ; statut None si la connexion a échoué"""
+    url = urlsplit(base_url)
+    body, content_type, _ = payload
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        conn.request('POST', ENDPOINTS[endpoint][0], body=body,
+                     headers={'Content-Type': content_type, 'Content-Length': str(len(body))})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, is_success(endpoint, response.status, response.headers, data)
+    except OSError:
+        return None, False
+    finally:
+        conn.close()
+
+class ServerSampler:
+    def __init__(self, root_pid):
+        """Échantillonne le CPU et la mémoire résidente d'un processus et de ses descendants (/proc)"""
+        self.root_pid = root_pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.available = root_pid is not None and os.path.exists(f'/proc/{root_pid}/stat')
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_rss = 0
+        self.processes = 0
+
+    @staticmethod
+    def _stat(pid):
+        """(ppid, temps CPU en ticks) d'un processus, enfants terminés compris"""
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[1]), sum(int(value) for value in fields[11:15])
+
+    @staticmethod
+    def _rss(pid):
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def _tree(self):
+        """Processus du serveur : {pid: temps CPU en ticks}"""
+        stats = {}
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                try:
+                    stats[int(name)] = self._stat(name)
+                except (OSError, IndexError, ValueError):
+                    continue
+        tree = {self.root_pid}
+        added = True
+        while added:
+            children = {pid for pid, (ppid, _) in stats.items() if ppid in tree} - tree
+            tree |= children
+            added = bool(children)
+        return {pid: stats[pid][1] for pid in tree if pid in stats}
+
+    def _sample_once(self):
+        try:
+            pids = self._tree()
+            rss = sum(self._rss(pid) for pid in pids)
+        except OSError:
+            return
+        self.peak_rss = max(self.peak_rss, rss)
+        self.processes = max(self.processes, len(pids))
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample_once()
+
+    def start(self):
+        if not self.available:
+            return
+        self.peak_rss = 0
+        self.processes = 0
+        self._start_cpu = self._tree()
+        self._start_time = time.perf_counter()
+        self._sample_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Renvoie CPU consommé (s), utilisation moyenne (% d'un cœur), pic de RSS et nombre de processus"""
+        if not self.available:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._sample_once()
+        elapsed = time.perf_counter() - self._start_time
+        end_cpu = self._tree()
+        cpu = sum(ticks - self._start_cpu.get(pid, 0) for pid, ticks in end_cpu.items()) / self.ticks
+        return {
+            'cpu_seconds': cpu,
+            'cpu_percent': 100 * cpu / elapsed if elapsed else None,
+            'peak_rss_bytes': self.peak_rss,
+            'processes': self.processes
+        }
+
+def run_endpoint(base_url, endpoint, payloads, args, sampler):
+    """Charge une route ; renvoie son rapport (latences, débit, erreurs, ressources du serveur)"""
+    rng = random.Random(args.seed)
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def record(index, scheduled):
+        payload = payloads[index % len(payloads)]
+        start = scheduled if scheduled is not None else time.perf_counter()
+        status, ok = send(base_url, endpoint, payload, args.timeout)
+        with results_lock:
+            results.append((time.perf_counter() - start, status, ok, payload[2]))
+
+    def more(index):
+        return index < args.requests and (deadline is None or time.perf_counter() < deadline)
+
+    sampler.start()
+    start = time.perf_counter()
+    if args.rate:
+        # Boucle ouverte : arrivées de Poisson, indépendantes des réponses du serveur
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            index = 0
+            scheduled = time.perf_counter()
+            while more(index):
+                scheduled += rng.expovariate(args.rate)
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(record, index, scheduled)
+                index += 1
+    else:
+        # Boucle fermée : chaque client envoie sa requête suivante dès la réponse reçue
+        counter = iter(range(args.requests))
+        counter_lock = threading.Lock()
+
+        def client():
+            while True:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None or not more(index):
+                    return
+                record(index, None)
+
+        threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+    server = sampler.stop()
+
+    latencies = [latency for latency, _, ok, _ in results if ok]
+    statuses = {}
+    for _, status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(1 for _, _, ok, _ in results if not ok)
+    return {
+        'requests': len(results),
+        'documents': sum(docs for _, _, ok, docs in results if ok),
+        'errors': errors,
+        'error_rate': errors / len(results) if results else None,
+        'rejected': sum(1 for _, status, _, _ in results if status in REJECTED_STATUSES),
+        'status_codes': statuses,
+        'seconds': elapsed,
+        'throughput': {
+            'requests_per_second': len(latencies) / elapsed if elapsed else None,
+            'documents_per_second': sum(docs for _, _, ok, docs in results if ok) / elapsed if elapsed else None
+        },
+        'latency': dict(
+            {f'p{int(q * 100)}': percentile(latencies, q) for q in (0.5, 0.95, 0.99)},
+            mean=sum(latencies) / len(latencies) if latencies else None,
+            max=max(latencies) if latencies else None
+        ),
+        'server': server
+    }
+
+def start_server(port, workdir, env_overrides, timeout):
+    """Démarre l'application dans un dossier de travail isolé et attend qu'elle réponde"""
+    env = dict(os.environ)
+    env.update(env_overrides)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+    code = f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (voir {log.name})")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Le serveur ne répond pas après {timeout} s (voir {log.name})")
+
+def compare(report, baseline, tolerance):
+    """Compare chaque route à la référence ; renvoie (lignes du rapport, régressions)"""
+    lines = []
+    regressions = []
+    for endpoint, result in report['endpoints'].items():
+        reference_result = baseline.get('endpoints', {}).get(endpoint)
+        if reference_result is None:
+            continue
+        endpoint_lines, endpoint_regressions = compare_paths(result, reference_result, COMPARED, tolerance,
+                                                             prefix=f'{endpoint}.', width=40)
+        lines.extend(endpoint_lines)
+        regressions.extend(endpoint_regressions)
+        # Le taux d'erreur ne doit pas augmenter de plus d'un point
+        current, reference = result.get('error_rate'), reference_result.get('error_rate')
+        if current is not None and reference is not None and current - reference > 0.01:
+            lines.append(f"{endpoint + '.error_rate':<40} {reference:>10.2%} -> {current:>10.2%}  RÉGRESSION")
+            regressions.append(f'{endpoint}.error_rate')
+    return lines, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help="Dossier de documents à rejouer (sinon corpus synthétique)")
+    parser.add_argument('--documents', type=int, default=5, help="Documents synthétiques générés par type")
+    parser.add_argument('--doc-type', default='auto', help="Type de document envoyé pour un corpus --corpus")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--endpoints', default='api_process,upload,batch',
+                        help=f"Routes testées, parmi {','.join(ENDPOINTS)}")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requêtes simultanées au plus")
+    parser.add_argument('--rate', type=float, help="Débit d'arrivée (requêtes/s, boucle ouverte)")
+    parser.add_argument('--requests', type=int, default=50, help="Requêtes par route")
+    parser.add_argument('--duration', type=float, help="Durée maximale par route (secondes)")
+    parser.add_argument('--batch-size', type=int, default=5, help="Documents par requête pour /batch et /api/process_batch")
+    parser.add_argument('--timeout', type=float, default=300, help="Délai maximal d'une requête (secondes)")
+    parser.add_argument('--url', help="Instance déjà démarrée (sinon l'application est lancée localement)")
+    parser.add_argument('--server-pid', type=int, help="PID du serveur --url, pour mesurer son CPU et sa mémoire")
+    parser.add_argument('--port', type=int, default=5055, help="Port de l'application lancée localement")
+    parser.add_argument('--server-env', action='append', default=[], metavar='CLE=VALEUR',
+                        help="Variable d'environnement du serveur lancé (répétable)")
+    parser.add_argument('--keep-caches', action='store_true',
+                        help="Laisser actifs le cache OCR et la détection des doublons (désactivés par défaut : "
+                             "le corpus rejoué ne mesurerait sinon que les réponses en cache)")
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--output', help="Fichier JSON du rapport")
+    parser.add_argument('--baseline', help="Rapport JSON de référence à comparer")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Dégradation relative tolérée")
+    args = parser.parse_args()
+
+    endpoints = [name for name in args.endpoints.split(',') if name]
+    for name in endpoints:
+        if name not in ENDPOINTS:
+            parser.error(f"Route inconnue : {name}")
+
+    server_env = {}
+    if not args.keep_caches:
+        server_env.update(OCR_CACHE_MAX_MB='0', OCR_DUPLICATE_MODE='off')
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        server_env[key] = value
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.corpus:
+            documents = load_corpus(args.corpus, args.doc_type)
+        else:
+            documents = synthetic_corpus(args.documents, args.seed, os.path.join(tmp_dir, 'corpus'))
+        if not documents:
+            parser.error("Corpus vide")
+
+        server = None
+        if args.url:
+            base_url, server_pid = args.url, args.server_pid
+        else:
+            workdir = os.path.join(tmp_dir, 'server')
+            os.makedirs(workdir)
+            server = start_server(args.port, workdir, server_env, args.startup_timeout)
+            base_url, server_pid = f'http://127.0.0.1:{args.port}', server.pid
+
+        sampler = ServerSampler(server_pid)
+        report = {'endpoints': {}}
+        try:
+            for endpoint in endpoints:
+                payloads = build_payloads(endpoint, documents, args.batch_size)
+                # Une requête hors mesure : chargement des modèles et démarrage des pools
+                send(base_url, endpoint, payloads[0], args.timeout)
+                result = run_endpoint(base_url, endpoint, payloads, args, sampler)
+                report['endpoints'][endpoint] = result
+                latency = result['latency']
+                print(f"{endpoint:<14} {result['requests']:>5} requêtes  {result['throughput']['requests_per_second'] or 0:7.2f} req/s  "
+                      f"p50 {latency['p50'] or 0:.3f} s  p95 {latency['p95'] or 0:.3f} s  p99 {latency['p99'] or 0:.3f} s  "
+                      f"erreurs {result['error_rate'] or 0:.1%} ({result['rejected']} refusées)")
+                if result['server']:
+                    print(f"{'':<14} serveur : CPU {result['server']['cpu_percent']:.0f} % "
+                          f"({result['server']['processes']} processus), pic RSS "
+                          f"{result['server']['peak_rss_bytes'] / 1024 / 1024:.0f} Mo")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    report['meta'] = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'url': args.url,
+        'corpus': args.corpus or f'synthetic:{args.documents}x{args.seed}',
+        'documents': len(documents),
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'requests': args.requests,
+        'duration': args.duration,
+        'batch_size': args.batch_size,
+        'server_env': server_env if not args.url else None
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Rapport enregistré dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.tolerance)
+        print(f"Comparaison avec {args.baseline} :")
+        for line in lines:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Générateur de documents synthétiques (tickets, factures, relevés) avec leurs champs attendus
+
+Chaque document est rendu en image (PIL), avec en option du bruit, du flou et une rotation,
+et accompagné des valeurs que DataExtractor doit en extraire.
+
+Usage (jeu de fixtures sur disque) :
+    python benchmarks/synthetic_documents.py fixtures/ --documents 20 --noise 8 --blur 0.8 --skew 1.5
+"""
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+DOCUMENT_TYPES = ('ticket', 'facture', 'releve')
+
+COMMERCES = ['CARREFOUR MARKET', 'MONOPRIX', 'LECLERC', 'FRANPRIX', 'BOULANGERIE DUPONT', 'PHARMACIE CENTRALE']
+ARTICLES = ['PAIN DE MIE', 'LAIT DEMI ECREME', 'CAFE MOULU', 'POMMES GOLDEN', 'YAOURT NATURE', 'EAU MINERALE',
+            'BEURRE DOUX', 'PATES FUSILLI', 'JUS D ORANGE', 'FROMAGE RAPE']
+SOCIETES = ['ACME', 'DUPONT CONSEIL', 'BATI FRANCE', 'INFORMATIQUE PLUS', 'NETTOYAGE PRO']
+PRESTATIONS = ['Prestation de conseil', 'Maintenance annuelle', 'Fournitures de bureau', 'Installation reseau',
+               'Formation utilisateurs', 'Licence logicielle']
+BANQUES = ['BNP Paribas', 'Société Générale', 'Crédit Agricole', 'Banque Populaire', 'La Banque Postale']
+OPERATIONS = ['PRLV EDF', 'VIR SALAIRE', 'CB SUPERMARCHE', 'PRLV ASSURANCE', 'VIR LOYER', 'RETRAIT DAB']
+
+# Polices recherchées dans l'ordre ; à défaut, police bitmap de PIL
+FONT_CANDIDATES = ['DejaVuSansMono.ttf', 'DejaVuSans.ttf', 'LiberationMono-Regular.ttf', 'Arial.ttf']
+
+def _amount(value):
+    """Montant au format français (virgule)"""
+    return f'{value:.2f}'.replace('.', ',')
+
+def _date(rng, year=None):
+    """Date JJ/MM/AAAA aléatoire"""
+    return f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{year or rng.randint(2020, 2025)}'
+
+def _ticket(rng):
+    commerce = rng.choice(COMMERCES)
+    date = _date(rng)
+    heure = f'{rng.randint(8, 20):02d}:{rng.randint(0, 59):02d}'
+    lines = [commerce, f'{rng.randint(1, 99)} AVENUE DE LA REPUBLIQUE', f'{date} {heure}', '']
+    total = 0.0
+    for article in rng.sample(ARTICLES, rng.randint(3, 8)):
+        price = rng.randint(50, 1500) / 100
+        total += price
+        lines.append(f'{article:<20} {_amount(price):>8}')
+    tva = f'FR{rng.randint(10, 99)}{rng.randint(100000000, 999999999)}'
+    siret = f'{rng.randint(10 ** 13, 10 ** 14 - 1)}'
+    lines += [
+        '',
+        f'TOTAL: {_amount(total)}',
+        f'CB {_amount(total)}',
+        f'SIRET: {siret}',
+        f'TVA {tva}',
+        'MERCI DE VOTRE VISITE'
+    ]
+    truth = {
+        'commerce': commerce,
+        'date': date,
+        'heure': heure,
+        'montant_total': f'{total:.2f}',
+        'numero_tva': tva,
+        'siret': siret
+    }
+    return lines, truth
+
+def _facture(rng):
+    emetteur = f'{rng.choice(SOCIETES)} SARL'
+    numero = f'F{rng.randint(2020, 2025)}-{rng.randint(1, 9999):04d}'
+    date = _date(rng)
+    lines = [emetteur, f'{rng.randint(1, 99)} rue des Lilas 75011 Paris', '', f'Facture N° {numero}',
+             f'Date de facture: {date}', '']
+    total_ht = 0.0
+    for prestation in rng.sample(PRESTATIONS, rng.randint(2, 5)):
+        price = rng.randint(1000, 200000) / 100
+        total_ht += price
+        lines.append(f'{prestation:<30} {_amount(price):>10}')
+    total_ht = round(total_ht, 2)
+    tva = round(total_ht * 0.2, 2)
+    ttc = round(total_ht + tva, 2)
+    lines += ['', f'Total HT: {_amount(total_ht)}', f'Total TVA: {_amount(tva)}', f'Total TTC: {_amount(ttc)}',
+              '', 'Paiement à 30 jours']
+    truth = {
+        'emetteur': emetteur,
+        'num_facture': numero,
+        'date_facture': date,
+        'montant_ht': f'{total_ht:.2f}',
+        'montant_tva': f'{tva:.2f}',
+        'montant_ttc': f'{ttc:.2f}'
+    }
+    return lines, truth
+
+def _releve(rng):
+    banque = rng.choice(BANQUES)
+    year = rng.randint(2020, 2025)
+    month = rng.randint(1, 12)
+    date_debut = f'01/{month:02d}/{year}'
+    date_fin = f'28/{month:02d}/{year}'
+    compte = f'{rng.randint(10 ** 10, 10 ** 11 - 1)}'
+    lines = [banque, f'Relevé du {date_debut} au {date_fin}', f'Compte n° {compte}', '']
+    solde = rng.randint(10000, 500000) / 100
+    for _ in range(rng.randint(4, 10)):
+        amount = rng.randint(500, 150000) / 100
+        solde += amount if rng.random() < 0.3 else -amount
+        lines.append(f'{rng.randint(1, 28):02d}/{month:02d} {rng.choice(OPERATIONS):<24} {_amount(amount):>10}')
+    solde = round(solde, 2)
+    lines += ['', f'Nouveau solde: {_amount(solde)}']
+    truth = {
+        'banque': banque.title(),
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'numero_compte': compte,
+        'solde': f'{solde:.2f}'
+    }
+    return lines, truth
+
+_GENERATORS = {'ticket': _ticket, 'facture': _facture, 'releve': _releve}
+
+def generate_document(doc_type, rng):
+    """Renvoie (lignes de texte, champs attendus) d'un document synthétique"""
+    return _GENERATORS[doc_type](rng)
+
+def _load_font(size):
+    """Police TrueType disponible, sinon police par défaut de PIL"""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def render_document(lines, rng, font_size=28, noise=0.0, blur=0.0, skew=0.0):
+    """Rend les lignes en image PIL en niveaux de gris, avec dégradations facultatives
+
+    noise : écart-type du bruit gaussien (niveaux de gris), blur : rayon du flou gaussien,
+    skew : rotation maximale en degrés (angle tiré au hasard entre -skew et +skew).
+    """
+    font = _load_font(font_size)
+    line_height = int(font_size * 1.5)
+    margin = font_size * 2
+    width = margin * 2 + int(max(font.getlength(line) for line in lines))
+    height = margin * 2 + line_height * len(lines)
+
+    img = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, fill=0, font=font)
+
+    if skew:
+        img = img.rotate(rng.uniform(-skew, skew), resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if blur:
+        img = img.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(img, dtype=np.float32)
+        pixels += np.random.default_rng(rng.randrange(2 ** 32)).normal(0, noise, pixels.shape)
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return img
+
+def write_fixtures(output_dir, documents=10, seed=42, doc_types=DOCUMENT_TYPES, **degradations):
+    """Écrit documents images par type et ground_truth.json ; renvoie la liste des entrées"""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    entries = []
+    for doc_type in doc_types:
+        for i in range(documents):
+            lines, truth = generate_document(doc_type, rng)
+            filename = f'{doc_type}_{i:04d}.png'
+            render_document(lines, rng, **degradations).save(os.path.join(output_dir, filename))
+            entries.append({'file': filename, 'type': doc_type, 'text': '\n'.join(lines), 'fields': truth})
+
+    with open(os.path.join(output_dir, 'ground_truth.json'), 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'degradations': degradations, 'documents': entries}, f, ensure_ascii=False, indent=2)
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--documents', type=int, default=10, help="Documents par type")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument('--blur', type=float, default=0.0)
+    parser.add_argument('--skew', type=float, default=0.0)
+    args = parser.parse_args()
+
+    entries = write_fixtures(args.output_dir, args.documents, args.seed,
+                             noise=args.noise, blur=args.blur, skew=args.skew)
+    print(f"{len(entries)} documents écrits dans {args.output_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Traitement en masse d'une arborescence de documents, en ligne de commande
+
+Parcourt un dossier, répartit les fichiers sur N processus (OCREngine + DataExtractor, via
+BatchProcessor) et écrit les résultats au fil de l'eau dans des fichiers de sortie découpés en
+tranches (OutputManager). Un manifeste SQLite garde la trace de chaque fichier traité : une
+exécution interrompue ou arrêtée brutalement reprend là où elle s'était arrêtée, seule la
+tranche en cours au moment de l'arrêt est refaite.
+
+Usage :
+    python bulk_process.py archives/ --workers 8 --format jsonl --run-name reprise_2023 \\
+        [--doc-type auto] [--chunk-size 5000] [--retry-errors] [--preload]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+
+from batch_processor import BatchProcessor
+from image_decode import DEFAULT_MEMORY_BUDGET_MB
+from output_manager import OutputManager, WRITERS, text_store_path
+
+# Extensions traitées (mêmes formats que l'application web)
+EXTENSIONS = {'png', 'jpg', 'jpeg', 'tif', 'tiff', 'pdf'}
+
+# Dossier des manifestes de reprise (bases internes, comme l'application web)
+DATA_FOLDER = 'data'
+
+# Documents par fichier de sortie : au plus une tranche est refaite après un arrêt brutal
+DEFAULT_CHUNK_SIZE = 5000
+
+# Intervalle (secondes) entre deux lignes de progression, et fenêtre du débit utilisé pour l'ETA
+PROGRESS_INTERVAL = 10
+RATE_WINDOW = 120
+
+# Lignes du manifeste écrites entre deux validations SQLite
+COMMIT_EVERY = 200
+
+class Manifest:
+    def __init__(self, db_path):
+        """Manifeste de reprise : fichiers traités (statut, tranche de sortie) et tranches finalisées"""
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._uncommitted = 0
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                chunk INTEGER,
+                error TEXT,
+                finished_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                finalized INTEGER NOT NULL DEFAULT 0,
+                documents INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._conn.commit()
+
+    def recover(self, output_manager):
+        """Reprise après un arrêt brutal : renvoie le nombre de fichiers à refaire
+
+        Une tranche non finalisée dont le fichier de sortie existe a été remplacée de façon
+        atomique juste avant l'arrêt : elle est complète. Sinon ses documents sont perdus (fichier
+        partiel) et seront retraités.
+        """
+        reset = 0
+        chunks = self._conn.execute('SELECT chunk, filename FROM chunks WHERE finalized = 0').fetchall()
+        for chunk, filename in chunks:
+            if os.path.exists(os.path.join(output_manager.output_dir, filename)):
+                count = self._conn.execute('SELECT COUNT(*) FROM files WHERE chunk = ?', (chunk,)).fetchone()[0]
+                self._conn.execute('UPDATE chunks SET finalized = 1, documents = ? WHERE chunk = ?', (count, chunk))
+                continue
+            reset += self._conn.execute('DELETE FROM files WHERE chunk = ?', (chunk,)).rowcount
+            self._conn.execute('DELETE FROM chunks WHERE chunk = ?', (chunk,))
+            partial_path = os.path.join(output_manager.partial_dir, filename + '.part')
+            # Textes d'une sortie typée finalisés juste avant l'arrêt, sans leur fichier principal
+            text_path = text_store_path(os.path.join(output_manager.output_dir, filename))
+            for path in (partial_path, text_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._conn.commit()
+        return reset
+
+    def processed(self):
+        """Fichiers déjà traités : {chemin relatif: (taille, date de modification, statut)}"""
+        return {path: (size, mtime_ns, status)
+                for path, size, mtime_ns, status in self._conn.execute('SELECT path, size, mtime_ns, status FROM files')}
+
+    def open_chunk(self, prefix, extension):
+        """Déclare une nouvelle tranche de sortie et renvoie (numéro, nom du fichier)"""
+        chunk = self._conn.execute("INSERT INTO chunks (filename) VALUES ('')").lastrowid
+        filename = f'{prefix}_{chunk:06d}{extension}'
+        self._conn.execute('UPDATE chunks SET filename = ? WHERE chunk = ?', (filename, chunk))
+        self._conn.commit()
+        return chunk, filename
+
+    def finalize_chunk(self, chunk, documents):
+        """Marque une tranche comme complète (fichier de sortie finalisé)"""
+        self._conn.execute('UPDATE chunks SET finalized = 1, documents = ? WHERE chunk = ?', (documents, chunk))
+        self.commit()
+
+    def drop_chunk(self, chunk):
+        """Supprime une tranche vide"""
+        self._conn.execute('DELETE FROM chunks WHERE chunk = ?', (chunk,))
+        self._conn.commit()
+
+    def record(self, path, size, mtime_ns, status, chunk=None, error=None):
+        """Enregistre le résultat d'un fichier (validé par lots)"""
+        self._conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (path, size, mtime_ns, status, chunk, error, time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """Valide les lignes en attente"""
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+def iter_documents(root):
+    """Parcourt l'arborescence dans un ordre stable et génère les chemins des documents"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if '.' in name and name.rsplit('.', 1)[1].lower() in EXTENSIONS:
+                yield os.path.join(dirpath, name)
+
+def plan(root, processed, retry_errors):
+    """Fichiers restant à traiter : {chemin: (chemin relatif, taille, date de modification)}
+
+    Un fichier déjà traité est ignoré, sauf s'il a été modifié depuis ou s'il était en erreur
+    (avec retry_errors).
+    """
+    pending = {}
+    skipped = 0
+    for path in iter_documents(root):
+        stat = os.stat(path)
+        relative = os.path.relpath(path, root)
+        previous = processed.get(relative)
+        if (previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns)
+                and (previous[2] == 'success' or not retry_errors)):
+            skipped += 1
+            continue
+        pending[path] = (relative, stat.st_size, stat.st_mtime_ns)
+    return pending, skipped
+
+def format_duration(seconds):
+    """Durée lisible (h, min, s)"""
+    if seconds is None:
+        return '?'
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+class Progress:
+    def __init__(self, total, interval=PROGRESS_INTERVAL):
+        """Suivi de l'avancement : débit sur une fenêtre glissante et temps restant estimé"""
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.errors = 0
+        self.start = time.monotonic()
+        self._last_report = self.start
+        self._recent = deque()
+
+    def update(self, status):
+        now = time.monotonic()
+        self.done += 1
+        self.errors += status != 'success'
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > RATE_WINDOW:
+            self._recent.popleft()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(now)
+
+    def rate(self, now=None):
+        """Documents par seconde sur la fenêtre récente (sur toute l'exécution au démarrage)"""
+        now = now or time.monotonic()
+        window = min(RATE_WINDOW, now - self.start)
+        return len(self._recent) / window if window > 0 else 0.0
+
+    def report(self, now=None):
+        rate = self.rate(now)
+        remaining = self.total - self.done
+        eta = remaining / rate if rate else None
+        percent = self.done / self.total if self.total else 1.0
+        print(f'{self.done}/{self.total} ({percent:.1%}) | {rate:.2f} docs/s | '
+              f'{self.errors} erreurs | reste {format_duration(eta)}', file=sys.stderr, flush=True)
+
+class ChunkedOutput:
+    def __init__(self, output_manager, manifest, output_format, run_name, chunk_size):
+        """Fichiers de sortie successifs de chunk_size documents, déclarés dans le manifeste"""
+        self.output_manager = output_manager
+        self.manifest = manifest
+        self.output_format = output_format
+        self.run_name = run_name
+        self.chunk_size = chunk_size
+        self.writer = None
+        self.chunk = None
+        self.files = []
+
+    def write(self, data):
+        """Ajoute un document et renvoie le numéro de sa tranche"""
+        if self.writer is None:
+            self.chunk, filename = self.manifest.open_chunk(self.run_name, WRITERS[self.output_format].extension)
+            self.writer = self.output_manager.open_writer(self.output_format, filename)
+        self.writer.write(data)
+        return self.chunk
+
+    def rotate(self):
+        """Finalise la tranche en cours si elle est pleine"""
+        if self.writer is not None and self.writer.count >= self.chunk_size:
+            self.close()
+
+    def close(self):
+        """Finalise la tranche en cours (fichier de sortie, puis manifeste)"""
+        if self.writer is None:
+            return
+        # Lignes du manifeste validées avant le remplacement atomique : une tranche dont le
+        # fichier existe a toujours tous ses documents dans le manifeste
+        self.manifest.commit()
+        if self.writer.count:
+            self.files.append(self.writer.close())
+            self.manifest.finalize_chunk(self.chunk, self.writer.count)
+        else:
+            self.writer.abort()
+            self.manifest.drop_chunk(self.chunk)
+        self.writer = None
+        self.chunk = None
+
+def run(args):
+    """Traite l'arborescence ; renvoie le code de sortie (130 si interrompu)"""
+    output_manager = OutputManager(args.output_dir)
+    manifest_path = args.manifest or os.path.join(DATA_FOLDER, f'{args.run_name}_manifest.db')
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    manifest = Manifest(manifest_path)
+
+    reset = manifest.recover(output_manager)
+    if reset:
+        print(f'{reset} documents d\'une tranche inachevée seront retraités', file=sys.stderr)
+
+    pending, skipped = plan(args.root, manifest.processed(), args.retry_errors)
+    print(f'{len(pending)} documents à traiter, {skipped} déjà traités (manifeste {manifest_path})',
+          file=sys.stderr, flush=True)
+
+    processor = BatchProcessor(args.workers, lang=args.lang, backend=args.backend, profile=args.profile,
+                               memory_budget_mb=args.memory_budget, text_regions=args.text_regions,
+                               cascade=tuple(args.cascade.split(',')) if args.cascade else None,
+                               preload=args.preload)
+    output = ChunkedOutput(output_manager, manifest, args.format, args.run_name, args.chunk_size)
+    progress = Progress(len(pending), args.progress_interval)
+    interrupted = False
+    # Délai avant le premier résultat : démarrage à froid des processus de travail compris
+    first_result = None
+
+    try:
+        for filepath, outcome in processor.iter_unordered(((path, None) for path in pending), args.doc_type):
+            if first_result is None:
+                first_result = time.monotonic() - progress.start
+            relative, size, mtime_ns = pending[filepath]
+            if outcome['status'] == 'success':
+                chunk = output.write(outcome['data'])
+                manifest.record(relative, size, mtime_ns, 'success', chunk)
+                output.rotate()
+            else:
+                manifest.record(relative, size, mtime_ns, 'error', error=outcome['message'])
+            progress.update(outcome['status'])
+    except KeyboardInterrupt:
+        # Les documents terminés sont conservés ; ceux en cours seront repris à la prochaine exécution
+        interrupted = True
+        print('Interruption : tranche en cours finalisée, relancer la même commande pour reprendre',
+              file=sys.stderr)
+    finally:
+        output.close()
+        manifest.close()
+        processor.shutdown()
+
+    progress.report()
+    elapsed = time.monotonic() - progress.start
+    print(f'{progress.done} documents en {format_duration(elapsed)} '
+          f'({progress.done / elapsed if elapsed else 0:.2f} docs/s), {progress.errors} erreurs', file=sys.stderr)
+    if first_result is not None:
+        print(f'Premier résultat après {first_result:.2f} s', file=sys.stderr)
+    for filepath in output.files:
+        print(filepath)
+    return 130 if interrupted else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('root', help="Dossier à parcourir (sous-dossiers compris)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processus de traitement")
+    parser.add_argument('--doc-type', default='auto', help="Type de document (ticket, facture, releve ou auto)")
+    parser.add_argument('--format', default='jsonl', choices=sorted(WRITERS), help="Format des fichiers de sortie")
+    parser.add_argument('--output-dir', default='output', help="Dossier des fichiers de sortie")
+    parser.add_argument('--run-name', default='bulk', help="Nom de l'exécution (préfixe des sorties et du manifeste)")
+    parser.add_argument('--manifest', help="Manifeste de reprise (par défaut data/<run-name>_manifest.db)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Documents par fichier de sortie")
+    parser.add_argument('--retry-errors', action='store_true', help="Retraiter les fichiers en erreur")
+    parser.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL)
+    parser.add_argument('--lang', default='fra+eng')
+    parser.add_argument('--backend', default='auto', help="Backend Tesseract")
+    parser.add_argument('--profile', default='balanced', help="Profil de prétraitement")
+    parser.add_argument('--cascade', help="Cascade de profils, par exemple fast,balanced,quality")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="Mémoire de travail par document et par processus (Mo)")
+    parser.add_argument('--text-regions', action='store_true', help="OCR limité aux blocs de texte détectés")
+    parser.add_argument('--preload', action='store_true',
+                        help="Processus forkés depuis un serveur où OpenCV et Tesseract sont déjà chargés")
+    args = parser.parse_args()
+    sys.exit(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import re
+
+from extraction_rules import fold_text
+
+# Indices par type de document : (motif en minuscules, poids). Un indice compte une fois s'il est présent.
+CLASSIFIER_FEATURES = {
+    'ticket': [
+        # "Caisse d'Épargne" est une banque (indice de relevé), pas une caisse enregistreuse
+        (r"\bticket\b|\bcaisse\b(?!\s+d['’]?\s*[eé]pargne)", 2),
+        (r'\bcb\b|carte bancaire|sans contact|esp[eè]ces|rendu monnaie', 2),
+        (r'merci de votre visite|[aà] bient[oô]t|merci et [aà] bient[oô]t', 2),
+        (r'\d{1,2}[:h]\d{2}', 1),
+        (r'\btotal\b', 1),
+        (r'\bqt[eé]\b|\barticles?\b', 1)
+    ],
+    'facture': [
+        (r'\bfacture\b', 3),
+        (r'\bh\.?t\.?\b', 2),
+        (r'\bt\.?t\.?c\.?\b', 1),
+        (r'siret|siren|tva intracom|n° tva', 1),
+        (r'[eé]ch[eé]ance|conditions de paiement|r[eè]glement', 2),
+        (r'\b(?:sarl|sas|sasu|eurl)\b', 1)
+    ],
+    'releve': [
+        (r'relev[eé] de compte|relev[eé] du|p[eé]riode du', 3),
+        (r'banque populaire|cr[eé]dit agricole|bnp paribas|soci[eé]t[eé] g[eé]n[eé]rale|caisse d[\'’]?\s*[eé]pargne'
+         r'|cr[eé]dit mutuel|\blcl\b|la banque postale|\bcic\b|hsbc|boursorama|fortuneo|monabanq'
+         r'|hello bank|\bn26\b|revolut', 2),
+        (r'\biban\b|\bbic\b|\brib\b', 2),
+        (r'solde', 2),
+        (r'\bvir(?:ement)?\b|\bprlv\b|pr[eé]l[eè]vement', 1),
+        (r'\bd[eé]bit\b|\bcr[eé]dit\b', 1)
+    ]
+}
+
+# Type retenu quand aucun indice n'est trouvé (ancien défaut du formulaire)
+DEFAULT_TYPE = 'ticket'
+
+_compiled_features = {
+    doc_type: [(re.compile(pattern), weight) for pattern, weight in features]
+    for doc_type, features in CLASSIFIER_FEATURES.items()
+}
+
+def register_type_features(doc_type, features):
+    """Déclare les indices de classification d'un nouveau type de document"""
+    CLASSIFIER_FEATURES[doc_type] = list(features)
+    _compiled_features[doc_type] = [(re.compile(pattern), weight) for pattern, weight in features]
+
+def score_text(text, folded=None):
+    """Renvoie le score de chaque type de document pour un texte déjà extrait"""
+    if folded is None:
+        folded = fold_text(text)
+    if folded is None:
+        folded = text.lower()
+
+    return {
+        doc_type: sum(weight for pattern, weight in features if pattern.search(folded))
+        for doc_type, features in _compiled_features.items()
+    }
+
+def classify_text(text, folded=None):
+    """Choisit le type de document et renvoie (type, confiance entre 0 et 1)"""
+    scores = score_text(text, folded)
+    total = sum(scores.values())
+    if total == 0:
+        return DEFAULT_TYPE, 0.0
+
+    doc_type = max(scores, key=scores.get)
+    return doc_type, scores[doc_type] / total
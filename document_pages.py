@@ -0,0 +1,121 @@
+import io
+import os
+
+# Formats pouvant contenir plusieurs pages
+MULTIPAGE_EXTENSIONS = {'pdf', 'tif', 'tiff'}
+
+# Résolution de rastérisation des PDF (Tesseract est calibré pour ~300 DPI)
+DEFAULT_PDF_DPI = 300
+
+# Nombre minimal de caractères alphanumériques pour considérer qu'une page PDF a une couche texte
+MIN_TEXT_LAYER_CHARS = 20
+
+def file_extension(path):
+    """Renvoie l'extension du fichier en minuscules, sans le point"""
+    return os.path.splitext(path)[1].lower().lstrip('.')
+
+def is_multipage(path):
+    """Indique si le fichier doit être traité page par page"""
+    return file_extension(path) in MULTIPAGE_EXTENSIONS
+
+def iter_pages(path, dpi=DEFAULT_PDF_DPI):
+    """Génère les pages d'un document une par une, en niveaux de gris (une seule page en mémoire)"""
+    for _, img in iter_page_sources(path, dpi, use_text_layer=False):
+        yield img
+
+def iter_page_sources(path, dpi=DEFAULT_PDF_DPI, use_text_layer=True, data=None):
+    """Génère (source, contenu) pour chaque page : ('text_layer', texte) ou ('ocr', image en niveaux de gris)
+
+    Les pages PDF qui ont une couche texte exploitable ne sont pas rastérisées. Avec data
+    (octets du fichier), le document est lu en mémoire et path ne sert qu'à connaître le format.
+    """
+    extension = file_extension(path)
+    if extension == 'pdf':
+        yield from _iter_pdf_pages(path, dpi, use_text_layer, data)
+        return
+
+    for img in _iter_image_pages(path, extension, data):
+        yield 'ocr', img
+
+def _iter_image_pages(path, extension, data=None):
+    """Décode les pages d'un fichier image (une seule, ou plusieurs pour un TIFF)"""
+    if extension in ('tif', 'tiff'):
+        yield from _iter_tiff_pages(path if data is None else io.BytesIO(data))
+    else:
+        import cv2
+        import numpy as np
+
+        if data is None:
+            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        else:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Impossible de lire l'image {path}")
+        yield img
+
+def _iter_tiff_pages(source):
+    """Décode les pages d'un TIFF multi-pages une à une (chemin ou fichier en mémoire)"""
+    import numpy as np
+    from PIL import Image, ImageSequence
+
+    with Image.open(source) as tiff:
+        for frame in ImageSequence.Iterator(tiff):
+            yield np.array(frame.convert('L'))
+
+def has_text_layer(text):
+    """Indique si le texte extrait d'une page PDF est suffisant pour se passer de l'OCR"""
+    return sum(1 for char in text if char.isalnum()) >= MIN_TEXT_LAYER_CHARS
+
+def _iter_pdf_pages(path, dpi, use_text_layer, data=None):
+    """Parcourt les pages d'un PDF une à une : couche texte si présente, sinon rastérisation
+    (pypdfium2, ou pdf2image/poppler sans détection de couche texte)"""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(path if data is None else data)
+        try:
+            for index in range(len(pdf)):
+                page = pdf[index]
+                try:
+                    if use_text_layer:
+                        textpage = page.get_textpage()
+                        try:
+                            text = textpage.get_text_range().replace('\r\n', '\n')
+                        finally:
+                            textpage.close()
+                        if has_text_layer(text):
+                            yield 'text_layer', text
+                            continue
+
+                    bitmap = page.render(scale=dpi / 72, grayscale=True)
+                    array = bitmap.to_numpy()
+                    if array.ndim == 3:
+                        array = array[:, :, 0]
+                    # Copie : le tampon du bitmap est libéré avec la page
+                    yield 'ocr', array.copy()
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+        return
+
+    try:
+        from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+    except ImportError:
+        raise ImportError("La lecture des PDF nécessite pypdfium2 ou pdf2image (pip install pypdfium2)")
+
+    if data is None:
+        page_count = pdfinfo_from_path(path)['Pages']
+    else:
+        page_count = pdfinfo_from_bytes(data)['Pages']
+    import numpy as np
+
+    for number in range(1, page_count + 1):
+        if data is None:
+            page = convert_from_path(path, dpi=dpi, first_page=number, last_page=number, grayscale=True)[0]
+        else:
+            page = convert_from_bytes(data, dpi=dpi, first_page=number, last_page=number, grayscale=True)[0]
+        yield 'ocr', np.array(page.convert('L'))
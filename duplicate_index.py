@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+# Distance de Hamming maximale (sur 128 bits) pour considérer deux images comme le même document
+DEFAULT_MAX_DISTANCE = 6
+
+def perceptual_hash(gray):
+    """Empreinte perceptuelle 128 bits d'une image en niveaux de gris : pHash (DCT) et dHash (gradients)
+
+    Les deux empreintes sont peu sensibles à la résolution, à la compression et aux petits écarts
+    de cadrage ou d'exposition : deux photos du même ticket restent proches.
+    """
+    import cv2
+    import numpy as np
+
+    # pHash : signe des basses fréquences de la DCT par rapport à leur médiane
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    phash_bits = low > np.median(low[1:])
+
+    # dHash : sens du gradient horizontal sur une vignette 9 x 8
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash_bits = (tiny[:, 1:] > tiny[:, :-1]).flatten()
+
+    value = 0
+    for bit in np.concatenate([phash_bits, dhash_bits]):
+        value = (value << 1) | int(bit)
+    return value
+
+def image_hash(image_bytes):
+    """Empreinte perceptuelle d'une image encodée (décodage réduit : seules les basses fréquences comptent)"""
+    import cv2
+    import numpy as np
+
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    return perceptual_hash(gray)
+
+def content_digest(image_bytes):
+    """Empreinte exacte des octets d'un fichier : confirme qu'un quasi-doublon est bien le même fichier"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def hamming(a, b):
+    """Nombre de bits différents entre deux empreintes"""
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Arbre BK : recherche des empreintes à distance de Hamming bornée sans tout parcourir"""
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        """Ajoute une empreinte et l'élément associé"""
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Renvoie [(distance, élément)] des empreintes à au plus max_distance, les plus proches d'abord"""
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            # Inégalité triangulaire : seuls ces sous-arbres peuvent contenir une empreinte proche
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+class DuplicateIndex:
+    def __init__(self, db_path, max_distance=DEFAULT_MAX_DISTANCE):
+        """Index des empreintes perceptuelles des documents traités (SQLite + arbre BK en mémoire)"""
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self._last_rowid = 0
+        self._init_db()
+        self._refresh()
+
+    def _connect(self):
+        """Ouvre une connexion SQLite"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        """Crée la table des empreintes si nécessaire"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    doc_id TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            # Bases créées avant l'empreinte exacte : colonne ajoutée en place (NULL pour les anciens documents)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(image_hashes)')}
+            if 'digest' not in columns:
+                conn.execute('ALTER TABLE image_hashes ADD COLUMN digest TEXT')
+
+    def _refresh(self):
+        """Charge dans l'arbre les empreintes ajoutées depuis le dernier chargement (autres processus compris)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT rowid, doc_id, hash FROM image_hashes WHERE rowid > ? ORDER BY rowid', (self._last_rowid,)
+            ).fetchall()
+        with self._lock:
+            for rowid, doc_id, value in rows:
+                if rowid > self._last_rowid:
+                    self._tree.add(int(value, 16), doc_id)
+                    self._last_rowid = rowid
+
+    def add(self, value, doc_id, digest=None):
+        """Enregistre l'empreinte perceptuelle (et l'empreinte exacte) d'un document traité"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO image_hashes (doc_id, hash, created_at, digest) VALUES (?, ?, ?, ?)',
+                         (doc_id, format(value, 'x'), time.time(), digest))
+        self._refresh()
+
+    def same_content(self, doc_id, digest):
+        """Vrai si le document indexé doc_id a exactement les octets d'empreinte digest"""
+        if digest is None:
+            return False
+        with self._connect() as conn:
+            row = conn.execute('SELECT digest FROM image_hashes WHERE doc_id = ?', (doc_id,)).fetchone()
+        return row is not None and row[0] == digest
+
+    def find(self, value):
+        """Renvoie (doc_id, distance) du document le plus proche à au plus max_distance, ou None"""
+        self._refresh()
+        with self._lock:
+            matches = self._tree.search(value, self.max_distance)
+        if not matches:
+            return None
+        distance, doc_id = matches[0]
+        return doc_id, distance
+
+    def stats(self):
+        """Nombre d'empreintes indexées"""
+        with self._lock:
+            return {'entries': self._tree.size, 'max_distance': self.max_distance}
@@ -0,0 +1,152 @@
+import cProfile
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# Estimation du Retry-After : bornes (secondes) et poids de la dernière mesure dans la moyenne glissante
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+SERVICE_TIME_SMOOTHING = 0.2
+
+class PoolBusy(Exception):
+    """Capacité de traitement saturée : la requête est refusée immédiatement (429 ou 503 + Retry-After)"""
+    def __init__(self, message, retry_after=MIN_RETRY_AFTER, status=429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+def omp_threads_per_engine(size, cpus=None):
+    """Threads OpenMP par moteur pour que size moteurs simultanés n'occupent pas plus que cpus cœurs
+
+    cpus : part des cœurs réservée au pool (par défaut tous les cœurs de la machine).
+    """
+    return max(1, (cpus or os.cpu_count() or 1) // size)
+
+class EnginePool:
+    def __init__(self, factory, size, max_waiting, wait_timeout, warm=False, cpus=None):
+        """Pool de moteurs OCR préinitialisés, à concurrence fixe et file d'attente bornée
+
+        Chaque moteur vit dans son propre thread (les instances Tesseract sont par thread) et
+        traite une requête à la fois. Au-delà de size requêtes en cours et max_waiting en attente,
+        run() lève PoolBusy (429) ; une requête qui attend plus de wait_timeout secondes est
+        abandonnée avec PoolBusy (503). Avec warm, tous les moteurs sont chargés en arrière-plan dès
+        la création du pool ; sinon chaque thread charge le sien à sa première requête. Si la
+        création d'un moteur échoue, l'erreur est renvoyée à la requête et la création réessayée
+        à la suivante. cpus : cœurs réservés au pool (partagés avec le traitement par lot).
+        """
+        self.size = size
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        # Tesseract (OpenMP) limité à sa part des cœurs : lu au chargement de libtesseract et
+        # hérité par les sous-processus pytesseract ; OMP_THREAD_LIMIT défini par l'exploitant prime
+        os.environ.setdefault('OMP_THREAD_LIMIT', str(omp_threads_per_engine(size, cpus)))
+        self._factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Durée moyenne d'un traitement (moyenne glissante), pour estimer le Retry-After
+        self._service_time = None
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='ocr-engine',
+                                            initializer=self._init_thread)
+        if warm:
+            self._warm_up()
+
+    def _init_thread(self):
+        """Crée le moteur du thread et charge Tesseract avant la première requête"""
+        try:
+            self._engine()
+        except Exception:
+            # Moteur impossible à créer (OpenCV, Tesseract) : un initialiseur en échec casserait le
+            # pool pour toujours ; l'erreur est renvoyée par les requêtes et la création réessayée
+            pass
+
+    def _engine(self):
+        """Moteur du thread courant, créé à la première utilisation"""
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = self._factory()
+            self._local.engine = engine
+            try:
+                engine.warm_up()
+            except Exception:
+                # Tesseract indisponible : l'erreur sera renvoyée par la première requête
+                pass
+        return engine
+
+    def _warm_up(self):
+        """Démarre tous les threads du pool (sans attendre la fin du préchargement)"""
+        barrier = threading.Barrier(self.size)
+        for _ in range(self.size):
+            # Chaque tâche occupe un thread jusqu'à ce que tous soient créés
+            self._executor.submit(barrier.wait, self.wait_timeout)
+
+    def retry_after(self):
+        """Délai suggéré avant de réessayer : temps d'écoulement de la file au débit actuel"""
+        with self._lock:
+            if self._service_time is None:
+                return MIN_RETRY_AFTER
+            estimate = self._service_time * (self._pending + 1) / self.size
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(estimate)))
+
+    def stats(self):
+        """Moteurs, requêtes en cours ou en attente et durée moyenne d'un traitement"""
+        with self._lock:
+            return {'size': self.size, 'max_waiting': self.max_waiting, 'pending': self._pending,
+                    'service_time': self._service_time}
+
+    def _run(self, started, queued_at, func, args, profiles):
+        started.set()
+        metrics.observe('ocr_pool_wait_seconds', time.perf_counter() - queued_at)
+        profiler = None
+        if profiles is not None:
+            # Profil du thread du moteur, où se fait l'OCR (le thread de la requête ne fait qu'attendre)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ : un seul profileur actif à la fois, déjà pris par le thread de la requête
+                profiler = None
+        start = time.perf_counter()
+        try:
+            return func(self._engine(), *args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiles.append(profiler)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                if self._service_time is None:
+                    self._service_time = elapsed
+                else:
+                    self._service_time += SERVICE_TIME_SMOOTHING * (elapsed - self._service_time)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def run(self, func, *args, profiles=None):
+        """Exécute func(moteur, *args) sur un moteur du pool et renvoie son résultat
+
+        profiles : liste à laquelle ajouter le profil cProfile du thread du moteur pendant func
+        (requêtes échantillonnées par le profilage).
+        """
+        with self._lock:
+            full = self._pending >= self.size + self.max_waiting
+            if not full:
+                self._pending += 1
+        if full:
+            metrics.inc('ocr_pool_rejected_total', reason='queue_full')
+            raise PoolBusy("File d'attente OCR pleine, réessayez plus tard", self.retry_after(), 429)
+
+        started = threading.Event()
+        future = self._executor.submit(self._run, started, time.perf_counter(), func, args, profiles)
+        future.add_done_callback(self._done)
+        # Toujours en file après wait_timeout : la requête est retirée de la file et refusée
+        if not started.wait(self.wait_timeout) and future.cancel():
+            metrics.inc('ocr_pool_rejected_total', reason='timeout')
+            raise PoolBusy('Moteurs OCR saturés, réessayez plus tard', self.retry_after(), 503)
+        return future.result()
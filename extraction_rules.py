@@ -0,0 +1,91 @@
+import re
+
+# Caractères dont la majuscule est une lettre ASCII alors que la minuscule ne l'est pas :
+# re.IGNORECASE les rapproche de i et s, text.lower() non
+_UNSAFE_FOLD_CHARS = ('\u0131', '\u017f')
+
+def fold_text(text):
+    """Texte en minuscules pour la recherche rapide, ou None si le repli de casse n'est pas sûr
+
+    Rechercher un motif en minuscules, sensible à la casse, dans text.lower() trouve les
+    mêmes positions que le même motif avec re.IGNORECASE dans le texte d'origine, tout en
+    profitant de la recherche rapide de préfixe littéral de re (désactivée avec IGNORECASE).
+    """
+    folded = text.lower()
+    # Les positions doivent se correspondre caractère par caractère
+    if len(folded) != len(text) or any(char in text for char in _UNSAFE_FOLD_CHARS):
+        return None
+    return folded
+
+class FieldRule:
+    def __init__(self, fields, patterns, groups=(1,), flags=re.IGNORECASE, transform=None):
+        """Règle d'extraction d'un ou plusieurs champs à partir de motifs essayés par ordre de priorité
+
+        Les motifs sont compilés une seule fois, à l'import. Les motifs insensibles à la casse
+        doivent être écrits en minuscules : ils sont aussi compilés sans IGNORECASE pour être
+        recherchés dans le texte replié (voir fold_text).
+        """
+        self.fields = (fields,) if isinstance(fields, str) else tuple(fields)
+        self.groups = groups
+        self.transform = transform
+        self.patterns = [re.compile(pattern, flags) for pattern in patterns]
+        self.folded_patterns = None
+        if flags & re.IGNORECASE:
+            self.folded_patterns = [re.compile(pattern, flags & ~re.IGNORECASE) for pattern in patterns]
+
+    def search(self, text, folded=None):
+        """Renvoie la correspondance du premier motif trouvé (équivalent des re.search successifs)"""
+        if folded is None or self.folded_patterns is None:
+            for pattern in self.patterns:
+                match = pattern.search(text)
+                if match:
+                    return match
+            return None
+
+        for pattern, folded_pattern in zip(self.patterns, self.folded_patterns):
+            folded_match = folded_pattern.search(folded)
+            if folded_match:
+                # Les groupes sont relus dans le texte d'origine, à la même position
+                return pattern.match(text, folded_match.start()) or pattern.search(text)
+        return None
+
+    def apply(self, text, data, folded=None):
+        """Applique la règle et complète le dictionnaire de données"""
+        match = self.search(text, folded)
+        if match:
+            for field, group in zip(self.fields, self.groups):
+                value = match.group(group)
+                data[field] = self.transform(value) if self.transform else value
+
+class FunctionRule:
+    def __init__(self, func):
+        """Règle libre : func(text, data) complète le dictionnaire de données"""
+        self.func = func
+
+    def apply(self, text, data, folded=None):
+        self.func(text, data)
+
+# Registre des types de documents : nom -> liste de règles appliquées dans l'ordre
+DOCUMENT_TYPES = {}
+
+# Champs clés de chaque type : s'ils manquent, l'OCR est jugé insuffisant (cascade de prétraitement)
+KEY_FIELDS = {}
+
+def register_document_type(name, rules, key_fields=()):
+    """Déclare un type de document, ses règles (FieldRule ou fonction (text, data)) et ses champs clés"""
+    DOCUMENT_TYPES[name] = [rule if isinstance(rule, FieldRule) else FunctionRule(rule) for rule in rules]
+    KEY_FIELDS[name] = tuple(key_fields)
+
+def get_document_rules(name):
+    """Renvoie les règles d'un type de document"""
+    if name not in DOCUMENT_TYPES:
+        raise ValueError(f"Type de document non pris en charge: {name}")
+    return DOCUMENT_TYPES[name]
+
+def to_decimal(value):
+    """Montant au format décimal avec point"""
+    return value.replace(',', '.')
+
+def without_spaces(value):
+    """Supprime les espaces (numéros TVA, SIRET)"""
+    return value.replace(' ', '')
@@ -0,0 +1,102 @@
+import io
+
+# Budget mémoire de travail par document et par processus (Mo)
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# Décodage JPEG/PNG directement en niveaux de gris, à pleine résolution ou réduite d'un facteur 2, 4 ou 8
+# (noms des drapeaux cv2 : OpenCV n'est chargé qu'au premier décodage)
+REDUCED_GRAYSCALE_FLAGS = {
+    1: 'IMREAD_GRAYSCALE',
+    2: 'IMREAD_REDUCED_GRAYSCALE_2',
+    4: 'IMREAD_REDUCED_GRAYSCALE_4',
+    8: 'IMREAD_REDUCED_GRAYSCALE_8'
+}
+
+# Une réduction n'est gardée que si le texte reste au moins à cette fraction de la hauteur cible
+MIN_TEXT_HEIGHT_RATIO = 0.75
+
+def image_size(image_bytes):
+    """Dimensions (largeur, hauteur) lues dans l'en-tête, sans décoder l'image, ou None"""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            return img.size
+    except Exception:
+        return None
+
+def choose_reduction(width, height, memory_budget):
+    """Plus petit facteur de réduction pour lequel le prétraitement tient dans le budget"""
+    from preprocessing import pipeline_bytes
+
+    for factor in sorted(REDUCED_GRAYSCALE_FLAGS):
+        if pipeline_bytes(width // factor, height // factor) <= memory_budget:
+            return factor
+    return max(REDUCED_GRAYSCALE_FLAGS)
+
+def decode_grayscale(image_bytes, memory_budget=None, target_text_height=None):
+    """Décode une image en niveaux de gris, réduite si elle dépasse le budget mémoire
+
+    Renvoie (image, facteur de réduction). Si la réduction rend le texte trop petit par rapport
+    à target_text_height, l'image est redécodée à une résolution supérieure : le prétraitement
+    se fait alors par bandes pour rester dans le budget.
+    """
+    import cv2
+    import numpy as np
+    from preprocessing import estimate_text_height
+
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    reduction = 1
+    if memory_budget:
+        size = image_size(image_bytes)
+        if size is not None:
+            reduction = choose_reduction(size[0], size[1], memory_budget)
+
+    img = cv2.imdecode(buffer, getattr(cv2, REDUCED_GRAYSCALE_FLAGS[reduction]))
+    if img is None or reduction == 1 or not target_text_height:
+        return img, reduction
+
+    text_height = estimate_text_height(img)
+    minimum = target_text_height * MIN_TEXT_HEIGHT_RATIO
+    if text_height and text_height < minimum:
+        factor = reduction
+        while factor > 1 and text_height * reduction / factor < minimum:
+            factor //= 2
+        del img
+        img = cv2.imdecode(buffer, getattr(cv2, REDUCED_GRAYSCALE_FLAGS[factor]))
+        reduction = factor
+    return img, reduction
+
+def reset_peak_rss():
+    """Remet à zéro le pic de mémoire résidente du processus (Linux) ; renvoie False si impossible
+
+    Le pic est celui de tout le processus : la mesure n'est propre à un document que si le
+    processus n'en traite qu'un à la fois.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    """Pic de mémoire résidente du processus en octets (depuis le dernier reset_peak_rss sous Linux)
+
+    Sans /proc, le repli ru_maxrss donne le pic depuis le démarrage du processus.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        import sys
+        # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except ImportError:
+        return None
@@ -0,0 +1,229 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# Intervalle (secondes) de mise à jour du signe de vie des travaux en cours par leur processus, et
+# délai sans signe de vie au-delà duquel un travail est considéré comme abandonné et remis en file
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 120
+
+def _pid_alive(pid):
+    """Vrai si un processus de ce numéro existe sur la machine"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Processus existant mais appartenant à un autre utilisateur
+        return True
+    return True
+
+class JobQueue:
+    def __init__(self, db_path, process_func, num_workers=2, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 stale_after=STALE_AFTER):
+        """Initialise la file de travaux persistée dans SQLite
+
+        process_func(filepath, document_type) doit renvoyer un dict
+        {'status': 'success', 'data': ...} ou {'status': 'error', 'message': ...}
+
+        Plusieurs processus (workers de l'application) peuvent partager la même base : chaque
+        travail en cours porte le pid de son processus et un signe de vie, et seuls les travaux
+        dont le processus est mort ou muet depuis stale_after secondes sont remis en file.
+        """
+        self.db_path = db_path
+        self.process_func = process_func
+        self.num_workers = num_workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        self._init_db()
+        self._recover()
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='ocr-job-heartbeat', daemon=True)
+        heartbeat.start()
+
+        self._workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'ocr-job-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _connect(self):
+        """Ouvre une connexion SQLite (une par appel, partagée entre threads)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Crée la table des travaux si nécessaire"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filepath TEXT NOT NULL,
+                    document_type TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+            # Bases créées avant le suivi des processus : colonnes ajoutées en place
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'owner_pid' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner_pid INTEGER')
+            if 'heartbeat_at' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+
+    def _recover(self):
+        """Remet en file les travaux en attente et les travaux en cours abandonnés"""
+        self._requeue_stale(startup=True)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'pending' ORDER BY created_at"
+            ).fetchall()
+        # Les autres processus les mettent aussi en file : chaque travail n'est exécuté que par
+        # le premier qui le réclame (voir _claim)
+        for row in rows:
+            self._queue.put(row['id'])
+
+    def _is_stale(self, row, now, startup):
+        """Vrai si le processus d'un travail en cours est mort ou ne donne plus signe de vie"""
+        if row['owner_pid'] is None or row['heartbeat_at'] is None:
+            return True
+        if row['owner_pid'] == self._pid:
+            # Au démarrage, un travail au pid du processus courant vient d'une exécution précédente
+            return startup
+        if row['heartbeat_at'] < now - self.stale_after:
+            return True
+        return not _pid_alive(row['owner_pid'])
+
+    def _requeue_stale(self, startup=False):
+        """Remet en attente les travaux en cours abandonnés et les met dans la file de ce processus"""
+        now = time.time()
+        requeued = []
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid, heartbeat_at FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            for row in rows:
+                if not self._is_stale(row, now, startup):
+                    continue
+                # Condition répétée : le travail a pu être repris entre-temps par un autre processus
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'pending', started_at = NULL, owner_pid = NULL, heartbeat_at = NULL "
+                    "WHERE id = ? AND status = 'running' AND owner_pid IS ? AND heartbeat_at IS ?",
+                    (row['id'], row['owner_pid'], row['heartbeat_at'])
+                )
+                if cursor.rowcount:
+                    requeued.append(row['id'])
+        for job_id in requeued:
+            self._queue.put(job_id)
+        return requeued
+
+    def _heartbeat_loop(self):
+        """Signe de vie des travaux en cours de ce processus, et reprise des travaux abandonnés"""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                with self._lock, self._connect() as conn:
+                    conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner_pid = ?",
+                                 (time.time(), self._pid))
+                self._requeue_stale()
+            except sqlite3.Error:
+                # Base momentanément verrouillée : nouvel essai au prochain intervalle
+                pass
+
+    def submit(self, filepath, document_type):
+        """Enregistre un travail et le met en file, renvoie son identifiant"""
+        job_id = uuid.uuid4().hex
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filepath, document_type, created_at) VALUES (?, 'pending', ?, ?, ?)",
+                (job_id, filepath, document_type, time.time())
+            )
+        self._queue.put(job_id)
+        return job_id
+
+    def get(self, job_id):
+        """Renvoie l'état d'un travail (ou None s'il n'existe pas)"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'document_type': row['document_type'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+        if row['result'] is not None:
+            job['data'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def pending_count(self):
+        """Nombre de travaux en attente de traitement"""
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        """Met à jour les colonnes d'un travail"""
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def _claim(self, job_id):
+        """Passe un travail en attente à l'état running pour ce processus ; faux s'il est déjà pris"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner_pid = ?, heartbeat_at = ? "
+                "WHERE id = ? AND status = 'pending'",
+                (now, self._pid, now, job_id)
+            )
+        return cursor.rowcount == 1
+
+    def _worker_loop(self):
+        """Boucle d'un thread de travail : dépile et traite les travaux"""
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run_job(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job_id):
+        """Exécute un travail et enregistre son résultat"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT filepath, document_type FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        if row is None or not self._claim(job_id):
+            return
+
+        try:
+            outcome = self.process_func(row['filepath'], row['document_type'])
+        except Exception as e:
+            outcome = {'status': 'error', 'message': str(e)}
+
+        if outcome['status'] == 'success':
+            self._update(job_id, status='done', finished_at=time.time(),
+                         result=json.dumps(outcome['data'], ensure_ascii=False))
+        else:
+            self._update(job_id, status='error', finished_at=time.time(),
+                         error=outcome['message'])
@@ -0,0 +1,210 @@
+import bisect
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Bornes des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Bornes des histogrammes de mémoire (octets) : 64 Mo à 4 Go
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(6, 13))
+
+# Quantiles exposés, calculés sur les dernières observations de chaque série
+QUANTILES = (0.5, 0.95, 0.99)
+RESERVOIR_SIZE = 2048
+
+# Fenêtre glissante du calcul de débit (secondes)
+THROUGHPUT_WINDOW = 60
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q):
+        values = sorted(self.recent)
+        if not values:
+            return math.nan
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+class MetricsRegistry:
+    def __init__(self):
+        """Compteurs et histogrammes en mémoire, exposés au format texte Prometheus"""
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._events = {}
+        self._help = {}
+        self._buckets = {}
+        # Dans un processus de travail, les mesures sont mises en tampon et renvoyées au processus web
+        self._forward_buffer = None
+
+    def describe(self, name, help_text, buckets=None):
+        """Associe une description (et des bornes d'histogramme) à une métrique"""
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def enable_forwarding(self):
+        """Mode processus de travail : les mesures sont accumulées pour drain() au lieu d'être agrégées"""
+        self._forward_buffer = []
+
+    def drain(self):
+        """Renvoie et vide les mesures en attente (mode processus de travail)"""
+        with self._lock:
+            events, self._forward_buffer = self._forward_buffer or [], []
+        return events
+
+    def replay(self, events):
+        """Agrège les mesures renvoyées par un processus de travail"""
+        for kind, name, value, labels in events:
+            if kind == 'observe':
+                self.observe(name, value, **dict(labels))
+            else:
+                self.inc(name, value, **dict(labels))
+
+    def observe(self, name, value, **labels):
+        """Ajoute une observation (durée en secondes, taille en octets) à un histogramme"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._forward_buffer is not None:
+                self._forward_buffer.append(('observe', name, value, key[1]))
+                return
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """Incrémente un compteur"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._forward_buffer is not None:
+                self._forward_buffer.append(('inc', name, amount, key[1]))
+                return
+            self._counters[key] = self._counters.get(key, 0) + amount
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = deque(maxlen=100000)
+            events.append((time.monotonic(), amount))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Mesure la durée d'un bloc ; une exception incrémente aussi le compteur d'erreurs"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('ocr_errors_total', **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self, name):
+        """Résumé des séries d'un histogramme : {étiquettes: {count, sum, p50, p95, p99}}"""
+        with self._lock:
+            series = [(labels, histogram) for (key, labels), histogram in self._histograms.items() if key == name]
+            return {
+                ','.join(f'{k}={v}' for k, v in labels): dict(
+                    count=histogram.count,
+                    sum=histogram.sum,
+                    **{f'p{int(q * 100)}': histogram.quantile(q) for q in QUANTILES}
+                )
+                for labels, histogram in series
+            }
+
+    def counter_values(self, name):
+        """Valeurs d'un compteur par série : {étiquettes: valeur}"""
+        with self._lock:
+            return {','.join(f'{k}={v}' for k, v in labels): value
+                    for (key, labels), value in self._counters.items() if key == name}
+
+    def reset(self):
+        """Remet toutes les mesures à zéro (benchmarks)"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._events.clear()
+
+    def render(self):
+        """Rend toutes les métriques au format texte Prometheus"""
+        lines = []
+        now = time.monotonic()
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            rates = {key: sum(amount for stamp, amount in events if now - stamp <= THROUGHPUT_WINDOW)
+                     for key, events in self._events.items()}
+
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, {"le": bound})} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, {"le": "+Inf"})} {histogram.count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+        # Quantiles récents (p50/p95/p99) de chaque histogramme
+        for (name, labels), histogram in histograms:
+            quantile_name = f'{name}_quantile'
+            declare(quantile_name, 'gauge')
+            for q in QUANTILES:
+                lines.append(f'{quantile_name}{_format_labels(labels, {"quantile": q})} {histogram.quantile(q)}')
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        # Débit sur la fenêtre glissante, par compteur
+        for (name, labels), _ in counters:
+            rate_name = name[:-len('_total')] if name.endswith('_total') else name
+            rate_name += '_per_second'
+            declare(rate_name, 'gauge')
+            lines.append(f'{rate_name}{_format_labels(labels)} {rates.get((name, labels), 0) / THROUGHPUT_WINDOW}')
+
+        return '\n'.join(lines) + '\n'
+
+# Registre du processus
+metrics = MetricsRegistry()
+metrics.describe('ocr_stage_seconds', "Durée de chaque étape du traitement d'un document")
+metrics.describe('ocr_documents_total', 'Documents traités')
+metrics.describe('ocr_errors_total', 'Erreurs par étape')
+metrics.describe('ocr_document_peak_rss_bytes', 'Pic de mémoire résidente par document (processus de travail du lot)',
+                 MEMORY_BUCKETS)
+metrics.describe('ocr_cascade_documents_total',
+                 'Documents par niveau de la cascade de prétraitement auquel le traitement s\'est arrêté')
+metrics.describe('ocr_duplicates_total', 'Quasi-doublons détectés avant l\'OCR (extraction réutilisée ou document signalé)')
+metrics.describe('ocr_pool_wait_seconds', "Attente d'un moteur OCR libre dans le pool des routes synchrones")
+metrics.describe('ocr_pool_rejected_total', 'Requêtes refusées faute de capacité (file pleine ou attente trop longue)')
+metrics.describe('app_startup_seconds', "Chargement de l'application web (imports et initialisation)")
+metrics.describe('ocr_worker_start_seconds', "Initialisation d'un processus de travail du traitement par lot")
+metrics.describe('http_request_seconds', 'Durée totale des requêtes HTTP par route')
+metrics.describe('http_requests_total', 'Requêtes HTTP par route et code de statut')
@@ -0,0 +1,103 @@
+import hashlib
+
+# Champs typés à la normalisation d'un lot de résultats (voir normalize_records)
+AMOUNT_FIELDS = ('montant_total', 'montant_ht', 'montant_tva', 'montant_ttc', 'solde')
+DATE_FIELDS = ('date', 'date_facture', 'date_debut', 'date_fin')
+CATEGORY_FIELDS = ('type_document', 'banque')
+
+# Texte OCR complet : stocké à part, une seule fois par texte, et remplacé par sa référence
+TEXT_FIELD = 'texte_brut'
+TEXT_REF_FIELD = 'texte_ref'
+
+# Mois en toutes lettres ou abrégés, sans accents (les dates sont repliées en ASCII avant la recherche)
+FRENCH_MONTHS = {
+    'janvier': 1, 'janv': 1, 'jan': 1,
+    'fevrier': 2, 'fevr': 2, 'fev': 2,
+    'mars': 3, 'mar': 3,
+    'avril': 4, 'avr': 4,
+    'mai': 5,
+    'juin': 6,
+    'juillet': 7, 'juil': 7,
+    'aout': 8,
+    'septembre': 9, 'sept': 9, 'sep': 9,
+    'octobre': 10, 'oct': 10,
+    'novembre': 11, 'nov': 11,
+    'decembre': 12, 'dec': 12
+}
+
+# Années sur deux chiffres : 00-68 -> 2000-2068, 69-99 -> 1969-1999 (comme %y)
+CENTURY_PIVOT = 69
+
+def text_reference(text):
+    """Référence stable d'un texte OCR (empreinte de son contenu) : les textes identiques sont stockés une fois"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+def normalize_amounts(values):
+    """Montants en nombres décimaux ("12,50", "1 234.50 €" -> 12.5, 1234.5) ; NaN si illisible"""
+    import pandas as pd
+
+    text = values.astype('string').str.replace(r'[\s€]|eur', '', regex=True, case=False)
+    amounts = pd.to_numeric(text.str.replace(',', '.', regex=False), errors='coerce')
+    return amounts.astype('float64').round(2)
+
+def normalize_dates(values):
+    """Dates (DD/MM/YY, DD-MM-YYYY, "12 mars 2024", ISO) en datetime64 ; NaT si illisible ou impossible"""
+    import pandas as pd
+
+    def number(column):
+        return pd.to_numeric(column, errors='coerce')
+
+    # Minuscules sans accents : "12 Février 2024" -> "12 fevrier 2024"
+    text = (values.astype('string').str.lower().str.normalize('NFKD')
+            .str.encode('ascii', 'ignore').str.decode('ascii'))
+    # ISO d'abord : "2024-03-12" contient aussi "24-03-12"
+    iso = text.str.extract(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+    numeric = text.str.extract(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})')
+    named = text.str.extract(r'(\d{1,2})(?:er)?\s+([a-z]+)\.?\s+(\d{2,4})')
+
+    day = number(iso[2]).fillna(number(numeric[0])).fillna(number(named[0]))
+    month = number(iso[1]).fillna(number(numeric[1])).fillna(number(named[1].map(FRENCH_MONTHS)))
+    year = number(iso[0]).fillna(number(numeric[2])).fillna(number(named[2]))
+    year = year.mask(year < 100, year + 1900).mask(year < CENTURY_PIVOT, year + 2000)
+
+    def padded(column, width):
+        return column.astype('Int64').astype('string').str.zfill(width)
+
+    # Date ISO reconstruite puis validée (31/02 ou mois 13 -> NaT)
+    return pd.to_datetime(padded(year, 4) + '-' + padded(month, 2) + '-' + padded(day, 2),
+                          format='%Y-%m-%d', errors='coerce')
+
+def normalize_categories(values):
+    """Valeurs répétées (type de document, banque) en colonne catégorielle"""
+    import pandas as pd
+
+    return values.astype('string').str.strip().replace('', pd.NA).astype('category')
+
+def normalize_records(records):
+    """Normalise en colonnes typées les résultats d'un lot : renvoie (tableau, textes)
+
+    Chaque champ connu est converti d'un bloc pour tout le lot (opérations vectorisées pandas) :
+    montants en décimaux, dates en datetime64, types de document et banques en catégories. Le
+    texte OCR complet est remplacé par sa référence (texte_ref) ; textes renvoie les textes
+    distincts (texte_ref, texte_brut), ou None si les résultats n'en contiennent pas.
+    """
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(records)
+    texts = None
+    if TEXT_FIELD in frame:
+        position = frame.columns.get_loc(TEXT_FIELD)
+        raw = frame.pop(TEXT_FIELD)
+        refs = raw.map(text_reference, na_action='ignore')
+        frame.insert(position, TEXT_REF_FIELD, refs)
+        texts = (pd.DataFrame({TEXT_REF_FIELD: refs, TEXT_FIELD: raw})
+                 .dropna().drop_duplicates(TEXT_REF_FIELD).reset_index(drop=True))
+
+    for column in frame.columns:
+        if column in AMOUNT_FIELDS:
+            frame[column] = normalize_amounts(frame[column])
+        elif column in DATE_FIELDS:
+            frame[column] = normalize_dates(frame[column])
+        elif column in CATEGORY_FIELDS:
+            frame[column] = normalize_categories(frame[column])
+    return frame, texts
@@ -0,0 +1,158 @@
+import threading
+
+import pytesseract
+from PIL import Image
+
+# Colonnes du dictionnaire renvoyé par pytesseract.image_to_data
+LAYOUT_KEYS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+
+def layout_to_text(layout):
+    """Reconstruit le texte (lignes et paragraphes) à partir des données de mise en page"""
+    paragraphs = []
+    current_par = None
+    current_line = None
+    lines = []
+    words = []
+
+    for i, word in enumerate(layout['text']):
+        if layout['level'][i] != 5 or not str(word).strip():
+            continue
+
+        par_key = (layout['page_num'][i], layout['block_num'][i], layout['par_num'][i])
+        line_key = par_key + (layout['line_num'][i],)
+
+        if line_key != current_line:
+            if words:
+                lines.append(' '.join(words))
+                words = []
+            current_line = line_key
+        if par_key != current_par:
+            if lines:
+                paragraphs.append('\n'.join(lines))
+                lines = []
+            current_par = par_key
+
+        words.append(str(word))
+
+    if words:
+        lines.append(' '.join(words))
+    if lines:
+        paragraphs.append('\n'.join(lines))
+
+    return '\n\n'.join(paragraphs) + '\n' if paragraphs else ''
+
+def mean_confidence(layout):
+    """Confiance moyenne (0-100) des mots reconnus, 0 si aucun mot"""
+    confidences = [float(conf) for conf, word in zip(layout['conf'], layout['text'])
+                   if str(word).strip() and float(conf) >= 0]
+    return sum(confidences) / len(confidences) if confidences else 0.0
+
+class PytesseractBackend:
+    """Backend historique : un sous-processus tesseract par appel"""
+    name = 'pytesseract'
+
+    def image_to_string(self, img, lang, psm=None):
+        """OCR simple : texte uniquement"""
+        return pytesseract.image_to_string(Image.fromarray(img), lang=lang, config=self._config(psm))
+
+    def recognize(self, img, lang, psm=None):
+        """OCR en une seule passe : texte et mise en page (mots, boîtes, confiances)"""
+        layout = pytesseract.image_to_data(
+            Image.fromarray(img),
+            lang=lang,
+            config=self._config(psm),
+            output_type=pytesseract.Output.DICT
+        )
+        return layout_to_text(layout), layout
+
+    @staticmethod
+    def _config(psm):
+        return f'--psm {psm}' if psm is not None else ''
+
+class TesserocrBackend:
+    """Backend en processus (libtesseract via tesserocr) : une instance initialisée par thread et par langue"""
+    name = 'tesserocr'
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+
+    def _get_api(self, lang):
+        """Renvoie l'instance Tesseract du thread courant (chargement des traineddata une seule fois)"""
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if lang not in apis:
+            apis[lang] = self._tesserocr.PyTessBaseAPI(lang=lang)
+        return apis[lang]
+
+    def _set_image(self, img, lang, psm):
+        api = self._get_api(lang)
+        api.SetPageSegMode(psm if psm is not None else self._tesserocr.PSM.AUTO)
+        api.SetImage(Image.fromarray(img))
+        return api
+
+    def image_to_string(self, img, lang, psm=None):
+        """OCR simple : texte uniquement"""
+        return self._set_image(img, lang, psm).GetUTF8Text()
+
+    def recognize(self, img, lang, psm=None):
+        """OCR en une seule passe : texte et mise en page (mots, boîtes, confiances)"""
+        RIL = self._tesserocr.RIL
+        api = self._set_image(img, lang, psm)
+        api.Recognize()
+
+        layout = {key: [] for key in LAYOUT_KEYS}
+        block_num = par_num = line_num = word_num = 0
+        iterator = api.GetIterator()
+        if iterator is not None:
+            while True:
+                if iterator.IsAtBeginningOf(RIL.BLOCK):
+                    block_num += 1
+                    par_num = line_num = 0
+                if iterator.IsAtBeginningOf(RIL.PARA):
+                    par_num += 1
+                    line_num = 0
+                if iterator.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_num += 1
+                    word_num = 0
+                word_num += 1
+
+                box = iterator.BoundingBox(RIL.WORD)
+                if box is not None:
+                    left, top, right, bottom = box
+                    row = (5, 1, block_num, par_num, line_num, word_num,
+                           left, top, right - left, bottom - top,
+                           iterator.Confidence(RIL.WORD), iterator.GetUTF8Text(RIL.WORD) or '')
+                    for key, value in zip(LAYOUT_KEYS, row):
+                        layout[key].append(value)
+
+                if not iterator.Next(RIL.WORD):
+                    break
+
+        return api.GetUTF8Text(), layout
+
+# Backends partagés par tous les moteurs du processus (les instances Tesseract sont réutilisées)
+_backends = {}
+_backends_lock = threading.Lock()
+
+def _create_backend(name):
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    if name == 'tesserocr':
+        return TesserocrBackend()
+    if name == 'auto':
+        try:
+            return TesserocrBackend()
+        except ImportError:
+            return PytesseractBackend()
+    raise ValueError(f"Backend OCR non pris en charge: {name}")
+
+def get_backend(name='auto'):
+    """Renvoie le backend OCR du processus : 'tesserocr', 'pytesseract' ou 'auto' (tesserocr si disponible)"""
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = _create_backend(name)
+        return _backends[name]
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# Entrées supprimées par requête lors de l'éviction (les plus anciennes d'abord)
+EVICTION_BATCH = 64
+
+class OCRCache:
+    def __init__(self, db_path, max_bytes=512 * 1024 * 1024):
+        """Initialise le cache persistant des résultats OCR (éviction LRU bornée en taille)
+
+        Le cache est partagé entre processus (SQLite) : les compteurs et
+        l'éviction tiennent compte des processus de traitement par lot.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._init_db()
+
+    def _connect(self):
+        """Ouvre une connexion SQLite"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        """Crée les tables du cache si nécessaire"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+            # Taille totale tenue à jour par des déclencheurs, pour ne pas la recalculer à chaque écriture
+            # (calculée une fois pour les bases créées avant ce compteur)
+            conn.execute("INSERT OR IGNORE INTO counters SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_insert AFTER INSERT ON entries BEGIN
+                    UPDATE counters SET value = value + new.size WHERE name = 'size';
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_update AFTER UPDATE OF size ON entries BEGIN
+                    UPDATE counters SET value = value + new.size - old.size WHERE name = 'size';
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS entries_size_delete AFTER DELETE ON entries BEGIN
+                    UPDATE counters SET value = value - old.size WHERE name = 'size';
+                END
+            ''')
+
+    @staticmethod
+    def make_key(image_bytes, lang, params):
+        """Calcule la clé d'une image : empreinte du contenu + langue + paramètres de prétraitement"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps({'lang': lang, 'params': params}, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Renvoie l'entrée {'text', 'layout'} associée à la clé, ou None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+                return None
+            conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+    def put(self, key, text, layout=None):
+        """Enregistre le texte brut (et la mise en page) d'une image"""
+        value = json.dumps({'text': text, 'layout': layout}, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        with self._connect() as conn:
+            # Mise à jour en place plutôt que REPLACE : les déclencheurs de suppression ne s'exécutent
+            # pas pour les lignes remplacées, la taille totale serait faussée
+            conn.execute(
+                'INSERT INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, '
+                'last_access = excluded.last_access',
+                (key, value, size, time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Supprime les entrées les moins récemment utilisées au-delà de la taille maximale"""
+        total = self._total_size(conn)
+        evicted = 0
+        while total > self.max_bytes:
+            rows = conn.execute('SELECT key, size FROM entries ORDER BY last_access LIMIT ?',
+                                (EVICTION_BATCH,)).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    @staticmethod
+    def _total_size(conn):
+        """Taille totale des entrées, d'après le compteur tenu à jour par les déclencheurs"""
+        return conn.execute("SELECT value FROM counters WHERE name = 'size'").fetchone()[0]
+
+    def invalidate(self, key=None):
+        """Invalide une entrée (ou tout le cache si key est None), renvoie le nombre d'entrées supprimées"""
+        with self._connect() as conn:
+            if key is None:
+                cursor = conn.execute('DELETE FROM entries')
+            else:
+                cursor = conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        return cursor.rowcount
+
+    def stats(self):
+        """Renvoie les compteurs du cache"""
+        with self._connect() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'evictions': counters['evictions'],
+            'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': counters['size'],
+            'max_bytes': self.max_bytes
+        }
@@ -1,73 +1,509 @@
 import cv2
-import pytesseract
-from PIL import Image
 import numpy as np
 import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import metrics
+from document_pages import DEFAULT_PDF_DPI, is_multipage, iter_page_sources
+from image_decode import DEFAULT_MEMORY_BUDGET_MB, decode_grayscale, peak_rss, reset_peak_rss
+from ocr_backends import get_backend, mean_confidence
+from preprocessing import DEFAULT_PROFILE, PreprocessingPipeline, get_profile_params
+from text_regions import (MAX_REGION_COVERAGE, assemble_text, crop_region, detect_text_regions, reading_order,
+                          region_coverage)
+
+# Cascade de prétraitement : confiance moyenne des mots (0-100) à partir de laquelle un niveau suffit
+CASCADE_MIN_CONFIDENCE = 75
+
+# Pools de threads de l'OCR par région, partagés par les moteurs du processus : les instances
+# Tesseract (une par thread) sont ainsi réutilisées d'un document à l'autre
+_region_executors = {}
+_region_executors_lock = threading.Lock()
+
+def _get_region_executor(workers):
+    with _region_executors_lock:
+        if workers not in _region_executors:
+            _region_executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-region')
+        return _region_executors[workers]
+
+# Pools de threads de l'OCR page par page (PDF, TIFF), partagés de même : un pool par document
+# rechargerait les données de langue de Tesseract dans de nouveaux threads à chaque document
+_page_executors = {}
+_page_executors_lock = threading.Lock()
+
+def _get_page_executor(workers):
+    with _page_executors_lock:
+        if workers not in _page_executors:
+            _page_executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-page')
+        return _page_executors[workers]
 
 class OCREngine:
-    def __init__(self, lang='fra+eng'):
+    def __init__(self, lang='fra+eng', cache=None, preprocess_params=None, backend='auto',
+                 profile=DEFAULT_PROFILE, page_workers=None, pdf_dpi=DEFAULT_PDF_DPI,
+                 use_text_layer=True, debug_dir=None, debug_sample_rate=0.0,
+                 memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, text_regions=False, region_workers=None,
+                 cascade=None, cascade_min_confidence=CASCADE_MIN_CONFIDENCE, document_peak_rss=False):
         self.lang = lang
-        
+        self.cache = cache
+        # Backend Tesseract : 'tesserocr' (en processus), 'pytesseract' (sous-processus) ou 'auto'
+        self.backend = get_backend(backend)
+        # Profil de prétraitement ('fast', 'balanced', 'quality') ; les paramètres font partie de la clé du cache
+        self.profile = profile
+        self.preprocess_params = get_profile_params(profile, preprocess_params)
+        # Budget mémoire par document : décodage réduit ou prétraitement par bandes au-delà (0 = aucun)
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.pipeline = PreprocessingPipeline(self.preprocess_params, self.memory_budget)
+        # Rapport du dernier prétraitement (temps par étape, bruit estimé, échelle)
+        self.last_preprocess_report = None
+        # Mémoire du dernier document : facteur de réduction au décodage, bandes, pic de RSS
+        self.last_memory_report = None
+        # Pic de RSS remis à zéro à chaque document : seulement quand le processus ne traite qu'un
+        # document à la fois (processus de travail du lot). Sinon, le pic rapporté est celui du processus
+        self.document_peak_rss = document_peak_rss
+        self._peak_rss_reset = False
+        # Documents multi-pages : nombre de pages reconnues en parallèle et résolution des PDF
+        self.page_workers = page_workers or min(4, os.cpu_count() or 1)
+        self.pdf_dpi = pdf_dpi
+        # PDF natifs : utiliser la couche texte des pages au lieu de l'OCR
+        self.use_text_layer = use_text_layer
+        # Images prétraitées de débogage : proportion des documents enregistrés (0 = aucun)
+        # dans debug_dir, ou à côté du fichier d'origine si debug_dir n'est pas défini
+        self.debug_dir = debug_dir
+        self.debug_sample_rate = debug_sample_rate
+        # Détection des blocs de texte : seules ces régions passent par Tesseract, en parallèle
+        self.text_regions = text_regions
+        self.region_workers = region_workers or min(4, os.cpu_count() or 1)
+        # Régions du dernier document (nombre, part de la page couverte, repli sur la page entière)
+        self.last_region_report = None
+        # Cascade de prétraitement : profils essayés du plus léger au plus lourd, jusqu'à ce que la
+        # confiance des mots et les champs clés du document soient satisfaisants (None = profil unique)
+        self.cascade = tuple(cascade) if cascade else None
+        self.cascade_min_confidence = cascade_min_confidence
+        self.cascade_pipelines = [
+            (name, PreprocessingPipeline(get_profile_params(name, preprocess_params), self.memory_budget))
+            for name in self.cascade or ()
+        ]
+        # Niveaux essayés pour le dernier document (confiance, champs manquants, temps)
+        self.last_cascade_report = None
+
+    def warm_up(self):
+        """Charge Tesseract et ses données de langue dans le thread courant (OCR d'une image blanche)"""
+        self.backend.image_to_string(np.full((32, 32), 255, dtype=np.uint8), self.lang)
+
     def preprocess_image(self, img):
         """Prétraitement de l'image pour améliorer la reconnaissance OCR"""
         if isinstance(img, str):
             img = cv2.imread(img)
-        
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-        
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(denoised)
-        
-        binary = cv2.adaptiveThreshold(
-            enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
-        )
-        
+
+        binary, self.last_preprocess_report = self.pipeline.run(img)
+        self._record_preprocess(self.last_preprocess_report)
+
         return binary
-    
-    def extract_text(self, img_path):
-        """Extrait le texte d'une image"""
-        # Vérifier si le chemin existe
+
+    @staticmethod
+    def _record_preprocess(report):
+        """Reporte le temps de chaque étape de prétraitement dans les métriques"""
+        for stage, seconds in report['timings'].items():
+            if stage != 'total':
+                metrics.observe('ocr_stage_seconds', seconds, stage=f'preprocess_{stage}')
+
+    def _read_image(self, img_path):
+        """Lit les octets bruts du fichier (hachés pour le cache, puis décodés)"""
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"Le fichier {img_path} n'existe pas")
-        
-        # Lire l'image
-        img = cv2.imread(img_path)
-        
-        # Prétraitement
-        preprocessed_img = self.preprocess_image(img)
-        
-        # OCR avec Tesseract
-        text = pytesseract.image_to_string(
-            Image.fromarray(preprocessed_img), 
-            lang=self.lang
-        )
-        
-        # Sauvegarder l'image prétraitée pour le débogage (facultatif)
-        debug_path = img_path.replace('.', '_preprocessed.')
+
+        with open(img_path, 'rb') as f:
+            image_bytes = f.read()
+
+        return image_bytes
+
+    def _load(self, img_path, data):
+        """Octets du document : ceux fournis (upload en mémoire) ou ceux du fichier"""
+        if data is not None:
+            return data
+        return self._read_image(img_path)
+
+    def _save_debug_image(self, img_path, preprocessed_img, in_memory):
+        """Enregistre l'image prétraitée pour le débogage, si configuré (échantillonné)"""
+        if self.debug_sample_rate <= 0 or random.random() >= self.debug_sample_rate:
+            return
+        stem, _ = os.path.splitext(os.path.basename(img_path))
+        if self.debug_dir:
+            os.makedirs(self.debug_dir, exist_ok=True)
+            debug_path = os.path.join(self.debug_dir, f'{stem}_preprocessed.png')
+        elif not in_memory:
+            debug_path = os.path.join(os.path.dirname(img_path), f'{stem}_preprocessed.png')
+        else:
+            return
         cv2.imwrite(debug_path, preprocessed_img)
-        
+
+    def _decode_image(self, image_bytes):
+        """Décode les octets d'une image directement en niveaux de gris ; renvoie (image, facteur de réduction)"""
+        return decode_grayscale(image_bytes, self.memory_budget, self.preprocess_params.get('target_text_height'))
+
+    def _reset_memory(self):
+        """Début de la mesure mémoire d'un document (pic remis à zéro si document_peak_rss)"""
+        self._peak_rss_reset = self.document_peak_rss and reset_peak_rss()
+
+    def _record_memory(self, reduction):
+        """Rapport mémoire du document qui vient d'être traité
+
+        peak_rss_scope vaut 'document' si le pic a été remis à zéro au début du document, 'process'
+        sinon (pic depuis le démarrage du processus, tous threads confondus).
+        """
+        peak = peak_rss()
+        scope = 'document' if self._peak_rss_reset else 'process'
+        self.last_memory_report = {
+            'reduction': reduction,
+            'strips': (self.last_preprocess_report or {}).get('strips'),
+            'peak_rss_bytes': peak,
+            'peak_rss_scope': scope
+        }
+        if peak is not None and scope == 'document':
+            metrics.observe('ocr_document_peak_rss_bytes', peak)
+
+    def _cache_key(self, image_bytes, mode='image', document_type=None):
+        """Clé du cache pour une image avec les réglages courants du moteur"""
+        params = dict(self.preprocess_params, backend=self.backend.name, mode=mode,
+                      memory_budget=self.memory_budget, text_regions=self.text_regions)
+        if self.cascade:
+            # Le texte retenu dépend des niveaux essayés et des champs clés attendus
+            params['cascade'] = self.cascade
+            params['cascade_min_confidence'] = self.cascade_min_confidence
+            params['document_type'] = document_type
+        if mode == 'document':
+            params['pdf_dpi'] = self.pdf_dpi
+            params['use_text_layer'] = self.use_text_layer
+        return self.cache.make_key(image_bytes, self.lang, params)
+
+    def _reset_reports(self):
+        """Efface les rapports du document précédent : un résultat lu dans le cache n'en produit pas
+
+        Les moteurs du pool traitent les documents de plusieurs requêtes à la suite.
+        """
+        self.last_preprocess_report = None
+        self.last_cascade_report = None
+        self.last_memory_report = None
+        self.last_region_report = None
+
+    def extract_text(self, img_path, data=None, extractor=None):
+        """Extrait le texte d'une image (ou de toutes les pages d'un PDF/TIFF)
+
+        Avec data (octets du fichier, par exemple un upload lu en mémoire), rien n'est lu ni
+        écrit sur disque : img_path ne sert qu'à connaître le format. Avec une cascade, extractor
+        (DataExtractor) sert à vérifier que les champs clés du document sont trouvés.
+        """
+        if is_multipage(img_path):
+            return self.extract_document(img_path, data)['text']
+
+        self._reset_reports()
+
+        # Lire le fichier
+        with metrics.timer('ocr_stage_seconds', stage='read'):
+            image_bytes = self._load(img_path, data)
+
+        # Résultat déjà en cache pour cette image et ces réglages
+        cache_key = None
+        if self.cache is not None:
+            with metrics.timer('ocr_stage_seconds', stage='cache_lookup'):
+                cache_key = self._cache_key(image_bytes, document_type=getattr(extractor, 'document_type', None))
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached['text']
+
+        # Prétraitement (pic de mémoire mesuré à partir du décodage)
+        self._reset_memory()
+        with metrics.timer('ocr_stage_seconds', stage='decode'):
+            img, reduction = self._decode_image(image_bytes)
+        if img is None:
+            raise ValueError(f"Impossible de décoder l'image {img_path}")
+        if self.cascade:
+            # Du profil le plus léger au plus lourd, arrêt dès que le résultat est satisfaisant
+            preprocessed_img, text, self.last_preprocess_report, self.last_cascade_report = \
+                self._run_cascade(img, extractor)
+            del img
+        else:
+            preprocessed_img = self.preprocess_image(img)
+            del img
+
+            # OCR avec Tesseract
+            text = self._ocr_image(preprocessed_img, self.last_preprocess_report)
+        self._record_memory(reduction)
+
+        if cache_key is not None:
+            with metrics.timer('ocr_stage_seconds', stage='cache_store'):
+                self.cache.put(cache_key, text)
+
+        # Sauvegarder l'image prétraitée pour le débogage (facultatif)
+        self._save_debug_image(img_path, preprocessed_img, data is not None)
+
         return text
-    
-    def extract_text_and_layout(self, img_path):
+
+    def extract_text_and_layout(self, img_path, data=None):
         """Extrait le texte et les informations de mise en page"""
+        self._reset_reports()
+        image_bytes = self._load(img_path, data)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(image_bytes)
+            cached = self.cache.get(cache_key)
+            # Une entrée créée par extract_text ne contient pas la mise en page
+            if cached is not None and cached['layout'] is not None:
+                return cached['text'], cached['layout']
+
         # Prétraitement comme avant
-        img = cv2.imread(img_path)
+        self._reset_memory()
+        img, reduction = self._decode_image(image_bytes)
+        if img is None:
+            raise ValueError(f"Impossible de décoder l'image {img_path}")
         preprocessed_img = self.preprocess_image(img)
-        
-        # Obtenir les données de mise en page
-        d = pytesseract.image_to_data(
-            Image.fromarray(preprocessed_img),
-            lang=self.lang,
-            output_type=pytesseract.Output.DICT
-        )
-        
-        # Obtenir simplement le texte aussi
-        text = pytesseract.image_to_string(
-            Image.fromarray(preprocessed_img),
-            lang=self.lang
-        )
-        
-        return text, d
\ No newline at end of file
+        del img
+
+        # Texte et mise en page en une seule passe de reconnaissance
+        with metrics.timer('ocr_stage_seconds', stage='tesseract_layout'):
+            text, d = self.backend.recognize(preprocessed_img, self.lang)
+        self._record_memory(reduction)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, text, d)
+
+        return text, d
+
+    def _ocr_image(self, preprocessed_img, report=None):
+        """OCR d'une image prétraitée : page entière, ou blocs de texte détectés si text_regions est activé"""
+        if self.text_regions:
+            regions = self._ocr_regions(preprocessed_img, report)
+            if regions is not None:
+                return regions[0]
+
+        with metrics.timer('ocr_stage_seconds', stage='tesseract'):
+            return self.backend.image_to_string(preprocessed_img, self.lang)
+
+    def _ocr_regions(self, preprocessed_img, report=None, with_confidence=False):
+        """Reconnaît chaque bloc de texte avec son propre mode de segmentation, en parallèle,
+        et recolle les textes dans l'ordre de lecture ; None si l'OCR de la page entière est préférable
+
+        Renvoie (texte, confiance moyenne des mots de tous les blocs si with_confidence, sinon None).
+        """
+        # Hauteur du texte après la mise à l'échelle du prétraitement
+        text_height = None
+        if report and report.get('text_height'):
+            text_height = report['text_height'] * report['scale']
+
+        with metrics.timer('ocr_stage_seconds', stage='region_detect'):
+            regions = detect_text_regions(preprocessed_img, text_height)
+            coverage = region_coverage(regions, preprocessed_img.shape) if regions else 0.0
+
+        fallback = not regions or coverage > MAX_REGION_COVERAGE
+        self.last_region_report = {'regions': len(regions), 'coverage': coverage, 'fallback': fallback}
+        if fallback:
+            return None
+
+        def recognize(region):
+            crop = crop_region(preprocessed_img, region)
+            if with_confidence:
+                # Mise en page demandée pour la confiance des mots (cascade de prétraitement)
+                return self.backend.recognize(crop, self.lang, psm=region['psm'])
+            return self.backend.image_to_string(crop, self.lang, psm=region['psm']), None
+
+        rows = reading_order(regions)
+        ordered = [region for row in rows for region in row]
+        with metrics.timer('ocr_stage_seconds', stage='tesseract_regions'):
+            if self.region_workers > 1 and len(ordered) > 1:
+                results = list(_get_region_executor(self.region_workers).map(recognize, ordered))
+            else:
+                results = [recognize(region) for region in ordered]
+
+        recognized = iter(zip(ordered, (text for text, _ in results)))
+        text = assemble_text([[next(recognized) for _ in row] for row in rows])
+        if not with_confidence:
+            return text, None
+        words = {'conf': [conf for _, layout in results for conf in layout['conf']],
+                 'text': [word for _, layout in results for word in layout['text']]}
+        return text, mean_confidence(words)
+
+    def _run_cascade(self, img, extractor=None):
+        """Prétraite et reconnaît l'image avec chaque profil de la cascade, du plus léger au plus lourd
+
+        Un niveau suffit si la confiance moyenne des mots atteint cascade_min_confidence et si
+        extractor (facultatif) trouve tous les champs clés. Avec text_regions, chaque niveau
+        reconnaît les blocs de texte détectés sur sa propre image prétraitée. Sinon le meilleur résultat est gardé :
+        le moins de champs clés manquants, puis la meilleure confiance. Renvoie
+        (image prétraitée, texte, rapport de prétraitement, rapport de cascade).
+        """
+        tiers = []
+        best = None
+        for name, pipeline in self.cascade_pipelines:
+            start = time.perf_counter()
+            binary, report = pipeline.run(img)
+            preprocess_time = time.perf_counter() - start
+            self._record_preprocess(report)
+
+            start = time.perf_counter()
+            regions = self._ocr_regions(binary, report, with_confidence=True) if self.text_regions else None
+            if regions is not None:
+                text, confidence = regions
+            else:
+                with metrics.timer('ocr_stage_seconds', stage='tesseract'):
+                    text, layout = self.backend.recognize(binary, self.lang)
+                confidence = mean_confidence(layout)
+            ocr_time = time.perf_counter() - start
+            missing = extractor.missing_key_fields(text) if extractor is not None else []
+            accepted = confidence >= self.cascade_min_confidence and not missing
+            tiers.append({
+                'profile': name,
+                'confidence': round(confidence, 1),
+                'missing_fields': missing,
+                'text_regions': regions is not None,
+                'accepted': accepted,
+                'timings': {'preprocess': preprocess_time, 'ocr': ocr_time}
+            })
+
+            score = (-len(missing), confidence)
+            if best is None or score > best[0]:
+                best = (score, name, binary, text, report)
+            if accepted:
+                break
+
+        _, selected, binary, text, report = best
+        outcome = 'accepted' if tiers[-1]['accepted'] else 'exhausted'
+        # Niveau auquel la cascade s'est arrêtée : fréquence de chaque niveau dans /metrics
+        metrics.inc('ocr_cascade_documents_total', tier=tiers[-1]['profile'], outcome=outcome)
+        return binary, text, report, {'tiers': tiers, 'selected': selected, 'outcome': outcome}
+
+    def _recognize_page(self, number, img, decode_time):
+        """Prétraite et reconnaît une page (exécuté dans un thread du pool de pages)"""
+        if self.cascade:
+            # Champs clés vérifiés sur le document entier : seule la confiance compte par page
+            _, text, report, cascade_report = self._run_cascade(img)
+            return {
+                'page': number,
+                'source': 'ocr',
+                'text': text,
+                'profile': cascade_report['selected'],
+                'timings': {
+                    'decode': decode_time,
+                    'preprocess': sum(tier['timings']['preprocess'] for tier in cascade_report['tiers']),
+                    'ocr': sum(tier['timings']['ocr'] for tier in cascade_report['tiers'])
+                },
+                'preprocess_report': report
+            }
+
+        start = time.perf_counter()
+        preprocessed_img, report = self.pipeline.run(img)
+        preprocess_time = time.perf_counter() - start
+        self._record_preprocess(report)
+
+        start = time.perf_counter()
+        text = self._ocr_image(preprocessed_img, report)
+        ocr_time = time.perf_counter() - start
+
+        return {
+            'page': number,
+            'source': 'ocr',
+            'text': text,
+            'timings': {
+                'decode': decode_time,
+                'preprocess': preprocess_time,
+                'ocr': ocr_time
+            },
+            'preprocess_report': report
+        }
+
+    def iter_page_results(self, path, data=None):
+        """Génère les résultats page par page, dans l'ordre, en reconnaissant plusieurs pages en parallèle
+
+        Au plus 2 × page_workers pages décodées sont en mémoire à un instant donné. Chaque
+        résultat indique sa source : 'text_layer' (couche texte PDF) ou 'ocr'.
+        """
+        if data is None and not os.path.exists(path):
+            raise FileNotFoundError(f"Le fichier {path} n'existe pas")
+
+        max_pending = self.page_workers * 2
+        pending = deque()
+
+        executor = _get_page_executor(self.page_workers)
+        try:
+            pages = iter_page_sources(path, dpi=self.pdf_dpi, use_text_layer=self.use_text_layer, data=data)
+            number = 0
+            while True:
+                start = time.perf_counter()
+                page = next(pages, None)
+                if page is None:
+                    break
+                decode_time = time.perf_counter() - start
+                number += 1
+
+                source, payload = page
+                metrics.observe('ocr_stage_seconds', decode_time,
+                                stage='text_layer' if source == 'text_layer' else 'page_decode')
+                if source == 'text_layer':
+                    # Couche texte PDF : résultat immédiat, sans prétraitement ni Tesseract
+                    future = Future()
+                    future.set_result({
+                        'page': number,
+                        'source': 'text_layer',
+                        'text': payload,
+                        'timings': {'decode': decode_time, 'preprocess': 0.0, 'ocr': 0.0},
+                        'preprocess_report': None
+                    })
+                    pending.append(future)
+                else:
+                    pending.append(executor.submit(self._recognize_page, number, payload, decode_time))
+                del page, payload
+
+                # Fenêtre pleine : rendre la page la plus ancienne avant d'en décoder une autre
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Lecture interrompue : les pages encore en file ne sont pas reconnues pour rien
+            for future in pending:
+                future.cancel()
+
+    def extract_document(self, path, data=None):
+        """Extrait le texte d'un document multi-pages : texte fusionné dans l'ordre et détail par page"""
+        # Rapports du document précédent effacés (pas de cascade ni de mesure mémoire sur un résultat en cache)
+        self._reset_reports()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(self._load(path, data), mode='document')
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {
+                    'text': cached['text'],
+                    'pages': cached['layout']['pages'],
+                    'sources': cached['layout']['sources'],
+                    'cached': True
+                }
+
+        self._reset_memory()
+        start = time.perf_counter()
+        pages = []
+        for page in self.iter_page_results(path, data):
+            page.pop('preprocess_report')
+            pages.append(page)
+
+        document = {
+            'text': '\n'.join(page['text'] for page in pages),
+            'pages': pages,
+            'sources': {
+                'text_layer': sum(1 for page in pages if page['source'] == 'text_layer'),
+                'ocr': sum(1 for page in pages if page['source'] == 'ocr')
+            },
+            'cached': False,
+            'total_time': time.perf_counter() - start
+        }
+        self._record_memory(None)
+        document['peak_rss_bytes'] = self.last_memory_report['peak_rss_bytes']
+
+        if cache_key is not None:
+            self.cache.put(cache_key, document['text'], {'pages': pages, 'sources': document['sources']})
+
+        return document
@@ -1,13 +1,343 @@
-import pandas as pd
 import os
+import csv
 import json
+import threading
+import time
 from datetime import datetime
 
+from metrics import metrics
+
+class RecordWriter:
+    """Écriture incrémentale : un enregistrement par document terminé, finalisation atomique"""
+    extension = None
+
+    def __init__(self, filepath, partial_dir, fsync=False):
+        self.filepath = filepath
+        self.partial_dir = partial_dir
+        self.fsync = fsync
+        self.count = 0
+        self.closed = False
+        # Appelé avec les chemins des fichiers finalisés (manifeste d'OutputManager)
+        self.on_close = None
+        # Fichier partiel hors du dossier de sortie : il n'apparaît dans la liste qu'une fois finalisé
+        self.partial_path = os.path.join(partial_dir, os.path.basename(filepath) + '.part')
+        self._file = open(self.partial_path, 'w', encoding='utf-8', newline='')
+
+    def write(self, record):
+        """Ajoute un enregistrement et le pousse sur disque"""
+        with metrics.timer('ocr_stage_seconds', stage='output_write'):
+            self._write_record(record)
+            self.count += 1
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """Finalise le fichier de sortie (remplacement atomique) et renvoie son chemin"""
+        if not self.closed:
+            self.closed = True
+            with metrics.timer('ocr_stage_seconds', stage='output_finalize'):
+                self._finalize()
+            if self.on_close is not None:
+                self.on_close(self.output_paths())
+        return self.filepath
+
+    def output_paths(self):
+        """Fichiers écrits dans le dossier de sortie à la finalisation"""
+        return [self.filepath]
+
+    def abort(self):
+        """Abandonne l'écriture et supprime le fichier partiel"""
+        if not self.closed:
+            self.closed = True
+            self._file.close()
+            os.remove(self.partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Même en cas d'erreur, les documents déjà terminés sont conservés
+        self.close()
+        return False
+
+    def _write_record(self, record):
+        raise NotImplementedError
+
+    def _finalize(self):
+        self._file.close()
+        os.replace(self.partial_path, self.filepath)
+
+class JsonLinesWriter(RecordWriter):
+    """JSON Lines : une ligne JSON par document"""
+    extension = '.jsonl'
+
+    def _write_record(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+class JsonWriter(RecordWriter):
+    """Liste JSON (même format que save_to_json), écrite élément par élément"""
+    extension = '.json'
+
+    def __init__(self, filepath, partial_dir, fsync=False):
+        super().__init__(filepath, partial_dir, fsync)
+        self._file.write('[')
+
+    def _write_record(self, record):
+        separator = ',\n' if self.count else '\n'
+        self._file.write(separator + json.dumps(record, ensure_ascii=False, indent=4))
+
+    def _finalize(self):
+        self._file.write('\n]' if self.count else ']')
+        super()._finalize()
+
+class SpoolingWriter(RecordWriter):
+    """Formats tabulaires : les documents sont ajoutés à un journal JSON Lines, converti à la finalisation
+
+    Les colonnes (union des champs, dans l'ordre d'apparition) ne sont connues qu'à la fin
+    d'un lot mélangeant plusieurs types de documents ; la conversion relit le journal en flux,
+    en mémoire constante.
+    """
+
+    def __init__(self, filepath, partial_dir, fsync=False):
+        super().__init__(filepath, partial_dir, fsync)
+        self.columns = {}
+
+    def _write_record(self, record):
+        for key, value in record.items():
+            if value is None:
+                self.columns.setdefault(key, None)
+            elif self.columns.get(key) is None:
+                self.columns[key] = type(value)
+            elif self.columns[key] is not type(value):
+                # Entiers et décimaux mélangés : décimal, sinon texte
+                numbers = {int, float}
+                self.columns[key] = float if {self.columns[key], type(value)} <= numbers else str
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _iter_spooled(self):
+        """Relit les documents du journal un par un"""
+        with open(self.partial_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _finalize(self):
+        self._file.close()
+        tmp_path = self.partial_path + '.tmp'
+        try:
+            self._convert(tmp_path)
+            os.replace(tmp_path, self.filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        os.remove(self.partial_path)
+
+    def _convert(self, tmp_path):
+        raise NotImplementedError
+
+class CsvWriter(SpoolingWriter):
+    """CSV (utf-8-sig pour Excel, comme save_to_csv)"""
+    extension = '.csv'
+
+    def _convert(self, tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.columns))
+            writer.writeheader()
+            for record in self._iter_spooled():
+                writer.writerow(record)
+
+class XlsxWriter(SpoolingWriter):
+    """Excel en mode écriture seule d'openpyxl (les lignes ne sont pas gardées en mémoire)"""
+    extension = '.xlsx'
+
+    def _convert(self, tmp_path):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        columns = list(self.columns)
+        sheet.append(columns)
+        for record in self._iter_spooled():
+            sheet.append([record.get(column) for column in columns])
+        workbook.save(tmp_path)
+
+class ParquetWriter(SpoolingWriter):
+    """Parquet, écrit par groupes de lignes (row groups) de taille fixe"""
+    extension = '.parquet'
+    row_group_size = 1000
+
+    def _schema(self):
+        import pyarrow as pa
+
+        types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64()}
+        return pa.schema([(name, types.get(kind, pa.string())) for name, kind in self.columns.items()])
+
+    def _convert(self, tmp_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self._schema()
+        # Les champs de type mixte sont écrits en texte
+        text_columns = {field.name for field in schema if field.type == pa.string()}
+
+        def to_batch(rows):
+            return pa.RecordBatch.from_pylist([
+                {name: (str(row[name]) if name in text_columns and row.get(name) is not None else row.get(name))
+                 for name in schema.names}
+                for row in rows
+            ], schema=schema)
+
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            rows = []
+            for record in self._iter_spooled():
+                rows.append(record)
+                if len(rows) >= self.row_group_size:
+                    writer.write_batch(to_batch(rows))
+                    rows = []
+            if rows:
+                writer.write_batch(to_batch(rows))
+
+class ColumnarWriter(ParquetWriter):
+    """Parquet typé : champs normalisés par lot (normalization.py), texte OCR stocké à part
+
+    Montants en décimaux, dates en dates, types de document et banques en dictionnaires
+    (catégories à la lecture pandas). La colonne texte_brut est remplacée par texte_ref ; les
+    textes distincts sont écrits dans un fichier compagnon (text_store_path), finalisé avant le
+    fichier principal : si celui-ci existe, les textes aussi.
+    """
+    extension = '.typed.parquet'
+    # Montants : 12 chiffres avant la virgule, 2 après
+    amount_type = (14, 2)
+    compression = 'zstd'
+    # Groupes plus grands que Parquet brut : dictionnaires et statistiques par colonne mieux amortis
+    row_group_size = 10000
+
+    def output_paths(self):
+        return [text_store_path(self.filepath), self.filepath]
+
+    def _schema(self):
+        import pyarrow as pa
+        from normalization import AMOUNT_FIELDS, CATEGORY_FIELDS, DATE_FIELDS, TEXT_FIELD, TEXT_REF_FIELD
+
+        types = {bool: pa.bool_(), int: pa.int64(), float: pa.float64()}
+        fields = []
+        for name, kind in self.columns.items():
+            if name == TEXT_FIELD:
+                fields.append((TEXT_REF_FIELD, pa.string()))
+            elif name in AMOUNT_FIELDS:
+                fields.append((name, pa.decimal128(*self.amount_type)))
+            elif name in DATE_FIELDS:
+                fields.append((name, pa.date32()))
+            elif name in CATEGORY_FIELDS:
+                fields.append((name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append((name, types.get(kind, pa.string())))
+        return pa.schema(fields)
+
+    @staticmethod
+    def _column(series, field_type):
+        """Colonne Arrow du type du schéma à partir d'une colonne normalisée"""
+        import pyarrow as pa
+
+        if pa.types.is_decimal(field_type):
+            # Montant hors de la précision (chiffres mal lus) : valeur manquante plutôt qu'un lot en erreur
+            series = series.where(series.abs() < 10 ** (field_type.precision - field_type.scale))
+            return pa.array(series, type=pa.float64(), from_pandas=True).cast(field_type)
+        if pa.types.is_date32(field_type):
+            return pa.array(series, from_pandas=True).cast(field_type)
+        if pa.types.is_dictionary(field_type):
+            values = series.astype(object).where(series.notna(), None)
+            return pa.array(values, type=pa.string()).dictionary_encode()
+        if pa.types.is_string(field_type):
+            # Les champs de type mixte sont écrits en texte
+            return pa.array(series.astype('string'), type=pa.string(), from_pandas=True)
+        return pa.array(series, type=field_type, from_pandas=True)
+
+    def _convert(self, tmp_path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from normalization import TEXT_FIELD, TEXT_REF_FIELD, normalize_records
+
+        schema = self._schema()
+        text_path = text_store_path(self.filepath)
+        text_tmp_path = text_path + '.tmp'
+        text_schema = pa.schema([(TEXT_REF_FIELD, pa.string()), (TEXT_FIELD, pa.string())])
+        # Références déjà écrites : un texte identique (doublon, page vide) n'est stocké qu'une fois
+        stored = set()
+
+        def write_group(writer, text_writer, rows):
+            with metrics.timer('ocr_stage_seconds', stage='output_normalize'):
+                frame, texts = normalize_records(rows)
+            arrays = [self._column(frame[field.name], field.type) if field.name in frame
+                      else pa.nulls(len(frame), field.type) for field in schema]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            if texts is not None:
+                texts = texts[~texts[TEXT_REF_FIELD].isin(stored)]
+                stored.update(texts[TEXT_REF_FIELD])
+                text_writer.write_table(pa.Table.from_pandas(texts, schema=text_schema, preserve_index=False))
+
+        try:
+            with pq.ParquetWriter(tmp_path, schema, compression=self.compression) as writer, \
+                    pq.ParquetWriter(text_tmp_path, text_schema, compression=self.compression) as text_writer:
+                rows = []
+                for record in self._iter_spooled():
+                    rows.append(record)
+                    if len(rows) >= self.row_group_size:
+                        write_group(writer, text_writer, rows)
+                        rows = []
+                if rows:
+                    write_group(writer, text_writer, rows)
+            os.replace(text_tmp_path, text_path)
+        finally:
+            if os.path.exists(text_tmp_path):
+                os.remove(text_tmp_path)
+
+def text_store_path(filepath):
+    """Fichier des textes OCR associé à une sortie typée (lot.typed.parquet -> lot.textes.parquet)"""
+    if filepath.endswith(ColumnarWriter.extension):
+        base = filepath[:-len(ColumnarWriter.extension)]
+    else:
+        base = os.path.splitext(filepath)[0]
+    return base + '.textes.parquet'
+
+# Formats d'écriture incrémentale disponibles
+WRITERS = {
+    'jsonl': JsonLinesWriter,
+    'json': JsonWriter,
+    'csv': CsvWriter,
+    'excel': XlsxWriter,
+    'parquet': ParquetWriter,
+    'columnar': ColumnarWriter
+}
+
+def _insert_by_mtime(files, file_info):
+    """Insère une fiche dans une liste triée du plus récent au plus ancien (recherche dichotomique)"""
+    low, high = 0, len(files)
+    while low < high:
+        middle = (low + high) // 2
+        if files[middle]['mtime'] > file_info['mtime']:
+            low = middle + 1
+        else:
+            high = middle
+    files.insert(low, file_info)
+
 class OutputManager:
+    # Âge maximal du manifeste avant un parcours complet de réconciliation du dossier (secondes)
+    MANIFEST_MAX_AGE = 600
     def __init__(self, output_dir='output'):
         """Initialise le gestionnaire de sortie"""
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
+        # Fichiers en cours d'écriture (écriture incrémentale)
+        self.partial_dir = os.path.join(output_dir, '.partial')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        # Manifeste des fichiers de sortie (liste /files)
+        self._manifest = {}
+        self._sorted_files = []
+        self._files_by_type = {}
+        self._manifest_mtime = None
+        self._manifest_time = 0.0
+        self._manifest_lock = threading.Lock()
         
     def save_to_csv(self, data_list, filename=None):
         """Enregistre les données extraites au format CSV"""
@@ -17,12 +347,14 @@ class OutputManager:
         
         filepath = os.path.join(self.output_dir, filename)
         
-        # Convertir en DataFrame pandas
+        # Convertir en DataFrame pandas (importé à la demande : lent à charger)
+        import pandas as pd
         df = pd.DataFrame(data_list)
         
         # Enregistrer en CSV
         df.to_csv(filepath, index=False, encoding='utf-8-sig')  # utf-8-sig pour Excel
         print(f"Données enregistrées dans {filepath}")
+        self._record_outputs([filepath])
         
         return filepath
     
@@ -34,12 +366,14 @@ class OutputManager:
         
         filepath = os.path.join(self.output_dir, filename)
         
-        # Convertir en DataFrame pandas
+        # Convertir en DataFrame pandas (importé à la demande : lent à charger)
+        import pandas as pd
         df = pd.DataFrame(data_list)
         
         # Enregistrer en Excel
         df.to_excel(filepath, index=False)
         print(f"Données enregistrées dans {filepath}")
+        self._record_outputs([filepath])
         
         return filepath
     
@@ -56,37 +390,165 @@ class OutputManager:
             json.dump(data_list, f, ensure_ascii=False, indent=4)
         
         print(f"Données enregistrées dans {filepath}")
+        self._record_outputs([filepath])
         
         return filepath
     
+    def open_writer(self, output_format, filename=None, fsync=False):
+        """Ouvre un fichier de sortie en écriture incrémentale (jsonl, json, csv, excel, parquet, columnar)
+
+        Chaque document est ajouté avec writer.write(data) dès qu'il est terminé ; writer.close()
+        (ou la sortie du bloc with) finalise le fichier de façon atomique.
+        """
+        if output_format not in WRITERS:
+            raise ValueError(f"Format de sortie non pris en charge: {output_format}")
+        writer_class = WRITERS[output_format]
+
+        if not filename:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            filename = f'extracted_data_{timestamp}{writer_class.extension}'
+
+        filepath = os.path.join(self.output_dir, filename)
+        writer = writer_class(filepath, self.partial_dir, fsync=fsync)
+        writer.on_close = self._record_outputs
+        return writer
+
+    def load_columnar(self, filename, with_text=False):
+        """Charge une sortie typée (columnar) en DataFrame, avec le texte OCR joint si with_text
+
+        Les colonnes sont lues en types Arrow (décimaux, dates et dictionnaires sans conversion
+        en objets Python) ; le fichier des textes n'est lu que s'il est demandé.
+        """
+        import pandas as pd
+        from normalization import TEXT_REF_FIELD
+
+        filepath = os.path.join(self.output_dir, filename)
+        frame = pd.read_parquet(filepath, dtype_backend='pyarrow')
+        if with_text:
+            texts = pd.read_parquet(text_store_path(filepath), dtype_backend='pyarrow')
+            frame = frame.merge(texts, on=TEXT_REF_FIELD, how='left')
+        return frame
+
+    def _record_outputs(self, paths):
+        """Met à jour le manifeste pour des fichiers que cette instance vient d'écrire ou de supprimer
+
+        Seuls ces fichiers sont relus (stat), sans parcourir le dossier ; la date du dossier est
+        ensuite notée pour que ces changements connus ne déclenchent pas de parcours complet.
+        """
+        with self._manifest_lock:
+            if self._manifest_mtime is None:
+                # Manifeste pas encore construit : le premier parcours trouvera ces fichiers
+                return
+            for path in paths:
+                filename = os.path.basename(path)
+                previous = self._manifest.pop(filename, None)
+                if previous is not None:
+                    self._sorted_files.remove(previous)
+                    self._files_by_type[previous['type']].remove(previous)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                file_info = self._file_info(filename, path, stat)
+                self._manifest[filename] = file_info
+                _insert_by_mtime(self._sorted_files, file_info)
+                _insert_by_mtime(self._files_by_type.setdefault(file_info['type'], []), file_info)
+            try:
+                self._manifest_mtime = os.stat(self.output_dir).st_mtime_ns
+            except FileNotFoundError:
+                self._manifest_mtime = None
+
+    def _file_info(self, filename, path, stat):
+        """Fiche d'un fichier de sortie dans le manifeste"""
+        return {
+            'filename': filename,
+            'path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+            'type': self._file_type(filename)
+        }
+
+    def _refresh_manifest(self):
+        """Met à jour le manifeste des fichiers de sortie si le dossier a changé hors de cette instance
+
+        Les fichiers écrits par cette instance sont ajoutés un par un (_record_outputs). Les autres
+        changements (autres processus, suppressions manuelles) modifient la date du dossier et
+        déclenchent un parcours complet, de même qu'une réconciliation toutes les MANIFEST_MAX_AGE
+        secondes.
+        """
+        try:
+            dir_mtime = os.stat(self.output_dir).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest = {}
+            self._sorted_files = []
+            self._files_by_type = {}
+            return
+
+        now = time.monotonic()
+        if dir_mtime == self._manifest_mtime and now - self._manifest_time < self.MANIFEST_MAX_AGE:
+            return
+
+        manifest = {}
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                previous = self._manifest.get(entry.name)
+                # Fichier inchangé : on réutilise sa fiche
+                if previous and previous['mtime'] == stat.st_mtime and previous['size'] == stat.st_size:
+                    manifest[entry.name] = previous
+                    continue
+                manifest[entry.name] = self._file_info(entry.name, entry.path, stat)
+
+        self._manifest = manifest
+        # Trier par date de modification numérique (le plus récent d'abord)
+        self._sorted_files = sorted(manifest.values(), key=lambda x: x['mtime'], reverse=True)
+        self._files_by_type = {}
+        for file_info in self._sorted_files:
+            self._files_by_type.setdefault(file_info['type'], []).append(file_info)
+        self._manifest_mtime = dir_mtime
+        self._manifest_time = now
+
+    @staticmethod
+    def _file_type(filename):
+        """Détermine le type de fichier d'après son extension"""
+        if filename.endswith('.csv'):
+            return 'csv'
+        elif filename.endswith('.xlsx'):
+            return 'excel'
+        elif filename.endswith('.json'):
+            return 'json'
+        elif filename.endswith('.jsonl'):
+            return 'jsonl'
+        elif filename.endswith('.parquet'):
+            return 'parquet'
+        return 'unknown'
+
+    def list_outputs(self, page=1, per_page=50, file_type=None):
+        """Renvoie une page de fichiers de sortie (les plus récents d'abord), éventuellement filtrés par type"""
+        per_page = max(1, per_page)
+        with self._manifest_lock:
+            self._refresh_manifest()
+            files = self._files_by_type.get(file_type, []) if file_type else self._sorted_files
+            # Page copiée sous le verrou : les listes sont mises à jour en place par _record_outputs
+            total = len(files)
+            pages = max(1, -(-total // per_page))
+            page = min(max(1, page), pages)
+            start = (page - 1) * per_page
+            page_files = files[start:start + per_page]
+
+        return {
+            'files': page_files,
+            'total': total,
+            'page': page,
+            'pages': pages,
+            'per_page': per_page
+        }
+
     def get_all_outputs(self):
         """Récupère tous les fichiers de sortie disponibles"""
-        files = []
-        
-        if os.path.exists(self.output_dir):
-            for filename in os.listdir(self.output_dir):
-                filepath = os.path.join(self.output_dir, filename)
-                if os.path.isfile(filepath):
-                    file_info = {
-                        'filename': filename,
-                        'path': filepath,
-                        'size': os.path.getsize(filepath),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    
-                    # Déterminer le type de fichier
-                    if filename.endswith('.csv'):
-                        file_info['type'] = 'csv'
-                    elif filename.endswith('.xlsx'):
-                        file_info['type'] = 'excel'
-                    elif filename.endswith('.json'):
-                        file_info['type'] = 'json'
-                    else:
-                        file_info['type'] = 'unknown'
-                        
-                    files.append(file_info)
-        
-        # Trier par date de modification (le plus récent d'abord)
-        files.sort(key=lambda x: x['modified'], reverse=True)
-        
-        return files
\ No newline at end of file
+        with self._manifest_lock:
+            self._refresh_manifest()
+            return list(self._sorted_files)
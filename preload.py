@@ -0,0 +1,47 @@
+"""Préchargement du serveur de processus (forkserver) du traitement par lot
+
+Importé une seule fois dans le processus parent dont les processus de travail sont forkés
+(BatchProcessor(preload=True)) : OpenCV, NumPy, PIL et le backend OCR y sont chargés, et
+Tesseract y lit ses données de langue en reconnaissant une image blanche. Chaque processus de
+travail hérite de cet état par copie à l'écriture au lieu de le reconstruire.
+
+Le moteur est configuré par les variables d'environnement OCR_PRELOAD_LANG, OCR_PRELOAD_BACKEND
+et OCR_PRELOAD_PROFILE, définies par BatchProcessor avant le démarrage du serveur.
+"""
+import os
+import time
+
+# Lu au chargement de libtesseract : doit être fixé avant que les processus de travail en héritent
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+_start = time.perf_counter()
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from ocr_engine import OCREngine
+
+def warm_up(lang, backend, profile):
+    """Initialise les structures paresseuses d'OpenCV et charge Tesseract dans le thread principal
+
+    Le thread principal du serveur est celui des processus forkés : l'instance Tesseract
+    (tesserocr, une par thread) est donc réutilisée telle quelle par chaque processus de travail.
+    """
+    engine = OCREngine(lang, backend=backend, profile=profile, page_workers=1, region_workers=1)
+    sample = np.full((64, 64, 3), 255, dtype=np.uint8)
+    Image.fromarray(sample).convert('L')
+    cv2.imdecode(cv2.imencode('.png', sample)[1], cv2.IMREAD_GRAYSCALE)
+    engine.preprocess_image(sample)
+    engine.warm_up()
+
+try:
+    warm_up(os.environ.get('OCR_PRELOAD_LANG', 'fra+eng'), os.environ.get('OCR_PRELOAD_BACKEND', 'auto'),
+            os.environ.get('OCR_PRELOAD_PROFILE', 'balanced'))
+    warmed = True
+except Exception:
+    # Tesseract indisponible : les processus de travail le signaleront document par document
+    warmed = False
+
+# Durée du préchargement, payée une seule fois quel que soit le nombre de processus de travail
+PRELOAD_SECONDS = time.perf_counter() - _start
@@ -0,0 +1,260 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Profils de prétraitement : du plus rapide au plus robuste
+PROFILES = {
+    # Scans propres, rendus PDF : pas de CLAHE, débruitage seulement si l'image est très bruitée
+    'fast': {
+        'target_text_height': 24,
+        'min_scale': 0.35,
+        'max_scale': 1.5,
+        'noise_skip_below': 4.0,
+        'noise_full_above': 12.0,
+        'light_denoise_h': 5,
+        'light_denoise_search_window': 7,
+        'denoise_h': 7,
+        'denoise_template_window': 7,
+        'denoise_search_window': 11,
+        'clahe': False,
+        'clahe_clip_limit': 2.0,
+        'clahe_tile_grid': 8,
+        'threshold_block_size': 15,
+        'threshold_c': 2
+    },
+    # Compromis par défaut : débruitage adapté au niveau de bruit estimé
+    'balanced': {
+        'target_text_height': 28,
+        'min_scale': 0.35,
+        'max_scale': 2.0,
+        'noise_skip_below': 2.5,
+        'noise_full_above': 8.0,
+        'light_denoise_h': 5,
+        'light_denoise_search_window': 11,
+        'denoise_h': 10,
+        'denoise_template_window': 7,
+        'denoise_search_window': 21,
+        'clahe': True,
+        'clahe_clip_limit': 2.0,
+        'clahe_tile_grid': 8,
+        'threshold_block_size': 11,
+        'threshold_c': 2
+    },
+    # Photos difficiles (tickets thermiques froissés) : débruitage complet systématique
+    'quality': {
+        'target_text_height': 32,
+        'min_scale': 0.5,
+        'max_scale': 3.0,
+        'noise_skip_below': 0.0,
+        'noise_full_above': 0.0,
+        'light_denoise_h': 5,
+        'light_denoise_search_window': 11,
+        'denoise_h': 10,
+        'denoise_template_window': 7,
+        'denoise_search_window': 21,
+        'clahe': True,
+        'clahe_clip_limit': 2.0,
+        'clahe_tile_grid': 8,
+        'threshold_block_size': 11,
+        'threshold_c': 2
+    }
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# Mémoire de travail du pipeline par pixel traité (octets) : images intermédiaires 8 bits
+# (mise à l'échelle, débruitage, CLAHE, seuillage) et tampons internes de fastNlMeansDenoising
+PIPELINE_BYTES_PER_PIXEL = 8
+
+# Lignes traitées à la fois par l'estimateur de bruit (bornes la mémoire des tampons float32)
+NOISE_BLOCK_ROWS = 512
+
+# Recouvrement entre bandes du traitement par bandes (pixels), supérieur aux fenêtres des filtres
+STRIP_OVERLAP = 32
+
+# Noyau de l'estimateur de bruit d'Immerkær (différence de deux laplaciens)
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+def get_profile_params(profile=DEFAULT_PROFILE, overrides=None):
+    """Renvoie les paramètres d'un profil, éventuellement surchargés"""
+    if profile not in PROFILES:
+        raise ValueError(f"Profil de prétraitement non pris en charge: {profile}")
+    params = dict(PROFILES[profile])
+    if overrides:
+        params.update(overrides)
+    return params
+
+def estimate_noise(gray, block_rows=NOISE_BLOCK_ROWS):
+    """Estime l'écart-type du bruit gaussien (méthode d'Immerkær, une seule convolution)
+
+    La convolution est faite par blocs de lignes : le résultat est identique à un calcul sur
+    toute l'image, sans tampon float32 de la taille de l'image.
+    """
+    height, width = gray.shape[:2]
+    if height < 3 or width < 3:
+        return 0.0
+    sigma = 0.0
+    for top in range(1, height - 1, block_rows):
+        bottom = min(top + block_rows, height - 1)
+        # Une ligne de contexte de part et d'autre du bloc
+        block = gray[top - 1:bottom + 1].astype(np.float32)
+        response = cv2.filter2D(block, -1, _NOISE_KERNEL, borderType=cv2.BORDER_ISOLATED)
+        sigma += float(np.abs(response[1:-1, 1:-1]).sum())
+    return float(sigma * np.sqrt(np.pi / 2) / (6 * (width - 2) * (height - 2)))
+
+def pipeline_bytes(width, height):
+    """Mémoire de travail estimée du pipeline pour une image de cette taille"""
+    return width * height * PIPELINE_BYTES_PER_PIXEL
+
+class _BufferPool(threading.local):
+    """Tampons réutilisés d'un document à l'autre, propres à chaque thread"""
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape):
+        """Renvoie une image 8 bits de la forme demandée, taillée dans un tampon préalloué"""
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=np.uint8)
+        return buffer[:size].reshape(shape)
+
+def estimate_text_height(gray, max_side=1000):
+    """Estime la hauteur médiane des caractères (en pixels) à partir des composantes connexes"""
+    height, width = gray.shape[:2]
+    # Estimation sur une version réduite : seul l'ordre de grandeur compte
+    ratio = min(1.0, max_side / max(height, width))
+    small = cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA) if ratio < 1.0 else gray
+
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None
+
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Garder les composantes qui ressemblent à des caractères (ni points, ni traits, ni logos)
+    mask = (heights >= 3) & (heights <= small.shape[0] / 10) & (widths <= heights * 4)
+    if mask.sum() < 10:
+        return None
+
+    return float(np.median(heights[mask])) / ratio
+
+class PreprocessingPipeline:
+    def __init__(self, params, memory_budget=None):
+        """Initialise le pipeline avec les paramètres d'un profil (voir get_profile_params)
+
+        memory_budget (octets) : au-delà, débruitage, CLAHE et seuillage sont faits par bandes.
+        """
+        self.params = params
+        self.memory_budget = memory_budget
+        self._buffers = _BufferPool()
+
+    def run(self, img):
+        """Prétraite une image et renvoie (image binaire, rapport avec le temps de chaque étape)"""
+        params = self.params
+        timings = {}
+        report = {'timings': timings}
+
+        start = time.perf_counter()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        timings['grayscale'] = time.perf_counter() - start
+
+        # Mise à l'échelle vers la hauteur de texte cible (avant débruitage : moins de pixels à traiter)
+        start = time.perf_counter()
+        scale = 1.0
+        text_height = None
+        if params.get('target_text_height'):
+            text_height = estimate_text_height(gray)
+            if text_height:
+                scale = params['target_text_height'] / text_height
+                scale = min(max(scale, params['min_scale']), params['max_scale'])
+                # Inutile de rééchantillonner pour un écart de moins de 15 %
+                if abs(scale - 1.0) < 0.15:
+                    scale = 1.0
+        if scale != 1.0:
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+            size = (round(gray.shape[1] * scale), round(gray.shape[0] * scale))
+            scaled = self._buffers.get('scaled', (size[1], size[0]))
+            gray = cv2.resize(gray, size, dst=scaled, interpolation=interpolation)
+        timings['rescale'] = time.perf_counter() - start
+        report['text_height'] = text_height
+        report['scale'] = scale
+
+        start = time.perf_counter()
+        noise = estimate_noise(gray)
+        timings['noise_estimation'] = time.perf_counter() - start
+        report['noise_sigma'] = noise
+
+        # Débruitage adapté au bruit estimé : aucun, léger ou complet
+        if noise < params['noise_skip_below']:
+            report['denoise'] = 'skip'
+        elif noise < params['noise_full_above']:
+            report['denoise'] = 'light'
+        else:
+            report['denoise'] = 'full'
+
+        height, width = gray.shape
+        binary = np.empty((height, width), dtype=np.uint8)
+        timings['denoise'] = timings['clahe'] = timings['threshold'] = 0.0
+
+        # Image trop grande pour le budget mémoire : traitement par bandes horizontales
+        rows = height
+        if self.memory_budget and pipeline_bytes(width, height) > self.memory_budget:
+            rows = max(4 * STRIP_OVERLAP, self.memory_budget // (width * PIPELINE_BYTES_PER_PIXEL))
+        report['strips'] = 0
+
+        if rows >= height:
+            self._enhance_strip(gray, report['denoise'], height, timings, binary)
+            report['strips'] = 1
+        else:
+            for top in range(0, height, rows):
+                bottom = min(top + rows, height)
+                # Contexte autour de la bande, retiré du résultat
+                context_top = max(0, top - STRIP_OVERLAP)
+                context_bottom = min(height, bottom + STRIP_OVERLAP)
+                strip = self._enhance_strip(gray[context_top:context_bottom], report['denoise'], height, timings)
+                binary[top:bottom] = strip[top - context_top:bottom - context_top]
+                report['strips'] += 1
+
+        timings['total'] = sum(timings.values())
+        return binary, report
+
+    def _enhance_strip(self, gray, denoise, full_height, timings, out=None):
+        """Débruitage, CLAHE et seuillage d'une bande (ou de toute l'image), dans des tampons réutilisés"""
+        params = self.params
+
+        start = time.perf_counter()
+        if denoise == 'skip':
+            denoised = gray
+        else:
+            light = denoise == 'light'
+            denoised = cv2.fastNlMeansDenoising(
+                gray, self._buffers.get('denoised', gray.shape),
+                params['light_denoise_h'] if light else params['denoise_h'],
+                params['denoise_template_window'],
+                params['light_denoise_search_window'] if light else params['denoise_search_window']
+            )
+        timings['denoise'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if params['clahe']:
+            grid = params['clahe_tile_grid']
+            # Tuiles de même hauteur que sur l'image entière
+            grid_rows = max(1, round(grid * gray.shape[0] / full_height))
+            clahe = cv2.createCLAHE(clipLimit=params['clahe_clip_limit'], tileGridSize=(grid, grid_rows))
+            enhanced = clahe.apply(denoised, self._buffers.get('enhanced', gray.shape))
+        else:
+            enhanced = denoised
+        timings['clahe'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        binary = cv2.adaptiveThreshold(
+            enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, params['threshold_block_size'], params['threshold_c'],
+            out if out is not None else self._buffers.get('binary', gray.shape)
+        )
+        timings['threshold'] += time.perf_counter() - start
+        return binary
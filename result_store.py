@@ -0,0 +1,114 @@
+import json
+import re
+import sqlite3
+import time
+import uuid
+
+# Champ portant la date principale de chaque type de document
+DATE_FIELDS = ('date', 'date_facture', 'date_fin')
+
+_NUMERIC_DATE = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})')
+
+def iso_date(value):
+    """Convertit une date JJ/MM/AAAA (ou JJ-MM-AA) en AAAA-MM-JJ pour l'indexation, sinon None"""
+    if not value:
+        return None
+    match = _NUMERIC_DATE.search(str(value))
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+class ResultStore:
+    def __init__(self, db_path):
+        """Initialise le stockage SQLite des résultats d'extraction"""
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        """Ouvre une connexion SQLite"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Crée la table des résultats et ses index si nécessaire"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    doc_id TEXT PRIMARY KEY,
+                    doc_type TEXT NOT NULL,
+                    doc_date TEXT,
+                    uploaded_at REAL NOT NULL,
+                    image_src TEXT,
+                    data TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_type ON results (doc_type, uploaded_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_date ON results (doc_date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_uploaded ON results (uploaded_at)')
+
+    def _row_values(self, data, doc_id=None):
+        """Colonnes indexées extraites des données d'un document"""
+        doc_date = next((iso_date(data.get(field)) for field in DATE_FIELDS if data.get(field)), None)
+        return (
+            doc_id or uuid.uuid4().hex,
+            data.get('type_document', ''),
+            doc_date,
+            time.time(),
+            data.get('image_src'),
+            json.dumps(data, ensure_ascii=False)
+        )
+
+    def save(self, data, doc_id=None):
+        """Enregistre les données d'un document et renvoie son identifiant"""
+        row = self._row_values(data, doc_id)
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)', row)
+        return row[0]
+
+    def get(self, doc_id):
+        """Renvoie les données d'un document (ou None s'il n'existe pas)"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM results WHERE doc_id = ?', (doc_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def _where(self, doc_type=None, date_from=None, date_to=None):
+        """Clause WHERE des filtres de recherche"""
+        clauses = []
+        params = []
+        if doc_type:
+            clauses.append('doc_type = ?')
+            params.append(doc_type)
+        if date_from:
+            clauses.append('doc_date >= ?')
+            params.append(date_from)
+        if date_to:
+            clauses.append('doc_date <= ?')
+            params.append(date_to)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, doc_type=None, date_from=None, date_to=None, limit=50, offset=0):
+        """Recherche des documents (dates au format AAAA-MM-JJ), du plus récent au plus ancien"""
+        where, params = self._where(doc_type, date_from, date_to)
+        with self._connect() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM results{where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT doc_id, doc_type, doc_date, uploaded_at, data FROM results{where} '
+                'ORDER BY uploaded_at DESC LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+
+        results = [{
+            'doc_id': row['doc_id'],
+            'doc_type': row['doc_type'],
+            'doc_date': row['doc_date'],
+            'uploaded_at': row['uploaded_at'],
+            'data': json.loads(row['data'])
+        } for row in rows]
+        return {'total': total, 'results': results}
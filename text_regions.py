@@ -0,0 +1,116 @@
+import cv2
+
+from preprocessing import estimate_text_height
+
+# Modes de segmentation Tesseract utilisés selon la forme de la région
+PSM_SINGLE_WORD = 8
+PSM_SINGLE_LINE = 7
+PSM_BLOCK = 6
+
+# Écart horizontal (fraction de la largeur de page) au-delà duquel deux blocs sont des colonnes distinctes
+COLUMN_GAP_RATIO = 0.25
+
+# Écart vertical (en hauteurs de texte) au-delà duquel deux lignes appartiennent à des blocs distincts
+BLOCK_GAP_LINES = 1.2
+
+# Composantes ignorées : plus hautes que ce nombre de hauteurs de texte (logos, photos, cadres)
+LOGO_HEIGHT_RATIO = 4.0
+
+# Marge blanche ajoutée autour de chaque région avant l'OCR (pixels)
+REGION_PADDING = 10
+
+# Au-delà de cette part de la page couverte par les régions, l'OCR de la page entière est aussi rapide
+MAX_REGION_COVERAGE = 0.85
+
+def _ink_mask(binary, text_height):
+    """Pixels d'encre (texte en blanc sur noir), sans les logos, filets et points isolés"""
+    ink = cv2.bitwise_not(binary)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    heights = stats[:, cv2.CC_STAT_HEIGHT]
+    widths = stats[:, cv2.CC_STAT_WIDTH]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    discard = (
+        (heights > LOGO_HEIGHT_RATIO * text_height)
+        # Filets horizontaux des tableaux : très larges et très fins
+        | ((widths > 8 * text_height) & (heights < text_height / 4))
+        | (areas < max(2, text_height * text_height / 50))
+    )
+    discard[0] = False
+    if discard[1:].any():
+        ink[discard[labels]] = 0
+    return ink
+
+def choose_psm(width, height, text_height):
+    """Mode de segmentation adapté à une région : mot isolé, ligne unique ou bloc de texte"""
+    if height < 1.8 * text_height:
+        return PSM_SINGLE_WORD if width < 4 * height else PSM_SINGLE_LINE
+    return PSM_BLOCK
+
+def detect_text_regions(binary, text_height=None):
+    """Détecte les blocs de texte d'une image binarisée (texte noir sur fond blanc)
+
+    Renvoie une liste de régions {'x', 'y', 'w', 'h', 'psm'} : les lignes proches sont regroupées
+    en blocs par dilatation, les marges, le fond et les logos sont exclus.
+    """
+    height, width = binary.shape[:2]
+    text_height = text_height or estimate_text_height(binary) or 20
+
+    ink = _ink_mask(binary, text_height)
+
+    # Dilatation : relie les mots d'une ligne (jusqu'à un écart de colonne) et les lignes d'un bloc
+    kernel_width = max(3, int(width * COLUMN_GAP_RATIO))
+    kernel_height = max(3, int(text_height * BLOCK_GAP_LINES))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, kernel_height))
+    merged = cv2.dilate(ink, kernel)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Boîte exacte de l'encre dans la zone dilatée
+        ix, iy, iw, ih = cv2.boundingRect(ink[y:y + h, x:x + w])
+        if iw == 0 or ih < 3:
+            continue
+        x, y = x + ix, y + iy
+        regions.append({'x': x, 'y': y, 'w': iw, 'h': ih, 'psm': choose_psm(iw, ih, text_height)})
+    return regions
+
+def region_coverage(regions, shape):
+    """Part de la page couverte par les régions"""
+    return sum(region['w'] * region['h'] for region in regions) / float(shape[0] * shape[1])
+
+def crop_region(binary, region):
+    """Découpe une région avec une marge blanche (Tesseract reconnaît mal le texte collé au bord)"""
+    crop = binary[region['y']:region['y'] + region['h'], region['x']:region['x'] + region['w']]
+    return cv2.copyMakeBorder(crop, REGION_PADDING, REGION_PADDING, REGION_PADDING, REGION_PADDING,
+                              cv2.BORDER_CONSTANT, value=255)
+
+def reading_order(regions):
+    """Range les régions par rangées (de haut en bas), puis de gauche à droite dans chaque rangée"""
+    rows = []
+    for region in sorted(regions, key=lambda r: r['y']):
+        center = region['y'] + region['h'] / 2
+        if rows and center < rows[-1]['bottom']:
+            rows[-1]['regions'].append(region)
+            rows[-1]['bottom'] = max(rows[-1]['bottom'], region['y'] + region['h'])
+        else:
+            rows.append({'bottom': region['y'] + region['h'], 'regions': [region]})
+    return [sorted(row['regions'], key=lambda r: r['x']) for row in rows]
+
+def assemble_text(rows):
+    """Reconstitue le texte à partir des rangées de (région, texte) rangées dans l'ordre de lecture
+
+    Les blocs côte à côte qui ont le même nombre de lignes (colonnes d'un tableau : libellé et
+    montant) sont recollés ligne à ligne, pour que DataExtractor retrouve « TOTAL: 23,40 ».
+    """
+    blocks = []
+    for row in rows:
+        texts = [text.strip() for _, text in row if text.strip()]
+        if not texts:
+            continue
+        lines = [[line for line in text.split('\n') if line.strip()] for text in texts]
+        if len(texts) > 1 and len({len(block) for block in lines}) == 1:
+            blocks.append('\n'.join(' '.join(parts) for parts in zip(*lines)))
+        else:
+            blocks.append('\n'.join(texts))
+    return '\n'.join(blocks) + '\n' if blocks else ''